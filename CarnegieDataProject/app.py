@@ -1,14 +1,21 @@
-import os
+from contextlib import contextmanager
 
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 
+import frequency_api
+from cooccurrence import load_or_build_cooccurrence
+from frequency import option_id
+from option_search import OptionSearch
+from profiling import QUERY_LOG_PATH, Trace, record_cache, span, write_trace
+from query_cache import QueryCache
 
-# REQUIRES a pickle file
 
+# REQUIRES the event store built by ingest.py
 
-def create_event_frequency_list(df, lookup_range, column, specific_value, normalize=False):
+
+def create_event_frequency_list(engine, lookup_range, column, specific_value, normalize=False, cache=None):
     """
     Given a lookup_range of years, and a specific_value in a column to look for, this function
     returns a list of frequencies of that specific_value per year.
@@ -17,88 +24,29 @@ def create_event_frequency_list(df, lookup_range, column, specific_value, normal
 
     Setting the normalize parameter to True will instead return a list of the proportions
     count(specific_value)/total number of performances per year
+
+    If a QueryCache is given, frequencies that were computed before are taken from it
     """
 
-    # converts user inputs into column names in df
-    column_key = {'Genre': 'genreLabel', 'Nationality': 'nationalities', 'Work': 'workperformed',
-                  'Composer': 'composer'}
-    column = column_key[column]
-
-    # cleaning work to make sure everything matches up
-    if column == 'genreLabel':
-        specific_value = specific_value.lower()
-    elif column in ('workperformed', 'composer'):
-        specific_value = specific_value[specific_value.index('#') + 1:specific_value.index(')')]
-
-    frequency_list = []
-
-    for year in lookup_range:
-
-        # if it has to do with works and not events (composer, nationality, etc.)
-        if column in df['event_data'][0].columns:
-
-            # create smaller dataframe with events only in that year to simplify
-            sub_df = df[df['year'] == year].copy()
-
-            # create a boolean column for whether the specific value can be found in a work performed at that event
-            has_value = []
-
-            # iterate through events in specific year
-            for index, row in sub_df.iterrows():
-                # isolate the entry in the column for the current event
-                important_column = sub_df['event_data'][index][column]
-
-                # check if the desired value is present in the column entry
-                # for nationalities, need to check if any of the desired nations are present in the column
-                if column == 'nationalities':
-                    # assume not present
-                    any_nationality_present = False
-                    # iterate through nations
-                    for nation in specific_value:
-                        # if a matching nation is found
-                        if nation in important_column.to_string():
-                            # mark that this nationality group is present for this event
-                            any_nationality_present = True
-                            # stop searching for matches in this event
-                            break
-                    # add the boolean storing whether this nationality group was present for this event
-                    has_value.append(any_nationality_present)
-                else:
-                    # add the boolean storing whether the desired value was present for this event
-                    has_value.append(f"/{specific_value}" in important_column.to_string())
-
-            if column == 'nationalities':
-                sub_df[specific_value[0]] = has_value
-            else:
-                sub_df[specific_value] = has_value
-
-            # create the frequency list
-            try:  # if the desired event has occurred in this year, add the number of times it occurred
-                if column == 'nationalities':
-                    frequency_list.append(sub_df.value_counts(specific_value[0], normalize=normalize).to_dict()[True])
-                else:
-                    frequency_list.append(sub_df.value_counts(specific_value, normalize=normalize).to_dict()[True])
-            except KeyError:  # if the desired event has not occurred in this year
-                frequency_list.append(0)
-
-        # if it has to do with events (genre, work, etc)
-        else:
-            # get a dictionary of the frequencies
-            attribute_counts = df[df['year'] == year].value_counts(column, normalize=normalize)
+    def compute_frequencies():
+        # compute the frequencies for every year at once, with 0 for years outside the data
+        record_cache(False)
+        frequencies = engine.frequencies(column, specific_value, normalize)
+        return frequencies.reindex(lookup_range, fill_value=0).to_numpy()
 
-            # getting the count for the specific value
-            try:
-                if column == 'nationalities':
-                    frequency_list.append(attribute_counts[specific_value[0]])
-                else:
-                    frequency_list.append(attribute_counts[specific_value])
-            except KeyError:
-                frequency_list.append(0)
+    with span('query'):
+        if cache is None:
+            return compute_frequencies().tolist()
 
-    return frequency_list
+        # a group of nationalities is the same no matter what order the nations were chosen in
+        value_key = tuple(sorted(specific_value)) if isinstance(specific_value, list) else specific_value
+        key = (column, value_key, normalize, tuple(lookup_range))
+        # a hit, unless compute_frequencies runs
+        record_cache(True)
+        return cache.get_or_compute(key, compute_frequencies).tolist()
 
 
-def make_bar_chart(df, column, specific_value, normalize=False, lookup_range=(0, 0)):
+def make_bar_chart(engine, column, specific_value, normalize=False, lookup_range=(0, 0), cache=None):
     """
     make a bar chart of the frequency of "specific_value", which is a value in "column" over "lookup_range" years
 
@@ -114,42 +62,211 @@ def make_bar_chart(df, column, specific_value, normalize=False, lookup_range=(0,
             years.append(year)
 
     else:
-        years = list(set(df['year'].to_list()))
+        years = list(set(engine.store.events['year'].to_list()))
 
     # list of frequencies
-    frequency = create_event_frequency_list(df, years, column, specific_value, normalize)
+    frequency = create_event_frequency_list(engine, years, column, specific_value, normalize, cache)
 
-    bar_data = {'Years': years,
-                'frequency': frequency}
-    df_bar = pd.DataFrame(bar_data)
+    with span('aggregate'):
+        bar_data = {'Years': years,
+                    'frequency': frequency}
+        df_bar = pd.DataFrame(bar_data)
 
     # The barchart with Plotly Express specifying the source df, the columns to use as x and y axes,
     # labels to use for those axes, and an overall title for the figure
 
-    fig = px.bar(df_bar,
-                 x='Years', y='frequency',
-                 labels={'Years': 'Years', 'frequency': f'Performances of {column.title()}: {specific_value}'},
-                 title=f'Performances of {column.title()}: {specific_value} by Year',
-                 )
-    # Set width and height in pixels
-    fig.update_layout(width=600, height=400)
+    with span('render'):
+        fig = px.bar(df_bar,
+                     x='Years', y='frequency',
+                     labels={'Years': 'Years', 'frequency': f'Performances of {column.title()}: {specific_value}'},
+                     title=f'Performances of {column.title()}: {specific_value} by Year',
+                     )
+        # Set width and height in pixels
+        fig.update_layout(width=600, height=400)
 
-    # If in streamlit, use below code:
-    st.plotly_chart(fig, theme=None, use_container_width=True)
-    # If in notebook, use fig.show() instead
+        # If in streamlit, use below code:
+        st.plotly_chart(fig, theme=None, use_container_width=True)
+        # If in notebook, use fig.show() instead
+
+
+def make_comparison_chart(engine, column, specific_values, normalize=False, style='Grouped Bars', lookup_range=(0, 0),
+                          cache=None):
+    """
+    make a chart comparing the frequencies of each of "specific_values", which are values in "column", over
+    "lookup_range" years, as grouped bars, stacked bars or lines (style)
+
+    Note: if normalize=True it will instead compare proportions
+    """
+    # years is the x-axis, every year with an event unless a subset of the years is given
+    if lookup_range != (0, 0):
+        years = list(range(lookup_range[0], lookup_range[1] + 1))
+    else:
+        years = sorted(set(engine.store.events['year'].to_list()))
+
+    def compute_comparison():
+        # compute the frequencies of every value at once, with 0 for years outside the data
+        record_cache(False)
+        return engine.comparison(column, specific_values, normalize).reindex(years, fill_value=0)
+
+    with span('query'):
+        if cache is None:
+            comparison = compute_comparison()
+        else:
+            # the values are compared in the order they were chosen, so their order is part of the key
+            value_key = tuple(tuple(value) if isinstance(value, list) else value for value in specific_values)
+            # a hit, unless compute_comparison runs
+            record_cache(True)
+            comparison = cache.get_or_compute((column, value_key, normalize, tuple(years)), compute_comparison)
+
+    # one row per (year, value), the long format Plotly Express expects for several series
+    with span('aggregate'):
+        df_chart = comparison.rename_axis('Years').reset_index().melt(id_vars='Years', var_name=column.title(),
+                                                                     value_name='frequency')
+    labels = {'Years': 'Years', 'frequency': f'Performances of {column.title()}'}
+    title = f'Performances of {column.title()} by Year'
+    with span('render'):
+        if style == 'Lines':
+            fig = px.line(df_chart, x='Years', y='frequency', color=column.title(), labels=labels, title=title)
+        else:
+            fig = px.bar(df_chart, x='Years', y='frequency', color=column.title(), labels=labels, title=title,
+                         barmode='group' if style == 'Grouped Bars' else 'stack')
+        # Set width and height in pixels
+        fig.update_layout(width=600, height=400)
+        st.plotly_chart(fig, theme=None, use_container_width=True)
 
 
-def bar_chart(pickle_data, column, value, normalize=False):
+@st.cache_resource
+def load_engine(store_folder):
+    """Loads the event store, its index and its year cubes once per process, to be shared by every session"""
+    # this only runs when the engine isn't loaded yet, so the load span is a miss
+    record_cache(False)
+    return frequency_api.load_engine(store_folder)
+
+
+@st.cache_resource
+def load_query_cache():
+    """Creates the cache of computed frequencies once per process, to be shared by every session"""
+    return QueryCache()
+
+
+def shared_engine(store_folder):
+    """Returns the shared engine, timed as the load span of the chart"""
+    with span('load'):
+        # a hit, unless load_engine runs
+        record_cache(True)
+        return load_engine(store_folder)
+
+
+@contextmanager
+def chart_trace(query):
+    """
+    Traces the chart drawn inside it, appending the trace to the query log and showing it in the debug panel if the
+    panel is open
+    """
+    debug = st.session_state.get('debugPanel', False)
+    # memory is only traced for the debug panel, since tracing slows every allocation down
+    with Trace(query, trace_memory=debug) as trace:
+        yield trace
+    try:
+        write_trace(trace, QUERY_LOG_PATH)
+    except OSError:
+        # the chart is still drawn if the log can't be written
+        pass
+    if debug:
+        show_profile(trace)
+
+
+def show_profile(trace):
+    """Shows the spans of a chart and the query cache's hits and misses in the debug panel"""
+    query_cache = load_query_cache()
+    with st.expander(f'Profile: {trace.total_duration() * 1000:.1f} ms', expanded=True):
+        st.dataframe(pd.DataFrame([step.to_dict() for step in trace.spans]), hide_index=True)
+        st.caption(f'Query cache: {query_cache.hits} hits, {query_cache.misses} misses, '
+                   f'{query_cache.bytes / 1024 ** 2:.1f} MB')
+
+
+def bar_chart(store_folder, column, value, normalize=False):
     """Helper function that passes user input from Streamlit into the bar chart creator function"""
-    # convert data from stored .pkl format to pandas dataframe
-    inner_df = pd.read_pickle(pickle_data)
-    # make the bar chart
-    make_bar_chart(inner_df, column, value, normalize)
+    # make the bar chart with the shared engine and cache
+    with chart_trace({'attribute': column, 'values': [value], 'normalize': normalize, 'compare': False}):
+        make_bar_chart(shared_engine(store_folder), column, value, normalize, cache=load_query_cache())
+
+
+def comparison_chart(store_folder, column, values, normalize=False, style='Grouped Bars'):
+    """Helper function that passes several user-chosen values from Streamlit into the comparison chart function"""
+    # make the comparison chart with the shared engine and cache
+    with chart_trace({'attribute': column, 'values': values, 'normalize': normalize, 'compare': True}):
+        make_comparison_chart(shared_engine(store_folder), column, values, normalize, style,
+                              cache=load_query_cache())
+
+
+def make_together_chart(cooccurrence, options, column, specific_value, decade=None, top=10):
+    """
+    make a bar chart of the "top" works or composers (column) most often performed at the same events as
+    "specific_value", across every year or in the decade starting in "decade"
+    """
+    column = column.lower()
+    partners = cooccurrence.top_partners(column, option_id(specific_value), top, decade)
+    if partners.empty:
+        st.write(f'No other {column} was performed at the same events{f" in the {decade}s" if decade else ""}.')
+        return
+    partners[column] = options.labels_of(column, partners[column])
+    period = f'the {decade}s' if decade else 'every year'
+    # most often performed first, at the top of the chart
+    fig = px.bar(partners, x='events', y=column, orientation='h', hover_data={'share': ':.1%'},
+                 labels={'events': 'Events performed together', column: column.title()},
+                 title=f'Most often programmed with {specific_value} ({period})')
+    fig.update_layout(width=600, height=400, yaxis={'autorange': 'reversed'})
+    st.plotly_chart(fig, theme=None, use_container_width=True)
+
+
+@st.cache_resource
+def load_cooccurrence(store_folder):
+    """Loads the co-occurrence matrices of works and composers once per process, to be shared by every session"""
+    return load_or_build_cooccurrence(load_engine(store_folder).store)
+
+
+def together_chart(store_folder, column, value):
+    """Helper function that passes the user's chosen work or composer and decade into the co-occurrence chart"""
+    cooccurrence = load_cooccurrence(store_folder)
+    period = st.selectbox('Count the events of:', ['All years'] + [f'{decade}s' for decade in cooccurrence.decades],
+                          key='togetherDecade')
+    decade = None if period == 'All years' else int(period[:-1])
+    make_together_chart(cooccurrence, load_option_search('Data/options.npz'), column, value, decade)
+
+
+@st.cache_data
+def read_options(csv_path, column):
+    """Returns the options listed in a column of a previously created csv, reading the csv once per process"""
+    return pd.read_csv(csv_path)[column].tolist()
+
+
+@st.cache_resource
+def load_option_search(options_path):
+    """Loads the work and composer options and their search index once per process, to be shared by every session"""
+    return OptionSearch.load(options_path)
+
+
+def picker_options(kind, query, selected):
+    """
+    Returns the most performed work or composer options matching the text typed by the user, keeping the option (or
+    list of options) already selected so that typing a new search doesn't clear it
+    """
+    options = load_option_search('Data/options.npz').search(kind, query)
+    if selected is None:
+        selected = []
+    elif isinstance(selected, str):
+        selected = [selected]
+    return [option for option in selected if option not in options] + options
 
 
 # Main Streamlit APP
 st.title("Analyzing Trends in Carnegie Hall Performance Data")
 
+# shows how long each step of drawing the chart took
+st.sidebar.checkbox('Show profiling panel', key='debugPanel',
+                    help='Times the loading, query, aggregation and rendering of each chart')
+
 # prompts user to select attribute
 option = st.selectbox(
     "What attribute would you like to graph?",
@@ -159,94 +276,115 @@ option = st.selectbox(
     key='attribute'
 )
 
+# lets the user pick several values of the attribute and graph them side by side
+compare = st.checkbox('Compare several values', key='compareMode')
+
+# the session state key holding the chosen value (or values, when comparing) of each attribute
+VALUE_KEYS = {'Genre': 'genreValue', 'Nationality': 'nationalityValue', 'Work': 'workValue',
+              'Composer': 'composerValue'}
+
 # if the user has selected an attribute
 if st.session_state.attribute:
     # if genre selected
     if st.session_state.attribute == 'Genre':
-        # ask user to choose genre from list derived from previously created csv
-        genre_options = st.selectbox(
-            'Select the genre:',
-            [genre for genre in pd.read_csv('Data/genreLabels_list.csv')['Genre']],
-            index=None,
-            placeholder="Select genre...",
-            key='genreValue'
-        )
+        # ask user to choose genre (or genres to compare) from list derived from previously created csv
+        if compare:
+            genre_options = st.multiselect(
+                'Select the genres to compare:',
+                read_options('Data/genreLabels_list.csv', 'Genre'),
+                placeholder="Select genres...",
+                key='genreValues'
+            )
+        else:
+            genre_options = st.selectbox(
+                'Select the genre:',
+                read_options('Data/genreLabels_list.csv', 'Genre'),
+                index=None,
+                placeholder="Select genre...",
+                key='genreValue'
+            )
     # if nationality selected
     elif st.session_state.attribute == 'Nationality':
         # ask user to choose nationality from list derived from previously created csv listing all nationalities
+        if compare:
+            nationality_label = 'Select the nationalities to compare:'
+        else:
+            nationality_label = ('Select the nationalities: *Composers who hold **any** of the chosen nationalities '
+                                 'will be selected.*')
         nationality_options = st.multiselect(
-            'Select the nationalities: *Composers who hold **any** of the chosen nationalities will be selected.*',
-            [nation for nation in pd.read_csv('Data/nationalities_list.csv')['Nation']],
+            nationality_label,
+            read_options('Data/nationalities_list.csv', 'Nation'),
             placeholder="Select nationalities...",
             key='nationalityValue'
         )
     # if work selected
     elif st.session_state.attribute == 'Work':
-        # create a list of all the works for the user to select from
-        work_list = []
-        # fetch the csv with the list of all works
-        works = pd.read_csv('Data/works_list.csv')
-        # iterate through all the works from the csv
-        for item, row in works.iterrows():
-            # add the work to the selection list, combining with "by {composer} (#{carnegie work id})"
-            # if they have a named composer, show the composer name
-            if len(row['composerLabel']) != 0:
-                work_list.append(
-                    f"{row['title']} by {row['composerLabel']} (#{row['work'][row['work'].index('works/') + 6:]})")
-            # if they have no named composer, show Unknown instead
-            else:
-                work_list.append(
-                    f"{row['title']} by Unknown (#{row['work'][row['work'].index('works/') + 6:]})")
-        # ask user to choose work from the created list of options
-        work_options = st.selectbox(
-            'Select the work:',
-            work_list,
-            index=None,
-            placeholder="Select work...",
-            key='workValue'
+        # search the works as the user types
+        title_search = st.text_input(
+            'Search the works:',
+            placeholder="Type part of a title or composer...",
+            key='titleSearch'
         )
+        # ask user to choose work (or works to compare) from the most performed matches
+        if compare:
+            work_options = st.multiselect(
+                'Select the works to compare:',
+                picker_options('work', title_search, st.session_state.get('workValues')),
+                placeholder="Select works...",
+                key='workValues'
+            )
+        else:
+            work_options = st.selectbox(
+                'Select the work:',
+                picker_options('work', title_search, st.session_state.get('workValue')),
+                index=None,
+                placeholder="Select work...",
+                key='workValue'
+            )
     # if composer selected
     elif st.session_state.attribute == 'Composer':
-        # create a list of all the composers for the user to select from
-        composer_list = []
-        # fetch the csv with the list of all composers
-        composers = pd.read_csv('Data/composers_list.csv')
-        # iterate through all the composers from the csv
-        for item, row in composers.iterrows():
-            # add the composer to the selection list, combining with "(#{carnegie composer id})"
-            composer_list.append(f"{row['composerLabel']} (#{row['composer'][row['composer'].index('names/') + 6:]})")
-        # ask user to choose composer from the created list of options
-        composer_options = st.selectbox(
-            'Select the composer:',
-            composer_list,
-            index=None,
-            placeholder="Select composer...",
-            key='composerValue'
+        # search the composers as the user types
+        name_search = st.text_input(
+            'Search the composers:',
+            placeholder="Type part of a name...",
+            key='nameSearch'
         )
+        # ask user to choose composer (or composers to compare) from the most performed matches
+        if compare:
+            composer_options = st.multiselect(
+                'Select the composers to compare:',
+                picker_options('composer', name_search, st.session_state.get('composerValues')),
+                placeholder="Select composers...",
+                key='composerValues'
+            )
+        else:
+            composer_options = st.selectbox(
+                'Select the composer:',
+                picker_options('composer', name_search, st.session_state.get('composerValue')),
+                index=None,
+                placeholder="Select composer...",
+                key='composerValue'
+            )
     # should be unreachable - if user selects an attribute not among genre, nationality, work, or composer:
     else:
         st.write("You seem to have entered something incorrectly in the attribute input!")
 
 
-def is_value_selected():
-    """Returns True if the user has selected an attribute value, False if not"""
-    for key, value in st.session_state.items():
-        if 'graph' not in key and value in (None, []):
-            return False
-    return True
+def find_selected_value():
+    """
+    Returns the user's selected attribute value after determining which attribute was selected, or the list of
+    selected values when comparing
+    """
+    key = VALUE_KEYS[st.session_state.attribute]
+    # the nationality picker chooses several values either way, the others switch to a multiselect when comparing
+    if compare and st.session_state.attribute != 'Nationality':
+        key += 's'
+    return st.session_state.get(key)
 
 
-def find_selected_value():
-    """Returns the user's selected attribute value after determining which attribute was selected"""
-    for key, value in st.session_state.items():
-        if 'genre' in key:
-            return value
-        elif 'nationality' in key:
-            return value
-        elif 'work' in key:
-            return value
-        elif 'composer' in key:
-            return value
+def is_value_selected():
+    """Returns True if the user has selected an attribute value, False if not"""
+    return st.session_state.attribute is not None and find_selected_value() not in (None, [])
 
 
 # if the user has selected an attribute value
@@ -259,22 +397,36 @@ if is_value_selected():
         placeholder="Select graph type...",
         key='graphType'
     )
+    # when comparing, ask the user how to draw the values side by side
+    if compare:
+        style_options = st.selectbox(
+            'Select the chart style:',
+            ('Grouped Bars', 'Stacked Bars', 'Lines'),
+            key='chartStyle'
+        )
     # if user has not yet chosen graph type
     if st.session_state.graphType is None:
         st.write('Select the graph type to see your graph!')
     # if user has chosen graph type
     else:
-        # set the file path for the .pkl file containing all event data
-        pickle = 'Data/event_data.pkl'
-        # if absolute frequency selected, create corresponding bar chart
-        if st.session_state.graphType == 'Absolute Frequency':
-            bar_chart(pickle, st.session_state.attribute, find_selected_value())
-        # if relative frequency selected, create corresponding bar chart
-        elif st.session_state.graphType == 'Relative Frequency':
-            bar_chart(pickle, st.session_state.attribute, find_selected_value(), normalize=True)
+        # set the path for the folder containing the event store
+        store_folder = 'Data/event_store'
+        normalize = st.session_state.graphType == 'Relative Frequency'
+        # if comparing, create the comparison chart, with each chosen nationality as its own value
+        if compare:
+            values = find_selected_value()
+            if st.session_state.attribute == 'Nationality':
+                values = [[nation] for nation in values]
+            comparison_chart(store_folder, st.session_state.attribute, values, normalize, st.session_state.chartStyle)
+        # otherwise create the bar chart of the absolute or relative frequency
+        else:
+            bar_chart(store_folder, st.session_state.attribute, find_selected_value(), normalize)
+    # for a single work or composer, also show what it was most often performed with
+    if not compare and st.session_state.attribute in ('Work', 'Composer'):
+        if st.checkbox('Show what it is most often programmed with', key='togetherMode'):
+            together_chart('Data/event_store', st.session_state.attribute, find_selected_value())
 # if the user has not selected an attribute value, but has selected an attribute
-elif any(['genreValue' in st.session_state, 'nationalityValue' in st.session_state, 'workValue' in st.session_state,
-          'composerValue' in st.session_state]):
+elif st.session_state.attribute:
     # give prompt to select value
     st.write('After selecting a value, you can choose the type of graph you\'d like to see.')
 # if attribute has not been selected
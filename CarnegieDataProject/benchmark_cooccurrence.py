@@ -0,0 +1,92 @@
+"""
+Checks the co-occurrence matrices (cooccurrence.py) against a plain self-join of the event_works table, and times
+building them and answering "most often programmed with" queries.
+
+For a sample of works and composers, every pair of values sharing an event is listed by joining the value's events
+back onto the table, and counted with value_counts(). The top partners of each value, across every year and in a random
+decade, must be the same as those read from the matrices.
+
+To run the benchmark on the event store built by ingest.py (with CarnegieDataProject as the working directory):
+`python benchmark_cooccurrence.py`
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from cooccurrence import COOCCURRENCE_COLUMNS, CoOccurrence
+from event_store import STORE_FOLDER
+from mapped_store import load_or_build_mapped_store
+
+
+def joined_partners(event_works, column, value, top, decade=None):
+    """Returns the top partners of value in column, counted by joining its events onto event_works"""
+    rows = event_works[['event', 'year', column]].drop_duplicates(['event', column])
+    if decade is not None:
+        rows = rows[rows['year'] // 10 * 10 == decade]
+    value_events = rows.loc[rows[column] == value, ['event']]
+    pairs = value_events.merge(rows, on='event')
+    counts = pairs.loc[pairs[column] != value, column].value_counts().rename('events').reset_index()
+    # same order as the matrices: most events first, then by ID
+    counts = counts.sort_values(['events', column], ascending=[False, True]).head(top)
+    counts['share'] = counts['events'] / len(value_events)
+    return counts.reset_index(drop=True)
+
+
+def sample_ids(event_works, column, count, rng):
+    """Picks count values of column, weighted by how often they were performed, so common ones show up"""
+    return rng.choice(event_works[column].to_numpy(), size=count, replace=False)
+
+
+def latencies(function, arguments):
+    """Returns the latency of function(*argument) for each argument, in milliseconds"""
+    times = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(*argument)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.array(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check and time the work and composer co-occurrence matrices.')
+    parser.add_argument('--store', default=STORE_FOLDER, help='folder of the event store')
+    parser.add_argument('--checks', type=int, default=20, help='number of values checked per column')
+    parser.add_argument('--queries', type=int, default=2000, help='number of queries timed per column')
+    parser.add_argument('--top', type=int, default=10, help='number of partners per query')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the sampled values')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    store = load_or_build_mapped_store(args.store)
+    event_works = store.event_works
+
+    start = time.perf_counter()
+    cooccurrence = CoOccurrence.from_store(store)
+    print(f'{store.rows("event_works")} performed works, matrices built in {time.perf_counter() - start:.2f}s '
+          f'for {len(cooccurrence.decades)} decades')
+
+    mismatches = 0
+    for column in COOCCURRENCE_COLUMNS:
+        for value in sample_ids(event_works, column, args.checks, rng).tolist():
+            decade = int(rng.choice(cooccurrence.decades))
+            for period in (None, decade):
+                expected = joined_partners(event_works, column, value, args.top, period)
+                found = cooccurrence.top_partners(column, value, args.top, period)
+                if not (np.array_equal(expected[column], found[column])
+                        and np.array_equal(expected['events'], found['events'])
+                        and np.allclose(expected['share'], found['share'])):
+                    mismatches += 1
+                    print(f'mismatch: {column} {value} in {period or "every year"}')
+    print(f'{mismatches} mismatches in {len(COOCCURRENCE_COLUMNS) * args.checks * 2} checks')
+
+    print(f'{"query":<24}{"queries":>8}{"p50":>12}{"p95":>12}{"max":>12}')
+    for column in COOCCURRENCE_COLUMNS:
+        values = rng.choice(cooccurrence.keys[column], size=args.queries).tolist()
+        for name, decades in (('every year', [None] * args.queries),
+                              ('one decade', rng.choice(cooccurrence.decades, size=args.queries).tolist())):
+            times = latencies(cooccurrence.top_partners,
+                              [(column, value, args.top, decade) for value, decade in zip(values, decades)])
+            print(f'{column + ", " + name:<24}{len(times):>8}{np.percentile(times, 50):10.3f}ms'
+                  f'{np.percentile(times, 95):10.3f}ms{times.max():10.3f}ms')
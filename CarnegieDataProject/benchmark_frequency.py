@@ -0,0 +1,160 @@
+"""
+Checks that FrequencyEngine gives the same results as the previous create_event_frequency_list, which searched the
+nested per-event DataFrames of Data/event_data.pkl, and compares how long each takes.
+
+The previous search looked for "/{ID}" in the text of an event's works, so work 123 also matched work 1234, and
+looked for each nation inside the text of the nationalities, so "Germany" also matched "West Germany". Those checks are
+replaced by exact comparisons here, which is how FrequencyEngine matches values.
+
+Building event_data.pkl with the old cleaner takes about 12 hours, so the same nested layout is rebuilt here with a
+groupby.
+
+To run the benchmark on the full AllEvents dump (with CarnegieDataProject as the working directory):
+`python benchmark_frequency.py`
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from event_store import EVENTS_FOLDER, STATELESS, EventStore, carnegie_id, shard_paths
+from frequency import FrequencyEngine
+from ingest import read_event_chunks
+from nationalities import NATIONALITIES_PKL, read_nationality_pairs
+
+
+def legacy_event_data(raw_df, nationalities_pkl):
+    """Rebuilds the layout of event_data.pkl: one row per event, with the event's works in a nested DataFrame"""
+    raw_df = raw_df.copy()
+    # same as add_nationalities: the composer's list of nationalities, or 'statelessness'
+    nationalities = pd.read_pickle(nationalities_pkl).drop_duplicates('composer').set_index('composer')
+    raw_df['nationalities'] = raw_df['composer'].map(nationalities['nationalities']).fillna(STATELESS)
+
+    # same as cleaner: the nested DataFrame of works, one row per event, a year column and lowercase genres
+    event_data = {event: works[['workperformed', 'composer', 'nationalities']]
+                  for event, works in raw_df.groupby('event', sort=False)}
+    df = raw_df.drop_duplicates('event').copy()
+    df['event_data'] = df['event'].map(event_data)
+    df['year'] = [int(date[:4]) for date in df['date']]
+    df['genreLabel'] = df['genreLabel'].str.lower()
+    return df
+
+
+def legacy_event_frequency_list(df, lookup_range, column, specific_value, normalize=False):
+    """
+    The previous create_event_frequency_list, which searched the nested DataFrames year by year, with exact matching
+    of IDs and nationalities
+    """
+
+    column_key = {'Genre': 'genreLabel', 'Nationality': 'nationalities', 'Work': 'workperformed',
+                  'Composer': 'composer'}
+    column = column_key[column]
+
+    if column == 'genreLabel':
+        specific_value = specific_value.lower()
+    elif column in ('workperformed', 'composer'):
+        specific_value = specific_value[specific_value.index('#') + 1:specific_value.index(')')]
+
+    frequency_list = []
+
+    for year in lookup_range:
+
+        if column in df['event_data'][0].columns:
+
+            sub_df = df[df['year'] == year].copy()
+
+            has_value = []
+
+            for index, row in sub_df.iterrows():
+                important_column = sub_df['event_data'][index][column]
+
+                if column == 'nationalities':
+                    any_nationality_present = False
+                    for nation in specific_value:
+                        if nation in important_column.explode().to_list():
+                            any_nationality_present = True
+                            break
+                    has_value.append(any_nationality_present)
+                else:
+                    has_value.append(specific_value in important_column.str.rsplit('/', n=1).str[-1].to_list())
+
+            if column == 'nationalities':
+                sub_df[specific_value[0]] = has_value
+            else:
+                sub_df[specific_value] = has_value
+
+            try:
+                if column == 'nationalities':
+                    frequency_list.append(sub_df.value_counts(specific_value[0], normalize=normalize).to_dict()[True])
+                else:
+                    frequency_list.append(sub_df.value_counts(specific_value, normalize=normalize).to_dict()[True])
+            except KeyError:
+                frequency_list.append(0)
+
+        else:
+            attribute_counts = df[df['year'] == year].value_counts(column, normalize=normalize)
+
+            try:
+                if column == 'nationalities':
+                    frequency_list.append(attribute_counts[specific_value[0]])
+                else:
+                    frequency_list.append(attribute_counts[specific_value])
+            except KeyError:
+                frequency_list.append(0)
+
+    return frequency_list
+
+
+def sample_queries(raw_df, per_attribute, seed=0):
+    """Picks per_attribute random values of each attribute, formatted the way the app's select boxes format them"""
+    rng = np.random.default_rng(seed)
+
+    def pick(values):
+        values = pd.unique(values.dropna())
+        return rng.choice(values, size=min(per_attribute, len(values)), replace=False)
+
+    nationalities = read_nationality_pairs(NATIONALITIES_PKL)['nationality']
+    return ([('Genre', genre.title()) for genre in pick(raw_df['genreLabel'])] +
+            [('Work', f'(#{work})') for work in pick(pd.Series(carnegie_id(raw_df['workperformed'])))] +
+            [('Composer', f'(#{composer})') for composer in pick(pd.Series(carnegie_id(raw_df['composer'])))] +
+            [('Nationality', [nation]) for nation in pick(nationalities)])
+
+
+def timed(function, *args):
+    """Returns the result of function(*args) and the number of seconds it took"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare FrequencyEngine with the old nested-DataFrame search.')
+    parser.add_argument('--events', default=EVENTS_FOLDER, help='folder containing the Events-N.csv shards')
+    parser.add_argument('--per-attribute', type=int, default=3, help='number of values to query per attribute')
+    args = parser.parse_args()
+
+    events_df = pd.concat(read_event_chunks(shard_paths(args.events)), ignore_index=True)
+    legacy_df = legacy_event_data(events_df, NATIONALITIES_PKL)
+    nationality_pairs = read_nationality_pairs(NATIONALITIES_PKL)
+    engine, build_time = timed(lambda: FrequencyEngine(EventStore.from_events(events_df, nationality_pairs)))
+    print(f'{len(legacy_df)} events, engine built in {build_time:.2f}s')
+
+    years = sorted(set(legacy_df['year']))
+    mismatches = 0
+    legacy_total = engine_total = 0
+    for attribute, value in sample_queries(events_df, args.per_attribute):
+        for normalize in (False, True):
+            expected, legacy_time = timed(legacy_event_frequency_list, legacy_df, years, attribute, value, normalize)
+            actual, engine_time = timed(
+                lambda: engine.frequencies(attribute, value, normalize).reindex(years, fill_value=0).tolist())
+            legacy_total += legacy_time
+            engine_total += engine_time
+            matches = np.allclose(expected, actual)
+            mismatches += not matches
+            print(f'{attribute:<12}{str(value):<40}normalize={normalize!s:<6}'
+                  f'old {legacy_time:8.3f}s  new {engine_time * 1000:8.2f}ms  {"ok" if matches else "MISMATCH"}')
+
+    print(f'old total {legacy_total:.1f}s, new total {engine_total:.3f}s '
+          f'({legacy_total / engine_total:.0f}x faster), {mismatches} mismatches')
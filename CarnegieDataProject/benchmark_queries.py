@@ -0,0 +1,196 @@
+"""
+Benchmarks the headless query API (frequency_api.py) on a sample of the checked-in AllEvents shards: loading the engine
+from a cold store, single-value queries once it is loaded, multi-value queries, and the same queries over HTTP.
+
+The cold start is also measured in fresh processes, once with the store read from its Parquet tables and once from its
+memory-mapped columns (see mapped_store.py): the time to load the engine and answer a first query, and the peak
+resident memory of the process.
+
+The sample store, its index and its year cubes are built from the first few shards in a temporary folder, so the
+benchmark doesn't need the full store built by ingest.py and doesn't touch it. Every query is timed through
+query_frequencies() and json.dumps(), which is the work the API does for each request.
+
+To run the benchmark (with CarnegieDataProject as the working directory):
+`python benchmark_queries.py`
+or on more of the shards, without the year cubes:
+`python benchmark_queries.py --shards 10 --no-cubes`
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+
+from event_index import EventIndex
+from event_store import EVENTS_FOLDER, EventStore, shard_paths
+from frequency import FrequencyEngine
+from frequency_api import load_engine, make_server, query_frequencies
+from ingest import read_event_chunks
+from mapped_store import columns_folder, save_mapped_store, source_versions
+from nationalities import NATIONALITIES_PKL, read_nationality_pairs
+from year_cubes import YearCubes
+
+# ways the cold start is measured: the store read from Parquet, or from its memory-mapped columns
+COLD_STARTS = ('parquet', 'mapped')
+
+
+def build_sample_store(events_folder, shards, folder):
+    """Builds the store, index and cubes of the first shards event shards in folder, returning their paths"""
+    paths = shard_paths(events_folder)[:shards]
+    events_df = pd.concat(read_event_chunks(paths), ignore_index=True)
+    store = EventStore.from_events(events_df, read_nationality_pairs(NATIONALITIES_PKL))
+    store_folder = os.path.join(folder, 'event_store')
+    index_path = os.path.join(folder, 'event_index.npz')
+    cubes_path = os.path.join(folder, 'year_cubes.npz')
+    store.save(store_folder)
+    save_mapped_store(store, columns_folder(store_folder), source_versions(store_folder))
+    index = EventIndex.from_store(store)
+    index.save(index_path)
+    YearCubes.from_engine(FrequencyEngine(store, index)).save(cubes_path)
+    return store_folder, index_path, cubes_path
+
+
+def cold_start(kind, store_folder, index_path, cubes_path):
+    """
+    Loads the engine the given kind of way and answers one query of each attribute, printing the seconds taken and the
+    peak resident memory of the process as JSON. Meant to be run in a fresh process.
+    """
+    start = time.perf_counter()
+    if kind == 'parquet':
+        engine = FrequencyEngine(EventStore.load(store_folder), EventIndex.load(index_path), YearCubes.load(cubes_path))
+    else:
+        engine = load_engine(store_folder, index_path, cubes_path)
+    loaded = time.perf_counter()
+    for attribute in ('Genre', 'Work', 'Composer', 'Nationality'):
+        key = engine.store.events['genre'].cat.categories[0] if attribute == 'Genre' else engine.index.keys(
+            attribute.lower())[0]
+        query_frequencies(engine, attribute, [str(key)])
+    print(json.dumps({'load': loaded - start, 'first queries': time.perf_counter() - loaded, 'peak_mb': peak_memory()}))
+
+
+def peak_memory():
+    """Returns the peak resident memory of this process in MB"""
+    # on Linux, ru_maxrss carries over the peak of the process that started this one, so the kernel's own count of
+    # this process's peak is read instead
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2 ** 10
+    # ru_maxrss is in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 20
+
+
+def measure_cold_starts(paths, runs):
+    """Runs cold_start() runs times for each kind in a fresh process, printing the median of each measure"""
+    print(f'{"cold start":<34}{"runs":>8}{"load":>12}{"1st queries":>12}{"peak RSS":>12}')
+    for kind in COLD_STARTS:
+        results = [json.loads(subprocess.run([sys.executable, __file__, '--cold-start', kind, *paths],
+                                             capture_output=True, text=True, check=True).stdout)
+                   for _ in range(runs)]
+        load, first, peak = (np.median([result[measure] for result in results])
+                             for measure in ('load', 'first queries', 'peak_mb'))
+        print(f'{kind:<34}{runs:>8}{load * 1000:10.3f}ms{first * 1000:10.3f}ms{peak:10.1f}MB')
+
+
+def sample_values(engine, per_attribute, seed=0):
+    """Picks per_attribute random values of each attribute in the sample, as the API takes them"""
+    rng = np.random.default_rng(seed)
+
+    def pick(values):
+        return rng.choice(values, size=min(per_attribute, len(values)), replace=False).tolist()
+
+    return {'Genre': pick(engine.store.events['genre'].cat.categories.to_numpy()),
+            'Work': [str(work) for work in pick(engine.index.keys('work'))],
+            'Composer': [str(composer) for composer in pick(engine.index.keys('composer'))],
+            'Nationality': pick(engine.index.keys('nationality'))}
+
+
+def time_requests(function, requests):
+    """Returns the latency of function(*request) for each request, in milliseconds"""
+    times = []
+    for request in requests:
+        start = time.perf_counter()
+        function(*request)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.array(times)
+
+
+def report(case, times):
+    """Prints the number of requests and the median, 95th percentile and mean latency of a case"""
+    print(f'{case:<34}{len(times):>8}{np.percentile(times, 50):10.3f}ms{np.percentile(times, 95):10.3f}ms'
+          f'{times.mean():10.3f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the headless query API on a sample of the event shards.')
+    parser.add_argument('--events', default=EVENTS_FOLDER, help='folder containing the Events-N.csv shards')
+    parser.add_argument('--shards', type=int, default=4, help='number of shards in the sample')
+    parser.add_argument('--per-attribute', type=int, default=20, help='number of values queried per attribute')
+    parser.add_argument('--loads', type=int, default=3, help='number of times the engine is loaded')
+    parser.add_argument('--no-cubes', action='store_true', help='answer every query from the index')
+    # used by measure_cold_starts() to run cold_start() in a fresh process
+    parser.add_argument('--cold-start', nargs=4, metavar=('KIND', 'STORE', 'INDEX', 'CUBES'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start:
+        cold_start(*args.cold_start)
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        paths = build_sample_store(args.events, args.shards, folder)
+        print(f'Built the sample store of {args.shards} shards in {time.perf_counter() - start:.2f}s')
+
+        # the store, index and cubes are loaded from Parquet and .npz files each time
+        load_times = time_requests(lambda: load_engine(*paths), [()] * args.loads)
+        engine = load_engine(*paths)
+        if args.no_cubes:
+            engine.cubes = None
+        print(f'{len(engine.store.events)} events, {len(engine.store.event_works)} performed works')
+
+        values = sample_values(engine, args.per_attribute)
+
+        def answer(attribute, attribute_values, normalize):
+            return json.dumps(query_frequencies(engine, attribute, attribute_values, normalize))
+
+        print(f'{"case":<34}{"requests":>8}{"p50":>12}{"p95":>12}{"mean":>12}')
+        report('cold load', load_times)
+        for attribute, attribute_values in values.items():
+            singles = [(attribute, [value], normalize) for value in attribute_values for normalize in (False, True)]
+            # the first query of each attribute builds what the engine caches for it, so it isn't timed
+            answer(*singles[0])
+            report(f'warm query {attribute}', time_requests(answer, singles))
+        for count in (2, 5, 10):
+            multiples = [(attribute, attribute_values[:count], normalize)
+                         for attribute, attribute_values in values.items() for normalize in (False, True)] * 5
+            report(f'{count} values per query', time_requests(answer, multiples))
+
+        # the same single-value queries as HTTP requests, on a server running in a thread
+        server = make_server(engine, port=0, log_requests=False)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_address[1]}/frequencies?'
+
+        def fetch(attribute, attribute_values, normalize):
+            with urlopen(url + urlencode({'attribute': attribute, 'value': attribute_values,
+                                          'normalize': normalize}, doseq=True)) as response:
+                return response.read()
+
+        requests = [(attribute, [value], False) for attribute, attribute_values in values.items()
+                    for value in attribute_values]
+        report('HTTP query', time_requests(fetch, requests))
+        server.shutdown()
+        server.server_close()
+
+        print()
+        measure_cold_starts(paths, args.loads)
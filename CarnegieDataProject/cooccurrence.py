@@ -0,0 +1,184 @@
+"""
+Works and composers programmed together: how many events each pair of works, and each pair of composers, shared.
+
+The event_works long table is turned into a sparse event x value incidence matrix X (1 if the value was performed at
+the event), and the co-occurrence matrix of every pair of values is the sparse product X^T X: entry (a, b) counts the
+events at which both a and b were performed, and the diagonal counts the events of each value. The same product over
+only the events of one decade gives that decade's matrix.
+
+Each row of a matrix is stored with its entries sorted by count, highest first, so "what is most often programmed with
+X" is the first k entries of X's row: one slice, whatever the size of the data. Rows are stored in the same compressed
+sparse row layout as the EventIndex, with the diagonal kept apart as the number of events of each value, and every
+matrix is saved in a single .npz file that is memory-mapped when loaded.
+
+ingest.py builds the matrices, and the app and this module's command line read them. For instance, to list the works
+most often performed with Beethoven's 9th symphony in the 1920s (with CarnegieDataProject as the working directory):
+`python cooccurrence.py work 55474 --decade 1920 --top 10`
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from event_store import STORE_FOLDER
+from mapped_store import load_arrays, load_or_build_mapped_store, save_arrays
+from option_search import OPTIONS_PATH, OptionSearch
+from profiling import record_rows
+
+# default location, relative to the CarnegieDataProject folder
+COOCCURRENCE_PATH = 'Data/cooccurrence.npz'
+
+COOCCURRENCE_COLUMNS = ('work', 'composer')
+
+# period of the matrices counting every event, the others are named after the first year of their decade
+ALL_YEARS = 'all'
+
+MATRIX_ARRAYS = ('events', 'offsets', 'partners', 'counts')
+
+# number of partners returned by default
+DEFAULT_TOP = 10
+
+
+def incidence_matrix(event_codes, value_codes, shape):
+    """Returns the sparse event x value matrix with a 1 for each (event, value) pair, which must be distinct"""
+    return sparse.csr_matrix((np.ones(len(event_codes), dtype=np.int32), (event_codes, value_codes)), shape=shape)
+
+
+def ranked_rows(matrix):
+    """
+    Returns the 'events', 'offsets', 'partners' and 'counts' arrays of a square co-occurrence matrix: its diagonal, and
+    its other entries row by row, each row sorted by count (highest first) and then by partner
+    """
+    matrix = matrix.tocoo()
+    off_diagonal = matrix.row != matrix.col
+    rows, partners, counts = matrix.row[off_diagonal], matrix.col[off_diagonal], matrix.data[off_diagonal]
+    order = np.lexsort((partners, -counts, rows))
+    return {'events': matrix.diagonal().astype(np.int32),
+            'offsets': np.append(0, np.cumsum(np.bincount(rows, minlength=matrix.shape[0]))).astype(np.int64),
+            'partners': partners[order].astype(np.int32),
+            'counts': counts[order].astype(np.int32)}
+
+
+class CoOccurrence:
+    """Holds the number of events each pair of works, and each pair of composers, were performed together at"""
+
+    def __init__(self, keys, decades, store_fingerprint, matrices):
+        # keys maps each column to the sorted array of its values, the rows and columns of its matrices
+        self.keys = keys
+        self.decades = decades
+        # the content hash of the store the matrices were built from, like YearCubes
+        self.store_fingerprint = store_fingerprint
+        # matrices maps each (column, period) to a dict of the arrays in MATRIX_ARRAYS
+        self.matrices = matrices
+
+    @classmethod
+    def from_store(cls, store):
+        """Builds the matrices of every year and of each decade from the event_works table of an EventStore"""
+        event_works = store.event_works
+        keys = {}
+        matrices = {}
+        decades = None
+        for column in COOCCURRENCE_COLUMNS:
+            # a value performed several times at an event is counted once
+            rows = event_works[['event', 'year', column]].drop_duplicates(['event', column])
+            record_rows(len(rows))
+            event_codes, events = pd.factorize(rows['event'])
+            value_codes, keys[column] = pd.factorize(rows[column], sort=True)
+            keys[column] = keys[column].to_numpy(np.int32)
+            incidence = incidence_matrix(event_codes, value_codes, (len(events), len(keys[column])))
+            matrices[column, ALL_YEARS] = ranked_rows(incidence.T @ incidence)
+
+            # the decade of each event, to keep only the events of one decade in the product
+            event_decades = np.zeros(len(events), dtype=np.int64)
+            event_decades[event_codes] = rows['year'].to_numpy(np.int64) // 10 * 10
+            decades = np.unique(event_decades)
+            for decade in decades:
+                in_decade = incidence[event_decades == decade]
+                matrices[column, str(decade)] = ranked_rows(in_decade.T @ in_decade)
+        return cls(keys, decades, store.fingerprint(), matrices)
+
+    def save(self, cooccurrence_path=COOCCURRENCE_PATH):
+        """Stores the matrices as a single .npz file"""
+        arrays = {f'{column}_{period}_{name}': array for (column, period), matrix in self.matrices.items()
+                  for name, array in matrix.items()}
+        save_arrays(cooccurrence_path, decades=self.decades, store_fingerprint=np.array([self.store_fingerprint]),
+                    **{f'{column}_keys': keys for column, keys in self.keys.items()}, **arrays)
+
+    @classmethod
+    def load(cls, cooccurrence_path=COOCCURRENCE_PATH):
+        """Loads matrices previously saved with save()"""
+        # the matrices are memory-mapped, so only the rows queried are read
+        arrays = load_arrays(cooccurrence_path)
+        decades = arrays['decades']
+        periods = [ALL_YEARS] + [str(decade) for decade in decades.tolist()]
+        # matrices saved before they recorded the content hash of their store are always stale
+        store_fingerprint = str(arrays['store_fingerprint'][0]) if 'store_fingerprint' in arrays else None
+        return cls({column: arrays[f'{column}_keys'] for column in COOCCURRENCE_COLUMNS}, decades, store_fingerprint,
+                   {(column, period): {name: arrays[f'{column}_{period}_{name}'] for name in MATRIX_ARRAYS}
+                    for column in COOCCURRENCE_COLUMNS for period in periods})
+
+    def matches(self, store):
+        """Returns True if the matrices were built from a store with the same contents as store"""
+        return store.fingerprint() == self.store_fingerprint
+
+    def top_partners(self, column, value, top=DEFAULT_TOP, decade=None):
+        """
+        Returns a DataFrame of the top values of column most often performed at the same events as value (an ID),
+        across every year or in the decade starting in decade, with the number of events they shared and the share of
+        value's events that is. Values never performed with value aren't listed.
+        """
+        matrix = self.matrices[column, ALL_YEARS if decade is None else str(decade)]
+        keys = self.keys[column]
+        position = np.searchsorted(keys, value)
+        # values that were never performed have no partners
+        if position == len(keys) or keys[position] != value:
+            return pd.DataFrame({column: np.zeros(0, np.int32), 'events': np.zeros(0, np.int32),
+                                 'share': np.zeros(0)})
+        start = matrix['offsets'][position]
+        entries = slice(start, min(start + top, matrix['offsets'][position + 1]))
+        record_rows(entries.stop - entries.start)
+        counts = matrix['counts'][entries]
+        return pd.DataFrame({column: keys[matrix['partners'][entries]], 'events': counts,
+                             'share': counts / matrix['events'][position]})
+
+
+def load_or_build_cooccurrence(store, cooccurrence_path=COOCCURRENCE_PATH):
+    """
+    Loads the matrices at cooccurrence_path, building and saving them from store if they don't exist yet or were built
+    from another version of the store
+    """
+    try:
+        cooccurrence = CoOccurrence.load(cooccurrence_path)
+        if cooccurrence.matches(store):
+            return cooccurrence
+    except FileNotFoundError:
+        pass
+    cooccurrence = CoOccurrence.from_store(store)
+    cooccurrence.save(cooccurrence_path)
+    return cooccurrence
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='List the works or composers most often performed with another.')
+    parser.add_argument('column', choices=COOCCURRENCE_COLUMNS, help='kind of value')
+    parser.add_argument('value', type=int, help='Carnegie ID of the work or composer')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='number of partners listed')
+    parser.add_argument('--decade', type=int, help='first year of a decade to count, e.g. 1920 (every year by default)')
+    parser.add_argument('--store', default=STORE_FOLDER, help='folder of the event store')
+    parser.add_argument('--path', default=COOCCURRENCE_PATH, help='path of the co-occurrence matrices')
+    parser.add_argument('--options', default=OPTIONS_PATH, help='path of the picker options, for labels')
+    args = parser.parse_args()
+
+    cooccurrence = load_or_build_cooccurrence(load_or_build_mapped_store(args.store), args.path)
+    if args.decade is not None and args.decade not in cooccurrence.decades:
+        parser.error(f'no events in the {args.decade}s, decades run from {cooccurrence.decades[0]} to '
+                     f'{cooccurrence.decades[-1]}')
+    partners = cooccurrence.top_partners(args.column, args.value, args.top, args.decade)
+    # IDs are shown with their labels, when the picker options have been built
+    try:
+        partners[args.column] = OptionSearch.load(args.options).labels_of(args.column, partners[args.column])
+    except FileNotFoundError:
+        pass
+    print(partners.to_string(index=False))
@@ -0,0 +1,116 @@
+"""
+Inverted index over the columnar event store.
+
+For every work ID, composer ID and nationality, the index holds the sorted array of the events it occurs in, along
+with the year of each of those events. Looking up a value is an exact match on its key, so a search for work 123 no
+longer also finds work 1234, and combining several values is a union of their event arrays.
+
+The postings for each attribute are stored back to back in one array, with an offsets array marking where each key's
+postings start (the same layout as a CSR sparse matrix). The index is saved as a single .npz file.
+"""
+
+import numpy as np
+
+from mapped_store import load_arrays, save_arrays
+from nationalities import join_nationalities
+
+# default location, relative to the CarnegieDataProject folder
+INDEX_PATH = 'Data/event_index.npz'
+
+INDEXED_COLUMNS = ('work', 'composer', 'nationality')
+
+
+class EventIndex:
+    """Maps each work, composer and nationality to the sorted IDs and years of the events it occurs in"""
+
+    def __init__(self, postings, store_fingerprint=None):
+        # postings maps each column to a dict of 'keys', 'offsets', 'events' and 'years' arrays
+        self.postings = postings
+        # the content hash of the store the index was built from, like YearCubes
+        self.store_fingerprint = store_fingerprint
+
+    @classmethod
+    def from_store(cls, store):
+        """Builds the index from an EventStore"""
+        event_works = store.event_works[['event', 'year', 'work', 'composer']]
+        nationality_rows = join_nationalities(event_works, store.composer_nationalities)
+        nationality_rows['nationality'] = nationality_rows['nationality'].astype(str)
+
+        postings = {}
+        for column in INDEXED_COLUMNS:
+            rows = nationality_rows if column == 'nationality' else event_works
+            # one entry per (value, event), sorted by value and then by event
+            rows = rows[[column, 'event', 'year']].drop_duplicates([column, 'event']).sort_values([column, 'event'])
+            key_type = str if column == 'nationality' else np.int32
+            keys, starts = np.unique(rows[column].to_numpy(key_type), return_index=True)
+            postings[column] = {'keys': keys,
+                                'offsets': np.append(starts, len(rows)).astype(np.int64),
+                                'events': rows['event'].to_numpy(np.int32),
+                                'years': rows['year'].to_numpy(np.int16)}
+        return cls(postings, store.fingerprint())
+
+    def save(self, index_path=INDEX_PATH):
+        """Stores the index as a single .npz file"""
+        arrays = {f'{column}_{name}': array for column, column_postings in self.postings.items()
+                  for name, array in column_postings.items()}
+        save_arrays(index_path, store_fingerprint=np.array([self.store_fingerprint]), **arrays)
+
+    @classmethod
+    def load(cls, index_path=INDEX_PATH):
+        """Loads an index previously saved with save()"""
+        # the postings are memory-mapped, so only the pages of the values looked up are read
+        arrays = load_arrays(index_path)
+        # indexes saved before they recorded the content hash of their store are always stale
+        store_fingerprint = str(arrays['store_fingerprint'][0]) if 'store_fingerprint' in arrays else None
+        return cls({column: {name: arrays[f'{column}_{name}'] for name in ('keys', 'offsets', 'events', 'years')}
+                    for column in INDEXED_COLUMNS}, store_fingerprint)
+
+    def matches(self, store):
+        """Returns True if the index was built from a store with the same contents as store"""
+        return store.fingerprint() == self.store_fingerprint
+
+    def keys(self, column):
+        """Returns the sorted array of values of column that occur in at least one event"""
+        return self.postings[column]['keys']
+
+    def lookup(self, column, values):
+        """
+        Returns (events, years): the sorted IDs of the events in which any of values occurs in column, and the year of
+        each of those events. Values not in the index are ignored.
+        """
+        column_postings = self.postings[column]
+        keys = column_postings['keys']
+        values = np.asarray(values)
+        # exact matches only, and none in a column without postings
+        positions = np.searchsorted(keys, values)
+        if len(keys):
+            positions = positions[(positions < len(keys)) & (keys[np.minimum(positions, len(keys) - 1)] == values)]
+        else:
+            positions = positions[:0]
+
+        offsets = column_postings['offsets']
+        slices = [slice(offsets[position], offsets[position + 1]) for position in positions] or [slice(0, 0)]
+        if len(slices) == 1:
+            return column_postings['events'][slices[0]], column_postings['years'][slices[0]]
+        events = np.concatenate([column_postings['events'][part] for part in slices])
+        years = np.concatenate([column_postings['years'][part] for part in slices])
+        # union of the postings: each event once, in sorted order
+        events, first = np.unique(events, return_index=True)
+        return events, years[first]
+
+
+def load_or_build_index(store, index_path=INDEX_PATH):
+    """
+    Loads the index at index_path, building and saving it from store if it doesn't exist yet or was built from another
+    version of the store
+    """
+    try:
+        index = EventIndex.load(index_path)
+        if index.matches(store):
+            return index
+    except FileNotFoundError:
+        pass
+    index = EventIndex.from_store(store)
+    index.save(index_path)
+    return index
+
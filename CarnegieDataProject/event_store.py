@@ -0,0 +1,133 @@
+"""
+Columnar storage for the Carnegie Hall event data.
+
+Replaces Data/event_data.pkl, where every event carried its own small DataFrame of works, with three flat tables:
+* events: one row per event (event ID, year, genre)
+* event_works: one row per work performed at an event (event ID, year, work ID, composer ID)
+* composer_nationalities: one row per (composer ID, nationality) pair
+
+All Carnegie IDs are stored as integers (the number at the end of the data.carnegiehall.org URL) and labels are stored
+as categoricals. The tables are saved as Parquet files in a single folder.
+
+The store is built by ingest.py.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# default locations, relative to the CarnegieDataProject folder
+EVENTS_FOLDER = '../Labs/CarnegieData/AllEvents'
+STORE_FOLDER = 'Data/event_store'
+
+# nationality given to composers with no known nationality (same as the Wikidata label for Q223050)
+STATELESS = 'statelessness'
+
+TABLES = ('events', 'event_works', 'composer_nationalities')
+
+
+def carnegie_id(urls):
+    """Converts a Series of Carnegie Hall URLs (e.g. http://data.carnegiehall.org/works/21600) into integer IDs"""
+    return urls.str.rpartition('/')[2].astype(np.int32).to_numpy()
+
+
+def shard_paths(folder_path):
+    """Returns the paths of all the CSV shards in a folder, sorted by their number (Events-0, Events-1, ...)"""
+    files = [file for file in os.listdir(folder_path) if file.endswith('.csv')]
+    # sort numerically so that Events-10 comes after Events-9
+    files.sort(key=lambda file: int(''.join(char for char in file if char.isdigit()) or 0))
+    return [os.path.join(folder_path, file) for file in files]
+
+
+def convert_event_rows(raw_df):
+    """
+    Converts rows returned by the SPARQL event query (one row per work performed at an event) into rows of the
+    events table, taking the date and genre of the first row for each event, and rows of the event_works table
+    """
+    event_ids = carnegie_id(raw_df['event'])
+    years = raw_df['date'].str[:4].astype(np.int16).to_numpy()
+
+    # one row per work performed at an event
+    event_works = pd.DataFrame({'event': event_ids,
+                                'year': years,
+                                'work': carnegie_id(raw_df['workperformed']),
+                                'composer': carnegie_id(raw_df['composer'])})
+
+    # one row per event
+    first_rows = ~pd.Series(event_ids).duplicated().to_numpy()
+    events = pd.DataFrame({'event': event_ids[first_rows],
+                           'year': years[first_rows],
+                           'genre': raw_df['genreLabel'].str.lower().to_numpy()[first_rows]})
+    return events, event_works
+
+
+def performed_nationalities(nationalities_df, performed_composers):
+    """
+    Returns the composer_nationalities table: the (composer ID, nationality) pairs in nationalities_df, with the
+    performed composers who have no known nationality marked as stateless
+    """
+    missing = np.setdiff1d(performed_composers, nationalities_df['composer'].to_numpy())
+    composer_nationalities = pd.concat(
+        [nationalities_df, pd.DataFrame({'composer': missing, 'nationality': STATELESS})], ignore_index=True)
+    composer_nationalities['composer'] = composer_nationalities['composer'].astype(np.int32)
+    composer_nationalities['nationality'] = composer_nationalities['nationality'].astype('category')
+    return composer_nationalities.drop_duplicates(ignore_index=True)
+
+
+def table_fingerprint(tables):
+    """
+    Returns a SHA-256 hash of the contents of a dict of tables (DataFrames), which changes whenever any value does, so
+    that files built from a store can tell if it changed since
+    """
+    digest = hashlib.sha256()
+    for table, df in tables.items():
+        digest.update(json.dumps([table, df.columns.tolist()]).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class EventStore:
+    """The three tables of the columnar event store"""
+
+    def __init__(self, events, event_works, composer_nationalities):
+        self.events = events
+        self.event_works = event_works
+        self.composer_nationalities = composer_nationalities
+
+    @classmethod
+    def from_events(cls, raw_df, nationalities_df):
+        """
+        Builds the store in memory from the rows returned by the SPARQL event query (one row per work performed at an
+        event) and a DataFrame with one row per (composer ID, nationality) pair
+        """
+        events, event_works = convert_event_rows(raw_df)
+        events['genre'] = events['genre'].astype('category')
+        event_works = event_works.drop_duplicates(ignore_index=True)
+        composer_nationalities = performed_nationalities(nationalities_df, pd.unique(event_works['composer']))
+        return cls(events, event_works, composer_nationalities)
+
+    def save(self, store_folder=STORE_FOLDER):
+        """Stores each table as a Parquet file in store_folder"""
+        os.makedirs(store_folder, exist_ok=True)
+        for table in TABLES:
+            getattr(self, table).to_parquet(os.path.join(store_folder, f'{table}.parquet'), index=False)
+
+    @classmethod
+    def load(cls, store_folder=STORE_FOLDER):
+        """Loads a store previously saved with save() or written by ingest.py"""
+        store = cls(*[pd.read_parquet(os.path.join(store_folder, f'{table}.parquet')) for table in TABLES])
+        # labels are written as plain strings when streaming
+        store.events['genre'] = store.events['genre'].astype('category')
+        store.composer_nationalities['nationality'] = store.composer_nationalities['nationality'].astype('category')
+        return store
+
+    def rows(self, table):
+        """Returns the number of rows of a table"""
+        return len(getattr(self, table))
+
+    def fingerprint(self):
+        """Returns the content hash of the tables (see table_fingerprint)"""
+        return table_fingerprint({table: getattr(self, table) for table in TABLES})
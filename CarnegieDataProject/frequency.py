@@ -0,0 +1,168 @@
+"""
+Vectorized frequency engine for the columnar event store.
+
+Instead of filtering the data once per year, every query is answered with a single bincount over the events that
+match it. Genres are matched against the events table, while works, composers and nationalities are looked up by
+exact ID or label in the EventIndex. The full year x value count matrix for an attribute is also available, computed
+with one pass over the store's long tables.
+
+Given the YearCubes built by ingest.py, single values are read straight from the cubes instead (see year_cubes.py).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from event_index import EventIndex
+from nationalities import join_nationalities
+from profiling import record_rows
+
+# converts user inputs into column names in the store
+ATTRIBUTE_COLUMNS = {'Genre': 'genre', 'Nationality': 'nationality', 'Work': 'work', 'Composer': 'composer'}
+
+
+def option_id(option):
+    """Isolates the Carnegie ID from a selected work or composer option, e.g. "Roxanne by Sting (#12345)" -> 12345"""
+    # search from the end, since titles can contain "#" and ")" too
+    return int(option[option.rindex('(#') + 2:option.rindex(')')])
+
+
+class FrequencyEngine:
+    """Answers year-by-value frequency queries against an EventStore"""
+
+    def __init__(self, store, index=None, cubes=None):
+        self.store = store
+        self.index = index if index is not None else EventIndex.from_store(store)
+        # precomputed counts per year of every value, if loaded
+        self.cubes = cubes
+        # the year axis covers every year from the first to the last event
+        self.first_year = int(store.events['year'].min())
+        self.years = np.arange(self.first_year, int(store.events['year'].max()) + 1)
+        # total events per year, and total events with a genre per year, for proportions
+        self.event_totals = self._count_by_year(store.events['year'])
+        self.genre_totals = self._count_by_year(store.events.loc[store.events['genre'].notna(), 'year'])
+        # event_values for each column, computed the first time the column is queried
+        self._event_values = {}
+
+    def _count_by_year(self, years):
+        """Counts the entries of a Series of years, returning one count per year on the year axis"""
+        return np.bincount(years.to_numpy(np.int64) - self.first_year, minlength=len(self.years))
+
+    def _totals(self, column):
+        """Returns the per-year totals that proportions of column are taken out of"""
+        return self.genre_totals if column == 'genre' else self.event_totals
+
+    def _proportions(self, counts, totals):
+        """Divides counts by totals, giving 0 for years without any events"""
+        return np.divide(counts, totals, out=np.zeros(counts.shape), where=totals != 0)
+
+    def event_values(self, column):
+        """Returns a DataFrame with one row per distinct (event, year, value) for column"""
+        if column not in self._event_values:
+            store = self.store
+            if column == 'genre':
+                rows = store.events.loc[store.events['genre'].notna(), ['event', 'year', 'genre']]
+            elif column == 'nationality':
+                pairs = join_nationalities(store.event_works[['event', 'year', 'composer']],
+                                           store.composer_nationalities)
+                rows = pairs[['event', 'year', 'nationality']].drop_duplicates()
+            else:
+                rows = store.event_works[['event', 'year', column]].drop_duplicates()
+            self._event_values[column] = rows.reset_index(drop=True)
+        return self._event_values[column]
+
+    def matching_events(self, column, specific_value):
+        """Returns the years of the distinct events matching specific_value for column"""
+        if column == 'genre':
+            events = self.store.events
+            record_rows(len(events))
+            return events.loc[events['genre'] == specific_value.lower(), 'year']
+        elif column == 'nationality':
+            # composers who hold any of the desired nationalities
+            years = self.index.lookup(column, list(specific_value))[1]
+        else:
+            years = self.index.lookup(column, [option_id(specific_value)])[1]
+        # the postings read from the index
+        record_rows(len(years))
+        return years
+
+    def frequencies(self, attribute, specific_value, normalize=False):
+        """
+        Returns a Series indexed by year of the number of events matching specific_value for attribute ('Genre',
+        'Nationality', 'Work' or 'Composer'). Setting normalize to True returns proportions instead.
+        """
+        column = ATTRIBUTE_COLUMNS[attribute]
+        if self.cubes is not None and self.cubes.covers(column, specific_value):
+            counts = self.cubes.counts(column, specific_value)
+        else:
+            counts = self._count_by_year(pd.Series(self.matching_events(column, specific_value)))
+        if normalize:
+            counts = self._proportions(counts, self._totals(column))
+        return pd.Series(counts, index=self.years)
+
+    def value_label(self, attribute, specific_value):
+        """Returns the name of the series for specific_value in a comparison"""
+        return ', '.join(specific_value) if attribute == 'Nationality' else specific_value
+
+    def comparison(self, attribute, specific_values, normalize=False):
+        """
+        Returns a DataFrame indexed by year with one column per entry of specific_values, holding the number of events
+        matching each value for attribute. Nationality values are lists of nations, like in frequencies(). Setting
+        normalize to True returns proportions instead.
+
+        Without cubes, every series is counted by the same bincount, by giving each matching event a code of
+        series * years + year.
+        """
+        column = ATTRIBUTE_COLUMNS[attribute]
+        cubed = self.cubes is not None and all(self.cubes.covers(column, value) for value in specific_values)
+        if cubed and specific_values:
+            # each series is read from the cubes
+            counts = np.stack([self.cubes.counts(column, value) for value in specific_values], axis=1)
+            if normalize:
+                counts = self._proportions(counts, self._totals(column)[:, np.newaxis])
+            return pd.DataFrame(counts, index=self.years,
+                                columns=[self.value_label(attribute, value) for value in specific_values])
+        if column == 'genre':
+            # a single pass over the events, mapping each genre category to the series it belongs to (or -1)
+            genres = self.store.events['genre'].cat
+            record_rows(len(self.store.events))
+            series = pd.Index(pd.unique(pd.Series([value.lower() for value in specific_values])))
+            category_series = np.append(series.get_indexer(genres.categories), -1)
+            series_codes = category_series[genres.codes.to_numpy()]
+            matched = series_codes != -1
+            series_codes = series_codes[matched]
+            years = self.store.events['year'].to_numpy(np.int64)[matched]
+            columns = series.get_indexer([value.lower() for value in specific_values])
+        else:
+            # the events of each series come straight from the index
+            matches = [self.matching_events(column, value) for value in specific_values]
+            series_codes = np.repeat(np.arange(len(matches)), [len(years) for years in matches])
+            years = np.concatenate([np.asarray(years, dtype=np.int64) for years in matches] + [np.zeros(0, np.int64)])
+            columns = np.arange(len(matches))
+
+        year_count = len(self.years)
+        counts = np.bincount(series_codes * year_count + years - self.first_year,
+                             minlength=(columns.max(initial=-1) + 1) * year_count)
+        counts = counts.reshape(-1, year_count)[columns].T
+        if normalize:
+            counts = self._proportions(counts, self._totals(column)[:, np.newaxis])
+        return pd.DataFrame(counts, index=self.years,
+                            columns=[self.value_label(attribute, value) for value in specific_values])
+
+    def frequency_matrix(self, attribute, normalize=False):
+        """
+        Returns (values, matrix) where matrix is a sparse year x value matrix of event counts for attribute, with one
+        row per year of the year axis and one column per entry of values. Setting normalize to True returns
+        proportions instead.
+        """
+        column = ATTRIBUTE_COLUMNS[attribute]
+        rows = self.event_values(column)
+        record_rows(len(rows))
+        value_codes, values = pd.factorize(rows[column], sort=True)
+        year_codes = rows['year'].to_numpy(np.int64) - self.first_year
+        # duplicate (year, value) entries are summed when the matrix is built
+        matrix = sparse.csr_matrix((np.ones(len(rows)), (year_codes, value_codes)),
+                                   shape=(len(self.years), len(values)))
+        if normalize:
+            matrix = sparse.diags(self._proportions(np.ones(len(self.years)), self._totals(column))) @ matrix
+        return values, matrix.tocsr()
@@ -0,0 +1,206 @@
+"""
+Headless frequency queries, answered without Streamlit.
+
+query_frequencies() answers a request for the frequencies of one or more values of an attribute, over a range of
+years, with the same FrequencyEngine as the app, as a JSON-ready dict:
+{"attribute": "Genre", "normalize": false, "years": [1900, 1901, ...],
+ "series": [{"value": "Jazz", "frequencies": [0, 2, ...]}, ...]}
+Each value is its own series. Works and composers are given by their Carnegie ID, either alone ("54976") or as an option
+label ("Wolfgang Amadeus Mozart (#54976)"). A nationality value is a group of nations separated by "|" (e.g.
+"Germany|Kingdom of Prussia"), matching composers who hold any of them, like the app's nationality picker.
+
+The requests can be made from the command line or over HTTP (with CarnegieDataProject as the working directory):
+`python frequency_api.py query Genre Jazz Blues --normalize --start 1900 --end 1950`
+`python frequency_api.py serve --port 8000`
+then GET http://localhost:8000/frequencies?attribute=Genre&value=Jazz&value=Blues&normalize=true&start=1900&end=1950
+
+To benchmark loading the engine and answering queries on a sample of the event shards, run:
+`python benchmark_queries.py`
+"""
+
+import argparse
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from event_index import INDEX_PATH, load_or_build_index
+from event_store import STORE_FOLDER
+from frequency import ATTRIBUTE_COLUMNS, FrequencyEngine, option_id
+from mapped_store import load_or_build_mapped_store
+from profiling import record_rows
+from year_cubes import CUBES_PATH, load_or_build_cubes
+
+# separates the nations of a nationality value
+NATION_SEPARATOR = '|'
+
+# number of years before the first and after the last year of the data that a year range may reach, so that a request
+# can't ask for millions of years of zeros
+YEAR_MARGIN = 100
+
+
+class QueryError(ValueError):
+    """Raised for requests that can't be answered, like an unknown attribute or a badly formatted value"""
+
+
+def load_engine(store_folder=STORE_FOLDER, index_path=INDEX_PATH, cubes_path=CUBES_PATH):
+    """Loads the event store, its index and its year cubes (building the index and cubes if needed) into an engine"""
+    # open the memory-mapped columns of the event store; only the events table is read to set up the engine
+    store = load_or_build_mapped_store(store_folder)
+    record_rows(store.rows('events'))
+    # load the index of the events each work, composer and nationality occurs in
+    engine = FrequencyEngine(store, load_or_build_index(store, index_path))
+    # load the number of events per year of every value, so that most queries are an array lookup
+    engine.cubes = load_or_build_cubes(engine, cubes_path)
+    return engine
+
+
+def parse_value(attribute, text):
+    """Converts a value given as text into the form FrequencyEngine takes for attribute"""
+    text = text.strip()
+    if attribute == 'Nationality':
+        nations = [nation.strip() for nation in text.split(NATION_SEPARATOR) if nation.strip()]
+        if not nations:
+            raise QueryError('a nationality value needs at least one nation')
+        return nations
+    elif attribute in ('Work', 'Composer'):
+        if text.isdigit():
+            return f'(#{text})'
+        message = f'{attribute.lower()} values are Carnegie IDs, like "54976" or "Name (#54976)"'
+        if not text.endswith(')'):
+            raise QueryError(message)
+        # the ID has to be a number, or the engine can't look it up
+        try:
+            option_id(text)
+        except ValueError:
+            raise QueryError(message) from None
+        return text
+    return text
+
+
+def query_frequencies(engine, attribute, values, normalize=False, year_range=None):
+    """
+    Returns the frequencies of each of values (as text) for attribute, per year of year_range (first and last year,
+    every year of the data by default, and no further than YEAR_MARGIN years from it), as a JSON-ready dict. Setting
+    normalize to True returns proportions instead.
+    """
+    if attribute not in ATTRIBUTE_COLUMNS:
+        raise QueryError(f'unknown attribute {attribute!r}, expected one of {", ".join(ATTRIBUTE_COLUMNS)}')
+    if not values:
+        raise QueryError('at least one value is needed')
+    specific_values = [parse_value(attribute, value) for value in values]
+
+    if year_range is None:
+        years = engine.years.tolist()
+    else:
+        start, end = year_range
+        if start > end:
+            raise QueryError(f'the first year ({start}) is after the last year ({end})')
+        earliest, latest = int(engine.years[0]) - YEAR_MARGIN, int(engine.years[-1]) + YEAR_MARGIN
+        if start < earliest or end > latest:
+            raise QueryError(f'years must be between {earliest} and {latest}')
+        years = list(range(start, end + 1))
+
+    # one value is read on its own, several are counted together; years outside the data have no events
+    if len(specific_values) == 1:
+        frequencies = engine.frequencies(attribute, specific_values[0], normalize).to_frame(
+            engine.value_label(attribute, specific_values[0]))
+    else:
+        frequencies = engine.comparison(attribute, specific_values, normalize)
+    frequencies = frequencies.reindex(years, fill_value=0)
+
+    return {'attribute': attribute, 'normalize': normalize, 'years': years,
+            'series': [{'value': label, 'frequencies': frequencies.iloc[:, position].tolist()}
+                       for position, label in enumerate(frequencies.columns)]}
+
+
+def parse_bool(text):
+    """Reads a true/false query parameter"""
+    return text.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def make_handler(engine, log_requests=True):
+    """Returns a request handler class answering GET /frequencies requests with engine"""
+
+    class FrequencyHandler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            if log_requests:
+                super().log_message(*args)
+
+        def send_json(self, status, body):
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/frequencies':
+                self.send_json(404, {'error': f'unknown path {url.path}, expected /frequencies'})
+                return
+            parameters = parse_qs(url.query)
+            try:
+                year_range = None
+                if 'start' in parameters or 'end' in parameters:
+                    year_range = (int(parameters.get('start', [engine.years[0]])[0]),
+                                  int(parameters.get('end', [engine.years[-1]])[0]))
+                response = query_frequencies(engine, parameters.get('attribute', [''])[0],
+                                             parameters.get('value', []),
+                                             parse_bool(parameters.get('normalize', ['false'])[0]), year_range)
+            except (QueryError, ValueError) as error:
+                # ValueError covers years that aren't numbers
+                self.send_json(400, {'error': str(error)})
+                return
+            self.send_json(200, response)
+
+    return FrequencyHandler
+
+
+def make_server(engine, host='127.0.0.1', port=8000, log_requests=True):
+    """
+    Returns an HTTP server answering frequency queries with engine, one thread per request, printing each request
+    unless log_requests is False
+    """
+    return ThreadingHTTPServer((host, port), make_handler(engine, log_requests))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Answer Carnegie Hall frequency queries as JSON.')
+    parser.add_argument('--store', default=STORE_FOLDER, help='folder of the event store')
+    parser.add_argument('--index', default=INDEX_PATH, help='path of the event index')
+    parser.add_argument('--cubes', default=CUBES_PATH, help='path of the year cubes')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    query_parser = commands.add_parser('query', help='print the frequencies of one or more values as JSON')
+    query_parser.add_argument('attribute', help=', '.join(ATTRIBUTE_COLUMNS))
+    query_parser.add_argument('values', nargs='+', help='values to count, each its own series')
+    query_parser.add_argument('--normalize', action='store_true', help='proportions instead of counts')
+    query_parser.add_argument('--start', type=int, help='first year')
+    query_parser.add_argument('--end', type=int, help='last year')
+
+    serve_parser = commands.add_parser('serve', help='answer GET /frequencies requests over HTTP')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    serve_parser.add_argument('--port', type=int, default=8000, help='port to listen on')
+    args = parser.parse_args()
+
+    engine = load_engine(args.store, args.index, args.cubes)
+    if args.command == 'query':
+        year_range = None
+        if args.start is not None or args.end is not None:
+            year_range = (args.start if args.start is not None else int(engine.years[0]),
+                          args.end if args.end is not None else int(engine.years[-1]))
+        try:
+            json.dump(query_frequencies(engine, args.attribute, args.values, args.normalize, year_range), sys.stdout)
+        except QueryError as error:
+            query_parser.error(str(error))
+        print()
+    else:
+        server = make_server(engine, args.host, args.port)
+        print(f'Answering frequency queries on http://{args.host}:{args.port}/frequencies')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
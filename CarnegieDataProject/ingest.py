@@ -0,0 +1,400 @@
+"""
+Streaming ingest of the SPARQL query results into the columnar event store.
+
+Each Events-N.csv shard is read a chunk of rows at a time with fixed column types and converted into rows of the
+events and event_works tables. The shards are then merged in order: duplicates are removed by checking hashes of the
+rows already written, and each shard's new rows are appended to the Parquet files as a new row group. Only a few
+shards and the hashes of the written rows are held in memory at a time, and every row is processed once, so run time
+grows linearly with the size of the input.
+
+The Works-N.csv and Composers-N.csv shards are parsed the same way into the works and composers tables, which list
+every work and composer in the Carnegie Hall data along with their labels.
+
+Shards can be parsed in parallel by a pool of worker processes. Results are always merged in shard order, so the
+store is the same no matter how many workers are used. The time taken to parse each shard is reported.
+
+The tables parsed from each shard are cached in the store folder, and a manifest records the content hash and row
+count of every shard. A rebuild only parses the shards that were added or changed since the last build, then merges
+the cached tables of every shard, so adding one new export takes seconds rather than a full rebuild. Tables whose shards
+(or, for the events, the composer nationalities) didn't change aren't merged again.
+
+The works and composers tables are also turned into the option lists of the app's pickers, with a search index over
+their labels (see option_search.py), and the number of events per year of every value is rolled up into the year cubes
+read by the app's charts (see year_cubes.py). The number of events every pair of works, and every pair of composers,
+were performed together at is counted into sparse matrices (see cooccurrence.py). Each column of the store is also
+saved as a .npy file that the app memory-maps (see mapped_store.py). Each of these files records the content hash of
+the store it was built from, and is only built again when the store changed, so a rebuild with nothing new to parse
+takes about a second.
+
+To build the store and its index, run (with CarnegieDataProject as the working directory):
+`python ingest.py`
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cooccurrence import COOCCURRENCE_PATH, CoOccurrence
+from event_index import INDEX_PATH, EventIndex
+from event_store import (EVENTS_FOLDER, STORE_FOLDER, TABLES, EventStore, carnegie_id, convert_event_rows,
+                         performed_nationalities, shard_paths)
+from frequency import FrequencyEngine
+from mapped_store import MappedStore, columns_folder, save_mapped_store, source_versions
+from nationalities import NATIONALITIES_PKL, read_nationality_pairs
+from option_search import OPTIONS_PATH, OptionSearch
+from year_cubes import CUBES_PATH, YearCubes
+
+# number of CSV rows read at a time
+CHUNK_SIZE = 50_000
+
+# number of shards each worker process parses ahead of the shard being merged
+SHARDS_AHEAD = 2
+
+# the manifest of parsed shards, and the folder their parsed tables are cached in, inside the store folder
+MANIFEST_FILE = 'manifest.json'
+SHARD_FOLDER = 'shards'
+
+# default locations of the work and composer query results, relative to the CarnegieDataProject folder
+WORKS_FOLDER = '../Labs/CarnegieData/AllWorks'
+COMPOSERS_FOLDER = '../Labs/CarnegieData/AllComposers'
+
+# fixed types for the columns of each query that the store needs
+EVENT_CSV_DTYPES = {'event': str, 'date': str, 'genreLabel': str, 'workperformed': str, 'composer': str}
+WORK_CSV_DTYPES = {'work': str, 'title': str, 'composer': str, 'composerLabel': str}
+COMPOSER_CSV_DTYPES = {'composer': str, 'composerLabel': str}
+
+# Parquet schemas of the tables written while streaming
+EVENTS_SCHEMA = pa.schema([('event', pa.int32()), ('year', pa.int16()), ('genre', pa.string())])
+EVENT_WORKS_SCHEMA = pa.schema([('event', pa.int32()), ('year', pa.int16()), ('work', pa.int32()),
+                                ('composer', pa.int32())])
+
+
+def read_event_chunks(paths, chunk_size=CHUNK_SIZE):
+    """Yields the rows of each CSV shard in paths, chunk_size rows at a time"""
+    for path in paths:
+        with pd.read_csv(path, usecols=list(EVENT_CSV_DTYPES), dtype=EVENT_CSV_DTYPES,
+                         chunksize=chunk_size) as reader:
+            yield from reader
+
+
+class Deduplicator:
+    """Remembers the hashes of the rows it has seen, so that rows repeated in later chunks can be dropped"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.seen = set()
+
+    def new_rows(self, df):
+        """Returns the rows of df not seen before (counting earlier rows of df), and marks them as seen"""
+        hashes = pd.util.hash_pandas_object(df[self.columns], index=False).to_numpy()
+        new = ~pd.Series(hashes).duplicated().to_numpy()
+        # checking each hash against the set keeps the work per chunk proportional to the chunk's size
+        seen = self.seen
+        new &= np.fromiter((row_hash not in seen for row_hash in hashes.tolist()), bool, len(hashes))
+        seen.update(hashes[new].tolist())
+        return df[new]
+
+
+def parse_event_shard(path, chunk_size=CHUNK_SIZE):
+    """
+    Parses one Events-N.csv shard into rows of the events and event_works tables, without the rows repeated within the
+    shard. Returns (path, number of rows read, seconds taken, {table name: rows of the table}).
+    """
+    start = time.perf_counter()
+    new_events = Deduplicator(['event'])
+    new_event_works = Deduplicator(['event', 'work', 'composer'])
+    events_parts = []
+    event_works_parts = []
+    rows_read = 0
+    for raw_df in read_event_chunks([path], chunk_size):
+        rows_read += len(raw_df)
+        events, event_works = convert_event_rows(raw_df)
+        events_parts.append(new_events.new_rows(events))
+        event_works_parts.append(new_event_works.new_rows(event_works))
+    tables = {'events': pd.concat(events_parts, ignore_index=True),
+              'event_works': pd.concat(event_works_parts, ignore_index=True)}
+    return path, rows_read, time.perf_counter() - start, tables
+
+
+def parse_work_shard(path):
+    """Parses one Works-N.csv shard into rows of the works table. Returns the same as parse_event_shard."""
+    start = time.perf_counter()
+    raw_df = pd.read_csv(path, usecols=list(WORK_CSV_DTYPES), dtype=WORK_CSV_DTYPES)
+    works = pd.DataFrame({'work': carnegie_id(raw_df['work']),
+                          'title': raw_df['title'].to_numpy(),
+                          'composer': carnegie_id(raw_df['composer']),
+                          'composer_label': raw_df['composerLabel'].to_numpy()})
+    return path, len(raw_df), time.perf_counter() - start, {'works': works}
+
+
+def parse_composer_shard(path):
+    """Parses one Composers-N.csv shard into rows of the composers table. Returns the same as parse_event_shard."""
+    start = time.perf_counter()
+    raw_df = pd.read_csv(path, usecols=list(COMPOSER_CSV_DTYPES), dtype=COMPOSER_CSV_DTYPES)
+    composers = pd.DataFrame({'composer': carnegie_id(raw_df['composer']),
+                              'label': raw_df['composerLabel'].to_numpy()})
+    return path, len(raw_df), time.perf_counter() - start, {'composers': composers}
+
+
+def parse_shards(parser, paths, workers=1):
+    """
+    Yields parser(path) for each path, in order. With more than one worker, the shards are parsed in parallel by a
+    pool of worker processes, at most SHARDS_AHEAD shards per worker ahead of the one being yielded, so that only a
+    few parsed shards are held in memory at a time.
+    """
+    if workers > 1:
+        paths = iter(paths)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque(pool.submit(parser, path) for path in islice(paths, workers * SHARDS_AHEAD))
+            while pending:
+                result = pending.popleft().result()
+                # a new shard is started for each one finished, before the finished one is merged
+                pending.extend(pool.submit(parser, path) for path in islice(paths, 1))
+                yield result
+    else:
+        yield from map(parser, paths)
+
+
+def shard_digest(path):
+    """Returns the SHA-256 hash of the contents of a shard"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Records the content hash and row count of every shard whose parsed tables are cached in the store folder, so that
+    later builds only need to parse shards that were added or changed
+    """
+
+    def __init__(self, store_folder=STORE_FOLDER):
+        self.path = os.path.join(store_folder, MANIFEST_FILE)
+        self.shard_folder = os.path.join(store_folder, SHARD_FOLDER)
+        try:
+            with open(self.path) as file:
+                self.shards = json.load(file)
+        except FileNotFoundError:
+            self.shards = {}
+        # content hashes computed during this build, so each shard is only hashed once
+        self.digests = {}
+
+    def digest(self, path):
+        """Returns the content hash of the shard at path"""
+        if path not in self.digests:
+            self.digests[path] = shard_digest(path)
+        return self.digests[path]
+
+    def cache_path(self, path, table):
+        """Returns the path of the cached rows of table parsed from the shard at path"""
+        return os.path.join(self.shard_folder, f'{os.path.splitext(os.path.basename(path))[0]}.{table}.parquet')
+
+    def stale_shards(self, paths, tables):
+        """Returns the paths whose contents changed (or were never parsed) since their tables were cached"""
+        stale = []
+        for path in paths:
+            entry = self.shards.get(os.path.basename(path))
+            cached = all(os.path.exists(self.cache_path(path, table)) for table in tables)
+            if entry is None or not cached or entry['sha256'] != self.digest(path):
+                stale.append(path)
+        return stale
+
+    def store_shard(self, path, rows_read, tables):
+        """Caches the tables parsed from the shard at path and records it in the manifest"""
+        os.makedirs(self.shard_folder, exist_ok=True)
+        for table, rows in tables.items():
+            rows.to_parquet(self.cache_path(path, table), index=False)
+        self.shards[os.path.basename(path)] = {'sha256': self.digest(path), 'rows': rows_read}
+
+    def store_source(self, path):
+        """Records the content hash of a source file that isn't a shard, such as the composer nationalities"""
+        self.shards[os.path.basename(path)] = {'sha256': self.digest(path)}
+
+    def cached_tables(self, paths, table):
+        """Yields the cached rows of table for each shard in paths, in order"""
+        for path in paths:
+            yield pd.read_parquet(self.cache_path(path, table))
+
+    def forget_missing(self, paths, prefix, tables):
+        """Removes the entries and cached tables of shards starting with prefix that are no longer in paths"""
+        names = {os.path.basename(path) for path in paths}
+        for name in [name for name in self.shards if name.startswith(prefix) and name not in names]:
+            del self.shards[name]
+            for table in tables:
+                cache_path = self.cache_path(name, table)
+                if os.path.exists(cache_path):
+                    os.remove(cache_path)
+
+    def save(self):
+        """Writes the manifest to the store folder"""
+        with open(self.path, 'w') as file:
+            json.dump(self.shards, file, indent=1, sort_keys=True)
+
+
+def update_shards(manifest, parser, paths, prefix, tables, workers=1, full=False):
+    """
+    Parses the shards in paths that were added or changed since the last build (or every shard, if full is True) and
+    caches their tables. Returns a list of (path, number of rows read, seconds taken) for each shard parsed.
+    """
+    manifest.forget_missing(paths, prefix, tables)
+    stale = list(paths) if full else manifest.stale_shards(paths, tables)
+    timings = []
+    for path, rows_read, seconds, parsed_tables in parse_shards(parser, stale, workers):
+        manifest.store_shard(path, rows_read, parsed_tables)
+        timings.append((path, rows_read, seconds))
+    return timings
+
+
+def merge_events(manifest, paths, nationalities_df, store_folder=STORE_FOLDER):
+    """
+    Merges the cached tables of the Events-N.csv shards in paths, in order, into the events and event_works tables of
+    the store in store_folder, then writes the composer_nationalities table for every composer performed
+    """
+    # an event keeps the genre of its first row, and each (event, work, composer) is stored once
+    new_events = Deduplicator(['event'])
+    new_event_works = Deduplicator(['event', 'work', 'composer'])
+    performed_composers = set()
+
+    with pq.ParquetWriter(os.path.join(store_folder, 'events.parquet'), EVENTS_SCHEMA) as events_writer, \
+            pq.ParquetWriter(os.path.join(store_folder, 'event_works.parquet'), EVENT_WORKS_SCHEMA) as works_writer:
+        for events, event_works in zip(manifest.cached_tables(paths, 'events'),
+                                       manifest.cached_tables(paths, 'event_works')):
+            events = new_events.new_rows(events)
+            event_works = new_event_works.new_rows(event_works)
+            performed_composers.update(pd.unique(event_works['composer']).tolist())
+            # each shard becomes a row group of the Parquet files
+            events_writer.write_table(pa.Table.from_pandas(events, EVENTS_SCHEMA, preserve_index=False))
+            works_writer.write_table(pa.Table.from_pandas(event_works, EVENT_WORKS_SCHEMA, preserve_index=False))
+
+    composer_nationalities = performed_nationalities(
+        nationalities_df, np.fromiter(performed_composers, np.int32, len(performed_composers)))
+    composer_nationalities.to_parquet(os.path.join(store_folder, 'composer_nationalities.parquet'), index=False)
+
+
+def merge_catalog(manifest, paths, key, table, store_folder=STORE_FOLDER):
+    """Merges the cached rows of table for each shard in paths, in order, keeping the first row for each key"""
+    catalog = pd.concat(manifest.cached_tables(paths, table), ignore_index=True).drop_duplicates(key, ignore_index=True)
+    catalog.to_parquet(os.path.join(store_folder, f'{table}.parquet'), index=False)
+
+
+def load_if_matches(load, path, *sources):
+    """Returns the file at path loaded with load, or None if it doesn't exist or wasn't built from sources"""
+    try:
+        loaded = load(path)
+    except FileNotFoundError:
+        return None
+    return loaded if loaded.matches(*sources) else None
+
+
+def mapped_store_matches(store, store_folder=STORE_FOLDER):
+    """Returns True if the memory-mapped columns of the store in store_folder were saved from its current tables"""
+    try:
+        mapped = MappedStore(columns_folder(store_folder))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    return (mapped.manifest.get('fingerprint') == store.fingerprint()
+            and mapped.manifest['sources'] == source_versions(store_folder))
+
+
+def ingest(events_folder=EVENTS_FOLDER, works_folder=WORKS_FOLDER, composers_folder=COMPOSERS_FOLDER,
+           nationalities_pkl=NATIONALITIES_PKL, store_folder=STORE_FOLDER, index_path=INDEX_PATH,
+           chunk_size=CHUNK_SIZE, workers=1, full=False, options_path=OPTIONS_PATH, cubes_path=CUBES_PATH,
+           cooccurrence_path=COOCCURRENCE_PATH):
+    """
+    Builds the store in store_folder, its index, the picker options, the year cubes, the co-occurrence matrices and the
+    memory-mapped columns. Only shards that were added or changed since the last build are parsed, and only the files
+    built from what changed are built again, unless full is True. Returns a list of (path, number of rows read, seconds
+    taken) for each shard parsed.
+    """
+    os.makedirs(store_folder, exist_ok=True)
+    manifest = Manifest(store_folder)
+    sources = dict(manifest.shards)
+    event_paths = shard_paths(events_folder)
+    work_paths = shard_paths(works_folder)
+    composer_paths = shard_paths(composers_folder)
+
+    timings = update_shards(manifest, partial(parse_event_shard, chunk_size=chunk_size), event_paths, 'Events',
+                            ('events', 'event_works'), workers, full)
+    timings += update_shards(manifest, parse_work_shard, work_paths, 'Works', ('works',), workers, full)
+    timings += update_shards(manifest, parse_composer_shard, composer_paths, 'Composers', ('composers',), workers,
+                             full)
+    manifest.store_source(nationalities_pkl)
+    manifest.save()
+
+    # each group of tables is merged again if one of its shards was added, changed or removed, or a table is missing
+    changed = [name for name in set(sources) | set(manifest.shards) if sources.get(name) != manifest.shards.get(name)]
+
+    def stale(tables, *prefixes):
+        missing = not all(os.path.exists(os.path.join(store_folder, f'{table}.parquet')) for table in tables)
+        return full or missing or any(name.startswith(prefixes) for name in changed)
+
+    if stale(TABLES, 'Events', os.path.basename(nationalities_pkl)):
+        merge_events(manifest, event_paths, read_nationality_pairs(nationalities_pkl), store_folder)
+    if stale(('works',), 'Works'):
+        merge_catalog(manifest, work_paths, 'work', 'works', store_folder)
+    if stale(('composers',), 'Composers'):
+        merge_catalog(manifest, composer_paths, 'composer', 'composers', store_folder)
+    store = EventStore.load(store_folder)
+
+    # each file built from the store is kept if it was built from a store with the same contents
+    index = None if full else load_if_matches(EventIndex.load, index_path, store)
+    if index is None:
+        index = EventIndex.from_store(store)
+        index.save(index_path)
+    if full or load_if_matches(OptionSearch.load, options_path, index, store_folder) is None:
+        OptionSearch.from_store(index, store_folder).save(options_path)
+    if full or load_if_matches(YearCubes.load, cubes_path, store) is None:
+        YearCubes.from_engine(FrequencyEngine(store, index)).save(cubes_path)
+    if full or load_if_matches(CoOccurrence.load, cooccurrence_path, store) is None:
+        CoOccurrence.from_store(store).save(cooccurrence_path)
+    if full or not mapped_store_matches(store, store_folder):
+        save_mapped_store(store, columns_folder(store_folder), source_versions(store_folder))
+    return timings
+
+
+def print_timings(timings):
+    """Prints the time taken to parse each shard, marking shards that took over twice the median time"""
+    median = np.median([seconds for path, rows_read, seconds in timings])
+    for path, rows_read, seconds in timings:
+        slow = '  slow' if seconds > 2 * median else ''
+        print(f'{os.path.basename(path):<20}{rows_read:>8} rows {seconds:8.2f}s{slow}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingest the Carnegie Hall query CSVs into the columnar event store.')
+    parser.add_argument('--events', default=EVENTS_FOLDER, help='folder containing the Events-N.csv shards')
+    parser.add_argument('--works', default=WORKS_FOLDER, help='folder containing the Works-N.csv shards')
+    parser.add_argument('--composers', default=COMPOSERS_FOLDER, help='folder containing the Composers-N.csv shards')
+    parser.add_argument('--nationalities', default=NATIONALITIES_PKL, help='PKL or CSV of composer nationalities')
+    parser.add_argument('--store', default=STORE_FOLDER, help='folder to store the Parquet tables in')
+    parser.add_argument('--index', default=INDEX_PATH, help='path to store the event index in')
+    parser.add_argument('--options', default=OPTIONS_PATH, help='path to store the picker options in')
+    parser.add_argument('--cubes', default=CUBES_PATH, help='path to store the year cubes in')
+    parser.add_argument('--cooccurrence', default=COOCCURRENCE_PATH, help='path to store the co-occurrence matrices in')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='number of CSV rows read at a time')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of shards parsed in parallel')
+    parser.add_argument('--full', action='store_true',
+                        help='parse every shard and build every file again, even if nothing changed')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    shard_timings = ingest(args.events, args.works, args.composers, args.nationalities, args.store, args.index,
+                           args.chunk_size, args.workers, args.full, args.options, args.cubes, args.cooccurrence)
+
+    if shard_timings:
+        print_timings(shard_timings)
+    print(f'Parsed {len(shard_timings)} new or changed shards and updated the store '
+          f'in {time.perf_counter() - start:.1f}s with {args.workers} workers')
@@ -0,0 +1,223 @@
+"""
+Memory-mapped layout of the event store, for a fast app start.
+
+Reading the Parquet tables decodes every column of every table before the first chart can be drawn. Instead, each
+column of the store's tables is also saved as its own .npy file in the columns folder of the store:
+* numeric columns (event, year, work and composer IDs) are memory-mapped when the store is opened, so only the pages
+  a query reads are loaded, and app workers on the same machine share those pages through the operating system's
+  file cache
+* label columns (genre, nationality) are saved as integer codes, and their dictionary of labels (a small JSON file) is
+  only read when the column is first used
+* a table is only assembled when it is first used, from views of its columns, so with the index and the year cubes,
+  drawing a chart never loads the event_works or composer_nationalities tables
+
+The index and the year cubes are .npz files of uncompressed arrays, which load_arrays() memory-maps the same way.
+
+ingest.py writes the columns folder, and the app rebuilds it from the Parquet tables if it is missing or out of date.
+"""
+
+import json
+import os
+import struct
+import threading
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from event_store import STORE_FOLDER, TABLES, EventStore
+
+# folder of the memory-mapped columns, inside the store folder
+COLUMNS_FOLDER = 'columns'
+
+MANIFEST_FILE = 'manifest.json'
+
+# size of the fixed part of a zip member's local header, and the offset of its name and extra field lengths
+ZIP_LOCAL_HEADER_SIZE = 30
+ZIP_NAME_LENGTHS_OFFSET = 26
+
+
+def load_arrays(path):
+    """
+    Returns a dict of the arrays in a .npz file. Arrays stored uncompressed (by np.savez) are memory-mapped from the
+    file, others are read into memory.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as file:
+        for member in archive.infolist():
+            name = member.filename.removesuffix('.npy')
+            if member.compress_type != zipfile.ZIP_STORED:
+                with archive.open(member) as array_file:
+                    arrays[name] = np.lib.format.read_array(array_file)
+                continue
+            # the array starts after the member's local header, whose extra field can differ from the one listed in
+            # the archive's directory, so its lengths are read from the header itself
+            file.seek(member.header_offset)
+            header = file.read(ZIP_LOCAL_HEADER_SIZE)
+            name_length, extra_length = struct.unpack('<HH', header[ZIP_NAME_LENGTHS_OFFSET:ZIP_LOCAL_HEADER_SIZE])
+            file.seek(member.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length)
+            arrays[name] = map_array(path, file)
+    return arrays
+
+
+def temporary_path(path):
+    """Returns the path the new contents of path are written to first, unique to the writing process and thread"""
+    return f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+
+
+def save_arrays(path, **arrays):
+    """
+    Saves arrays as an uncompressed .npz file at path. The file is written next to path and then moved over it, so
+    processes that have the previous file memory-mapped keep reading it unchanged, and processes saving it at the same
+    time each move a whole file.
+    """
+    temporary = temporary_path(path)
+    with open(temporary, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(temporary, path)
+
+
+def save_array(path, array):
+    """Saves array as a .npy file at path, replacing any previous file the same way as save_arrays()"""
+    temporary = temporary_path(path)
+    with open(temporary, 'wb') as file:
+        np.save(file, array)
+    os.replace(temporary, path)
+
+
+def save_json(path, value):
+    """Saves value as a JSON file at path, replacing any previous file the same way as save_arrays()"""
+    temporary = temporary_path(path)
+    with open(temporary, 'w') as file:
+        json.dump(value, file)
+    os.replace(temporary, path)
+
+
+def map_array(path, file):
+    """Memory-maps the .npy array that starts at the current position of file, an open handle on path"""
+    version = np.lib.format.read_magic(file)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+    # empty arrays can't be mapped
+    if dtype.hasobject or not np.prod(shape):
+        return np.lib.format.read_array(file) if dtype.hasobject else np.empty(shape, dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=file.tell(), shape=shape,
+                     order='F' if fortran_order else 'C').view(np.ndarray)
+
+
+def columns_folder(store_folder=STORE_FOLDER):
+    """Returns the folder of the memory-mapped columns of the store in store_folder"""
+    return os.path.join(store_folder, COLUMNS_FOLDER)
+
+
+def source_versions(store_folder):
+    """Returns the number of rows and modification time of each Parquet table in store_folder"""
+    versions = {}
+    for table in TABLES:
+        path = os.path.join(store_folder, f'{table}.parquet')
+        versions[table] = [pq.read_metadata(path).num_rows, os.stat(path).st_mtime_ns]
+    return versions
+
+
+def save_mapped_store(store, folder, versions=None):
+    """
+    Saves each column of the tables of store as a .npy file in folder, with a JSON dictionary of labels for label
+    columns, and a manifest of the tables (with the content hash of the store, and the versions of the Parquet tables
+    they were made from)
+    """
+    os.makedirs(folder, exist_ok=True)
+    manifest = {'tables': {}, 'sources': versions, 'fingerprint': store.fingerprint()}
+    for table in TABLES:
+        df = getattr(store, table)
+        columns = {}
+        for column in df.columns:
+            values = df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype) or values.dtype == object:
+                labels = pd.Categorical(values)
+                save_array(os.path.join(folder, f'{table}.{column}.npy'), labels.codes)
+                save_json(os.path.join(folder, f'{table}.{column}.json'), labels.categories.tolist())
+                columns[column] = 'labels'
+            else:
+                save_array(os.path.join(folder, f'{table}.{column}.npy'), values.to_numpy())
+                columns[column] = 'numbers'
+        manifest['tables'][table] = {'rows': len(df), 'columns': columns}
+    # the manifest is written last, so a folder without one is never read, and replaced whole, so workers opening the
+    # store while another one saves it read either the previous manifest or the new one
+    save_json(os.path.join(folder, MANIFEST_FILE), manifest)
+
+
+class MappedStore:
+    """
+    An EventStore whose tables are assembled from memory-mapped columns when first used. The tables' columns are
+    read-only.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, MANIFEST_FILE)) as manifest_file:
+            self.manifest = json.load(manifest_file)
+        self._columns = {}
+        self._tables = {}
+
+    def column(self, table, column):
+        """Returns a column of a table: a memory-mapped array, or a Categorical for label columns"""
+        key = (table, column)
+        if key not in self._columns:
+            # a plain array view of the mapped file, so results computed from it aren't memmaps too
+            values = np.load(os.path.join(self.folder, f'{table}.{column}.npy'), mmap_mode='r').view(np.ndarray)
+            if self.manifest['tables'][table]['columns'][column] == 'labels':
+                # the dictionary of labels is only read now, when the column is first used
+                with open(os.path.join(self.folder, f'{table}.{column}.json')) as dictionary:
+                    categories = json.load(dictionary)
+                values = pd.Categorical.from_codes(values, categories)
+            self._columns[key] = values
+        return self._columns[key]
+
+    def table(self, table):
+        """Returns a table as a DataFrame of views of its columns"""
+        if table not in self._tables:
+            columns = self.manifest['tables'][table]['columns']
+            self._tables[table] = pd.DataFrame({column: self.column(table, column) for column in columns}, copy=False)
+        return self._tables[table]
+
+    def rows(self, table):
+        """Returns the number of rows of a table, without loading it"""
+        return self.manifest['tables'][table]['rows']
+
+    def fingerprint(self):
+        """Returns the content hash of the tables, recorded when they were saved so that no column is read"""
+        return self.manifest['fingerprint']
+
+    @property
+    def events(self):
+        return self.table('events')
+
+    @property
+    def event_works(self):
+        return self.table('event_works')
+
+    @property
+    def composer_nationalities(self):
+        return self.table('composer_nationalities')
+
+
+def load_or_build_mapped_store(store_folder=STORE_FOLDER):
+    """
+    Opens the memory-mapped columns of the store in store_folder, saving them from the Parquet tables first if they
+    don't exist yet or were made from other versions of the tables
+    """
+    folder = columns_folder(store_folder)
+    versions = source_versions(store_folder)
+    try:
+        store = MappedStore(folder)
+        # columns saved before the manifest recorded a content hash are saved again
+        if store.manifest['sources'] == versions and 'fingerprint' in store.manifest:
+            return store
+    except (FileNotFoundError, json.JSONDecodeError):
+        # a manifest cut short by a crash is saved again too
+        pass
+    save_mapped_store(EventStore.load(store_folder), folder, versions)
+    return MappedStore(folder)
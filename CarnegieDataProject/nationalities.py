@@ -0,0 +1,69 @@
+"""
+Composer nationalities as a normalized mapping table, with one row per (composer ID, nationality) pair.
+
+The nationalities were first stored in two formats:
+* Data/composers_nationalities.pkl, created by store_nationalities, with a list of nationalities per composer
+* Labs/CarnegieData/nationalities_new.csv, where each composer's nationalities are the text of a pandas Series,
+  e.g. "0    Archduchy of Austria\n1       Holy Roman Empire"
+
+Both are parsed once into the same mapping table, which can then be joined onto any table with a composer column in a
+single merge.
+"""
+
+import numpy as np
+import pandas as pd
+
+from event_store import STATELESS, carnegie_id
+
+# default locations, relative to the CarnegieDataProject folder
+NATIONALITIES_PKL = 'Data/composers_nationalities.pkl'
+NATIONALITIES_LIST = 'Data/nationalities_list.csv'
+
+
+def parse_series_text(texts, known_labels=()):
+    """
+    Parses a Series of Series texts ("0    Poland\n1    Austria") into a Series with one label per row, keeping the
+    index of the text each label came from. Labels that pandas shortened with "..." are replaced by the one entry of
+    known_labels that starts the same way, if there is exactly one.
+    """
+    labels = texts.str.split('\n').explode()
+    # remove the Series index and the padding in front of each label
+    labels = labels.str.replace(r'^\d+\s+', '', regex=True).str.strip()
+    labels = labels[labels != '']
+
+    shortened = labels.str.endswith('...')
+    if shortened.any():
+        known_labels = pd.Series(sorted(set(known_labels)), dtype=str)
+        for position in np.flatnonzero(shortened.to_numpy()):
+            candidates = known_labels[known_labels.str.startswith(labels.iat[position][:-3])]
+            if len(candidates) == 1:
+                labels.iat[position] = candidates.iat[0]
+    return labels
+
+
+def read_nationality_pairs(path=NATIONALITIES_PKL, known_labels_path=NATIONALITIES_LIST):
+    """
+    Reads the nationalities of every composer from the PKL created by store_nationalities or from a CSV in the format
+    of nationalities_new.csv, and returns a DataFrame with one row per (composer ID, nationality) pair
+    """
+    if path.endswith('.pkl'):
+        nationalities_df = pd.read_pickle(path)[['composer', 'nationalities']]
+        labels = nationalities_df['nationalities'].explode().dropna()
+    else:
+        nationalities_df = pd.read_csv(path, usecols=['composer', 'nationalities'])
+        labels = parse_series_text(nationalities_df['nationalities'].dropna(),
+                                   pd.read_csv(known_labels_path)['Nation'])
+    composers = nationalities_df['composer'].loc[labels.index]
+    pairs = pd.DataFrame({'composer': carnegie_id(composers), 'nationality': labels.to_numpy()})
+    return pairs.drop_duplicates(ignore_index=True)
+
+
+def join_nationalities(df, pairs, composer_column='composer'):
+    """
+    Joins the nationality pairs onto df in a single merge, giving one row per row of df and nationality of its composer
+    (composers without a known nationality are stateless). The nationality column is categorical.
+    """
+    joined = df.merge(pairs.rename(columns={'composer': composer_column}), on=composer_column, how='left')
+    joined['nationality'] = joined['nationality'].fillna(STATELESS).astype('category')
+    return joined
+
@@ -0,0 +1,178 @@
+"""
+Precomputed work and composer options for the app's pickers, with a prefix search over the words of each option.
+
+The display label of every work ("Roxanne by Sting (#12345)") and composer ("Sting (#12345)") is built once from the
+catalog tables of the event store, along with its ID and the number of events it was performed at. Options are
+sorted by that number, so the most performed options come first.
+
+Each label is split into lowercase words without accents, and every word points to the options it appears in (the
+same CSR layout as EventIndex). A search keeps the options that have a word starting with each word of the query, so
+"beet sym" finds "Symphony No. 9 in D minor, Op. 125 by Ludwig van Beethoven". Because words are sorted, all the words
+that start with a prefix are next to each other, and their options are one slice of the postings array.
+
+Labels and words are stored as UTF-8 bytes with an offsets array, so the whole catalog fits in one small compressed
+.npz file. The file also records a content hash of the catalog tables and of the store the event counts came from, so
+that a rebuild can tell if the options are out of date.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from event_store import STORE_FOLDER, table_fingerprint
+
+# default location, relative to the CarnegieDataProject folder
+OPTIONS_PATH = 'Data/options.npz'
+
+OPTION_KINDS = ('work', 'composer')
+
+# number of matches shown in a picker
+DEFAULT_LIMIT = 50
+
+# accents left as separate characters after NFKD normalization
+COMBINING_MARKS = '[\u0300-\u036f]'
+
+ARRAY_NAMES = ('ids', 'events', 'label_bytes', 'label_offsets', 'word_bytes', 'word_offsets', 'offsets', 'postings')
+
+
+def split_words(texts):
+    """Splits a Series of texts into a Series of lowercase words without accents, keeping the index of each text"""
+    folded = texts.fillna('').str.normalize('NFKD').str.replace(COMBINING_MARKS, '', regex=True).str.lower()
+    return folded.str.findall(r'\w+').explode().dropna()
+
+
+def pack_strings(strings):
+    """Packs strings into an array of their UTF-8 bytes and an array of where each string starts"""
+    encoded = [string.encode() for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(data, offsets):
+    """Reverses pack_strings"""
+    data = data.tobytes()
+    return [data[start:stop].decode() for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def read_catalogs(store_folder=STORE_FOLDER):
+    """Returns the works and composers catalog tables of the store"""
+    return {table: pd.read_parquet(os.path.join(store_folder, f'{table}.parquet')) for table in ('works', 'composers')}
+
+
+def source_fingerprint(index, catalogs):
+    """
+    Returns a content hash of what options are built from: the catalog tables, and the store the event counts of an
+    EventIndex came from
+    """
+    return hashlib.sha256(f'{index.store_fingerprint}:{table_fingerprint(catalogs)}'.encode()).hexdigest()
+
+
+def option_labels(catalogs):
+    """Returns the IDs and display labels of every work and composer in the catalog tables from read_catalogs()"""
+    works, composers = catalogs['works'], catalogs['composers']
+    # works without a named composer show Unknown instead
+    composer_labels = works['composer_label'].fillna('').replace('', 'Unknown')
+    work_labels = works['title'].fillna('Untitled') + ' by ' + composer_labels + ' (#' + works['work'].astype(str) + ')'
+    composer_labels = composers['label'].fillna('Unknown') + ' (#' + composers['composer'].astype(str) + ')'
+    return {'work': (works['work'].to_numpy(np.int32), work_labels.tolist()),
+            'composer': (composers['composer'].to_numpy(np.int32), composer_labels.tolist())}
+
+
+class OptionSearch:
+    """The work and composer options, most performed first, with a prefix search over the words of their labels"""
+
+    def __init__(self, options, source_fingerprint=None):
+        # options maps each kind to a dict of the arrays in ARRAY_NAMES
+        self.options = options
+        # the content hash of the catalog tables and store the options were built from (see source_fingerprint)
+        self.source_fingerprint = source_fingerprint
+        # the labels and words are decoded once, the words into a sorted array of strings for searchsorted
+        self.labels = {kind: unpack_strings(arrays['label_bytes'], arrays['label_offsets'])
+                       for kind, arrays in options.items()}
+        self.words = {kind: np.array(unpack_strings(arrays['word_bytes'], arrays['word_offsets']), dtype=str)
+                      for kind, arrays in options.items()}
+
+    @classmethod
+    def from_store(cls, index, store_folder=STORE_FOLDER):
+        """Builds the options from the catalog tables of the store, ranked by the event counts in an EventIndex"""
+        catalogs = read_catalogs(store_folder)
+        options = {}
+        for kind, (ids, labels) in option_labels(catalogs).items():
+            # number of events each option was performed at, 0 if it was never performed
+            keys = index.postings[kind]['keys']
+            counts = np.diff(index.postings[kind]['offsets'])
+            events = np.zeros(len(ids), dtype=counts.dtype)
+            # an index without postings for kind (such as one of an empty store) has no keys to look ids up in
+            if len(keys):
+                positions = np.minimum(np.searchsorted(keys, ids), len(keys) - 1)
+                events = np.where(keys[positions] == ids, counts[positions], 0)
+
+            # most performed first, then alphabetical
+            labels = pd.Series(labels)
+            order = np.lexsort((labels.to_numpy(), -events))
+            labels = labels.iloc[order].reset_index(drop=True)
+
+            # one entry per (word, option), sorted by word and then by option
+            words = split_words(labels)
+            pairs = pd.DataFrame({'word': words.to_numpy(), 'row': words.index.to_numpy(np.int32)})
+            pairs = pairs.drop_duplicates().sort_values(['word', 'row'])
+            vocabulary, starts = np.unique(pairs['word'].to_numpy(str), return_index=True)
+
+            label_bytes, label_offsets = pack_strings(labels)
+            word_bytes, word_offsets = pack_strings(vocabulary)
+            options[kind] = {'ids': ids[order], 'events': events[order].astype(np.int32),
+                             'label_bytes': label_bytes, 'label_offsets': label_offsets,
+                             'word_bytes': word_bytes, 'word_offsets': word_offsets,
+                             'offsets': np.append(starts, len(pairs)).astype(np.int64),
+                             'postings': pairs['row'].to_numpy(np.int32)}
+        return cls(options, source_fingerprint(index, catalogs))
+
+    def save(self, options_path=OPTIONS_PATH):
+        """Stores the options as a single compressed .npz file"""
+        np.savez_compressed(options_path, source_fingerprint=np.array([self.source_fingerprint]),
+                            **{f'{kind}_{name}': array for kind, arrays in self.options.items()
+                               for name, array in arrays.items()})
+
+    @classmethod
+    def load(cls, options_path=OPTIONS_PATH):
+        """Loads options previously saved with save()"""
+        with np.load(options_path) as arrays:
+            # options saved before they recorded the content hash of their sources are always out of date
+            fingerprint = str(arrays['source_fingerprint'][0]) if 'source_fingerprint' in arrays else None
+            return cls({kind: {name: arrays[f'{kind}_{name}'] for name in ARRAY_NAMES} for kind in OPTION_KINDS},
+                       fingerprint)
+
+    def matches(self, index, store_folder=STORE_FOLDER):
+        """
+        Returns True if the options were built from the same catalog tables as those of the store in store_folder, and
+        from the same store as index
+        """
+        return source_fingerprint(index, read_catalogs(store_folder)) == self.source_fingerprint
+
+    def matching_rows(self, kind, query):
+        """Returns the positions of the options of kind with a word starting with each word of query, in rank order"""
+        arrays = self.options[kind]
+        rows = None
+        for word in split_words(pd.Series([query])):
+            # the words starting with word sit between word and word followed by the highest character
+            start, stop = np.searchsorted(self.words[kind], [word, word + '\U0010ffff'])
+            matches = np.unique(arrays['postings'][arrays['offsets'][start]:arrays['offsets'][stop]])
+            rows = matches if rows is None else np.intersect1d(rows, matches, assume_unique=True)
+        # an empty query matches every option
+        return np.arange(len(arrays['ids'])) if rows is None else rows
+
+    def search(self, kind, query, limit=DEFAULT_LIMIT):
+        """Returns the labels of the top limit options of kind matching query, most performed first"""
+        return [self.labels[kind][row] for row in self.matching_rows(kind, query)[:limit].tolist()]
+
+    def labels_of(self, kind, ids):
+        """Returns the labels of the options of kind with the given IDs, as "(#ID)" for IDs missing from the catalog"""
+        option_ids = self.options[kind]['ids']
+        order = np.argsort(option_ids)
+        positions = np.minimum(np.searchsorted(option_ids, ids, sorter=order), len(order) - 1)
+        rows = order[positions]
+        return [self.labels[kind][row] if option_ids[row] == option else f'(#{option})'
+                for row, option in zip(rows.tolist(), np.asarray(ids).tolist())]
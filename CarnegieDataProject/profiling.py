@@ -0,0 +1,235 @@
+"""
+Timing spans for the app's charts.
+
+Each chart drawn by the app is traced as a list of spans, one per step:
+* load: loading the event store, its index and the year cubes (only slow the first time, then a cache hit)
+* query: computing the frequencies, with the engine or from the query cache
+* aggregate: building the table the chart is drawn from
+* render: building the Plotly figure and sending it to the browser
+Every span records its duration, the number of rows it scanned, whether it was answered from a cache and, when memory
+tracing is on, the peak memory allocated while it ran (traced by tracemalloc, which counts the allocations of the
+whole process and slows it down, so it is only turned on by the app's debug panel). tracemalloc is shared by every
+session tracing memory: it runs from the first trace that needs it to the last. Its peak is process-wide too, so a span
+only records one while no other session is tracing memory, and records None otherwise.
+
+The engine reports the rows it scans with record_rows(), which adds them to the innermost span open in the thread, and
+does nothing when no chart is being traced.
+
+The app shows the spans of each chart in its debug panel, and appends every trace to a JSON lines query log. Once the
+log reaches QUERY_LOG_MAX_BYTES, it is moved to the same path with a .1 suffix (replacing the previous one) and a new
+log is started. To rerun the logged queries and find those that have become slower, run:
+`python replay_query_log.py`
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# default location of the query log, relative to the CarnegieDataProject folder
+QUERY_LOG_PATH = 'Data/query_log.jsonl'
+
+# size at which the query log is rotated
+QUERY_LOG_MAX_BYTES = 16 * 1024 * 1024
+
+# the steps of a chart, which together make up its duration
+TOP_LEVEL_SPANS = ('load', 'query', 'aggregate', 'render')
+
+# the trace of the chart being drawn by each thread
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+class MemoryTracing:
+    """
+    Starts tracemalloc for the first trace measuring memory and stops it after the last, and tells spans whether they
+    can measure a peak, which they can only do while a single trace is measuring memory
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        # number of traces that started measuring memory so far, for spans to tell if another one started since they did
+        self.started = 0
+        self.started_tracemalloc = False
+
+    def start(self):
+        with self.lock:
+            if self.active == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracemalloc = True
+            self.active += 1
+            self.started += 1
+
+    def stop(self):
+        with self.lock:
+            self.active -= 1
+            if self.active == 0 and self.started_tracemalloc:
+                tracemalloc.stop()
+                self.started_tracemalloc = False
+
+    def exclusive(self):
+        """Returns the number of traces started so far if only one trace is measuring memory, and None otherwise"""
+        with self.lock:
+            return self.started if self.active == 1 and tracemalloc.is_tracing() else None
+
+
+_memory_tracing = MemoryTracing()
+
+
+class Span:
+    """The duration, rows scanned, cache use and peak memory of one step of a chart"""
+
+    def __init__(self, name):
+        self.name = name
+        self.duration = 0.0
+        self.rows_scanned = 0
+        # 'hit', 'miss', or None for steps that don't use a cache
+        self.cache = None
+        # None when memory isn't traced, or another session traced it while the span ran
+        self.peak_memory = None
+        # memory allocated when the span started, when tracing memory
+        self.base_memory = 0
+
+    def to_dict(self):
+        return {'span': self.name, 'duration_ms': round(self.duration * 1000, 3), 'rows_scanned': self.rows_scanned,
+                'cache': self.cache, 'peak_memory': self.peak_memory}
+
+
+class Trace:
+    """
+    The spans of one chart, opened with span(). Use as a context manager, so that the spans opened by the thread
+    while it is active (including record_rows() calls from the engine) are added to it.
+    """
+
+    def __init__(self, query, trace_memory=False):
+        # the attribute, values, normalize and compare inputs of the chart
+        self.query = query
+        self.trace_memory = trace_memory
+        self.started_at = datetime.now(timezone.utc)
+        self.spans = []
+        self.open_spans = []
+
+    def __enter__(self):
+        _local.trace = self
+        if self.trace_memory:
+            _memory_tracing.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.trace = None
+        if self.trace_memory:
+            _memory_tracing.stop()
+
+    @contextmanager
+    def span(self, name):
+        """Times the code run inside it as a span named name"""
+        span = Span(name)
+        parent = self.open_spans[-1] if self.open_spans else None
+        # the peak is only measured while no other session could reset it
+        tracing = _memory_tracing.exclusive() if self.trace_memory else None
+        if tracing is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            # the peak is reset for this span, so the parent's peak so far is kept first
+            if parent is not None and parent.peak_memory is not None:
+                parent.peak_memory = max(parent.peak_memory, peak - parent.base_memory)
+            tracemalloc.reset_peak()
+            span.base_memory = current
+            span.peak_memory = 0
+        self.spans.append(span)
+        self.open_spans.append(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - start
+            self.open_spans.pop()
+            if tracing is not None and _memory_tracing.exclusive() != tracing:
+                # another session started tracing memory while the span ran, so the peak isn't this chart's alone
+                span.peak_memory = None
+            elif tracing is not None:
+                span.peak_memory = max(span.peak_memory, tracemalloc.get_traced_memory()[1] - span.base_memory)
+                if parent is not None and parent.peak_memory is not None:
+                    parent.peak_memory = max(parent.peak_memory,
+                                             span.base_memory - parent.base_memory + span.peak_memory)
+                tracemalloc.reset_peak()
+
+    def total_duration(self):
+        """Returns the duration of the chart, the sum of its load, query, aggregate and render spans"""
+        return sum(span.duration for span in self.spans if span.name in TOP_LEVEL_SPANS)
+
+    def to_dict(self):
+        return {'time': self.started_at.isoformat(), 'query': self.query,
+                'spans': [span.to_dict() for span in self.spans]}
+
+
+def current_trace():
+    """Returns the trace active in this thread, or None"""
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def span(name):
+    """Times the code run inside it as a span of the active trace, or times nothing if no chart is being traced"""
+    trace = current_trace()
+    if trace is None:
+        yield Span(name)
+    else:
+        with trace.span(name) as opened:
+            yield opened
+
+
+def current_span():
+    """Returns the innermost span open in this thread, or None"""
+    trace = current_trace()
+    return trace.open_spans[-1] if trace is not None and trace.open_spans else None
+
+
+def record_rows(count):
+    """Adds count to the rows scanned by the innermost open span"""
+    opened = current_span()
+    if opened is not None:
+        opened.rows_scanned += int(count)
+
+
+def record_cache(hit):
+    """Records whether the innermost open span was answered from a cache"""
+    opened = current_span()
+    if opened is not None:
+        opened.cache = 'hit' if hit else 'miss'
+
+
+def rotated_log_path(log_path=QUERY_LOG_PATH):
+    """Returns the path the query log at log_path is moved to when it is rotated"""
+    return f'{log_path}.1'
+
+
+def write_trace(trace, log_path=QUERY_LOG_PATH, max_bytes=QUERY_LOG_MAX_BYTES):
+    """
+    Appends a trace to the JSON lines query log at log_path, first moving the log to its rotated path if the trace would
+    take it over max_bytes
+    """
+    line = json.dumps(trace.to_dict()) + '\n'
+    # sessions draw charts from several threads at once
+    with _log_lock:
+        try:
+            if os.path.getsize(log_path) + len(line) > max_bytes:
+                os.replace(log_path, rotated_log_path(log_path))
+        except FileNotFoundError:
+            pass
+        with open(log_path, 'a') as log:
+            log.write(line)
+
+
+def read_query_log(log_path=QUERY_LOG_PATH):
+    """Returns the traces written to the query log at log_path, and to its rotated log before it, as dicts"""
+    traces = []
+    for path in (rotated_log_path(log_path), log_path):
+        if path != log_path and not os.path.exists(path):
+            continue
+        with open(path) as log:
+            traces.extend(json.loads(line) for line in log if line.strip())
+    return traces
@@ -0,0 +1,67 @@
+"""
+A bounded, thread-safe least-recently-used cache for query results.
+
+Streamlit reruns app.py on every widget interaction and serves every session from the same process, so the cache is
+created once per process and shared by all sessions. Entries are evicted once the results take up more than a set
+number of bytes, starting with the least recently used.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# default memory budget for cached results
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def result_size(result):
+    """Estimates the number of bytes taken up by a query result"""
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    elif isinstance(result, (pd.Series, pd.DataFrame)):
+        return int(np.sum(result.memory_usage(deep=True)))
+    return sys.getsizeof(result)
+
+
+class QueryCache:
+    """Caches query results by key, evicting the least recently used results once they exceed max_bytes"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached result for key, or calls compute() and caches its result if key isn't cached"""
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+            self.misses += 1
+
+        # computed outside the lock so that other sessions aren't blocked by a slow query
+        result = compute()
+        size = result_size(result)
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = (result, size)
+                self.bytes += size
+                # evict the least recently used results, always keeping the newest one
+                while self.bytes > self.max_bytes and len(self.entries) > 1:
+                    _, evicted_size = self.entries.popitem(last=False)[1]
+                    self.bytes -= evicted_size
+        return result
+
+    def clear(self):
+        """Removes every cached result"""
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
@@ -0,0 +1,112 @@
+"""
+Reruns the queries of the app's query log against the current event store, to find queries that have become slower.
+
+Each distinct query in the log (attribute, values, normalize and whether it was a comparison) is run a few times with
+the FrequencyEngine, without the query cache, and its fastest time is compared with the fastest time it took when it
+was logged. Only logged runs that missed the query cache are counted, since a cache hit says nothing about the engine.
+A query is reported as a regression if it is now more than --threshold times slower, and slower by more than
+MIN_REGRESSION_MS, below which timings are mostly noise. The number of rows each query scanned is shown too, since a
+jump in rows usually explains a jump in time.
+
+To replay the log written by the app (with CarnegieDataProject as the working directory):
+`python replay_query_log.py`
+The exit status is 1 if any query regressed, so the replay can be run as a check after changing the engine.
+"""
+
+import argparse
+import json
+import sys
+
+from event_index import INDEX_PATH, load_or_build_index
+from event_store import STORE_FOLDER
+from frequency import FrequencyEngine
+from mapped_store import load_or_build_mapped_store
+from profiling import QUERY_LOG_PATH, Trace, read_query_log
+from year_cubes import CUBES_PATH, load_or_build_cubes
+
+# default ratio of replayed to logged time above which a query counts as a regression
+REGRESSION_THRESHOLD = 1.5
+
+# smallest slowdown counted as a regression, in milliseconds
+MIN_REGRESSION_MS = 1.0
+
+
+def logged_queries(traces):
+    """
+    Returns a dict mapping each distinct query of the traces (as a JSON string) to its fastest logged query span that
+    missed the cache, or None if every logged run was a cache hit
+    """
+    queries = {}
+    for trace in traces:
+        key = json.dumps(trace['query'], sort_keys=True)
+        fastest = queries.get(key)
+        for logged in trace['spans']:
+            if logged['span'] == 'query' and logged['cache'] != 'hit':
+                if fastest is None or logged['duration_ms'] < fastest['duration_ms']:
+                    fastest = logged
+        queries[key] = fastest
+    return queries
+
+
+def run_query(engine, query):
+    """Runs a logged query with the engine, the way the app does without its cache"""
+    if query['compare']:
+        return engine.comparison(query['attribute'], query['values'], query['normalize'])
+    return engine.frequencies(query['attribute'], query['values'][0], query['normalize'])
+
+
+def replay_query(engine, query, repeat):
+    """Returns the fastest query span of repeat runs of query"""
+    fastest = None
+    for _ in range(repeat):
+        with Trace(query) as trace, trace.span('query') as replayed:
+            run_query(engine, query)
+        if fastest is None or replayed.duration < fastest.duration:
+            fastest = replayed
+    return fastest.to_dict()
+
+
+def describe(query):
+    """Returns a short description of a query, for the report"""
+    values = ' | '.join(', '.join(value) if isinstance(value, list) else value for value in query['values'])
+    kind = 'compare' if query['compare'] else 'single'
+    return f'{query["attribute"]:<12}{kind:<8}{"relative" if query["normalize"] else "absolute":<9}{values[:50]}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay the app's query log to find queries that became slower.")
+    parser.add_argument('log', nargs='?', default=QUERY_LOG_PATH, help='query log written by the app')
+    parser.add_argument('--store', default=STORE_FOLDER, help='folder of the event store')
+    parser.add_argument('--index', default=INDEX_PATH, help='path of the event index')
+    parser.add_argument('--cubes', default=CUBES_PATH, help='path of the year cubes')
+    parser.add_argument('--no-cubes', action='store_true', help='answer every query from the index')
+    parser.add_argument('--repeat', type=int, default=5, help='number of times each query is run')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='ratio of replayed to logged time above which a query is a regression')
+    args = parser.parse_args()
+
+    # the index and cubes are rebuilt if they are older than the store, so that the replay times what the app would
+    store = load_or_build_mapped_store(args.store)
+    engine = FrequencyEngine(store, load_or_build_index(store, args.index))
+    if not args.no_cubes:
+        engine.cubes = load_or_build_cubes(engine, args.cubes)
+
+    regressions = 0
+    print(f'{"query":<79}{"logged":>10}{"replayed":>10}{"ratio":>7}{"rows":>18}')
+    for key, logged in logged_queries(read_query_log(args.log)).items():
+        query = json.loads(key)
+        replayed = replay_query(engine, query, args.repeat)
+        if logged is None:
+            print(f'{describe(query):<79}{"-":>10}{replayed["duration_ms"]:8.2f}ms{"-":>7}'
+                  f'{replayed["rows_scanned"]:>18}')
+            continue
+        ratio = replayed['duration_ms'] / logged['duration_ms'] if logged['duration_ms'] else float('inf')
+        regressed = (ratio > args.threshold
+                     and replayed['duration_ms'] - logged['duration_ms'] > MIN_REGRESSION_MS)
+        regressions += regressed
+        rows = f'{logged["rows_scanned"]} -> {replayed["rows_scanned"]}'
+        print(f'{describe(query):<79}{logged["duration_ms"]:8.2f}ms{replayed["duration_ms"]:8.2f}ms{ratio:7.2f}'
+              f'{rows:>18}{"  REGRESSION" if regressed else ""}')
+
+    print(f'{regressions} regressions')
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,45 @@
+"""
+Shared fixtures of the CarnegieDataProject tests.
+
+The modules are run with CarnegieDataProject as the working directory, so the tests are too, and read a small sample of
+the checked-in AllEvents shards. Stores, indexes and cubes built from the sample go in temporary folders.
+
+To run the tests (from CarnegieDataProject):
+`python -m pytest tests`
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+PROJECT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(PROJECT_FOLDER)
+sys.path.insert(0, PROJECT_FOLDER)
+
+from benchmark_queries import build_sample_store  # noqa: E402
+from event_store import EVENTS_FOLDER, shard_paths  # noqa: E402
+from frequency_api import load_engine  # noqa: E402
+from ingest import read_event_chunks  # noqa: E402
+
+# number of shards in the sample store
+SAMPLE_SHARDS = 2
+
+
+@pytest.fixture(scope='session')
+def sample_events():
+    """The raw rows of the first shard"""
+    return pd.concat(read_event_chunks(shard_paths(EVENTS_FOLDER)[:1]), ignore_index=True)
+
+
+@pytest.fixture(scope='session')
+def sample_paths(tmp_path_factory):
+    """The store folder, index path and cubes path of a store built from the first SAMPLE_SHARDS shards"""
+    return build_sample_store(EVENTS_FOLDER, SAMPLE_SHARDS, str(tmp_path_factory.mktemp('sample')))
+
+
+@pytest.fixture(scope='session')
+def sample_engine(sample_paths):
+    """A FrequencyEngine over the sample store, loaded the way the app and the API load it"""
+    return load_engine(*sample_paths)
@@ -0,0 +1,61 @@
+"""
+Benchmarks of the headless query API on the sample store, the cases of benchmark_queries.py as pytest-benchmark tests:
+loading the engine from a cold store, single-value queries once it is loaded, and multi-value queries.
+
+To compare runs, save one with `python -m pytest tests/test_benchmark_queries.py --benchmark-autosave` and compare a
+later one to it with `--benchmark-compare`.
+"""
+
+import json
+
+import pytest
+
+from benchmark_queries import sample_values
+from frequency_api import load_engine, query_frequencies
+
+# the benchmark fixture comes from the pytest-benchmark plugin
+pytest.importorskip('pytest_benchmark')
+
+ATTRIBUTES = ('Genre', 'Work', 'Composer', 'Nationality')
+
+
+@pytest.fixture(scope='module')
+def values(sample_engine):
+    return sample_values(sample_engine, 10)
+
+
+def answer(engine, attribute, attribute_values, normalize=False):
+    """Answers a query the way the API does for each request"""
+    return json.dumps(query_frequencies(engine, attribute, attribute_values, normalize))
+
+
+@pytest.mark.benchmark(group='cold load')
+def test_cold_load(benchmark, sample_paths):
+    # the store, index and cubes are opened from their files each time
+    engine = benchmark(load_engine, *sample_paths)
+    assert engine.cubes is not None
+
+
+@pytest.mark.benchmark(group='warm query')
+@pytest.mark.parametrize('attribute', ATTRIBUTES)
+def test_warm_query(benchmark, sample_engine, values, attribute):
+    queries = [[value] for value in values[attribute]]
+    # the first query of each attribute builds what the engine caches for it, so it isn't timed
+    answer(sample_engine, attribute, queries[0])
+
+    def run():
+        return [answer(sample_engine, attribute, value) for value in queries]
+
+    assert len(benchmark(run)) == len(queries)
+
+
+@pytest.mark.benchmark(group='multi-value query')
+@pytest.mark.parametrize('count', [2, 5, 10])
+def test_multi_value_query(benchmark, sample_engine, values, count):
+    def run():
+        return [json.loads(answer(sample_engine, attribute, values[attribute][:count], normalize))
+                for attribute in ATTRIBUTES for normalize in (False, True)]
+
+    responses = benchmark(run)
+    assert [len(response['series']) for response in responses] == [
+        min(count, len(values[attribute])) for attribute in ATTRIBUTES for _ in (False, True)]
@@ -0,0 +1,46 @@
+"""Tests of the exact-match lookups of EventIndex"""
+
+import numpy as np
+
+from event_index import INDEXED_COLUMNS, EventIndex
+
+
+def make_index(column_postings):
+    """Builds an index from {column: {key: [(event, year), ...]}}, with empty postings for the other columns"""
+    postings = {}
+    for column in INDEXED_COLUMNS:
+        entries = column_postings.get(column, {})
+        keys = sorted(entries)
+        offsets = np.cumsum([0] + [len(entries[key]) for key in keys]).astype(np.int64)
+        pairs = [pair for key in keys for pair in entries[key]]
+        postings[column] = {'keys': np.array(keys, dtype=str if column == 'nationality' else np.int32),
+                            'offsets': offsets,
+                            'events': np.array([event for event, year in pairs], dtype=np.int32),
+                            'years': np.array([year for event, year in pairs], dtype=np.int16)}
+    return EventIndex(postings)
+
+
+def test_lookup_matches_ids_exactly():
+    index = make_index({'work': {12: [(1, 1900)], 123: [(2, 1901)], 1234: [(3, 1902)]}})
+    events, years = index.lookup('work', [123])
+    assert events.tolist() == [2]
+    assert years.tolist() == [1901]
+
+
+def test_lookup_unions_several_values():
+    index = make_index({'composer': {5: [(1, 1900), (4, 1903)], 7: [(1, 1900), (2, 1901)]}})
+    events, years = index.lookup('composer', [5, 7, 99])
+    assert events.tolist() == [1, 2, 4]
+    assert years.tolist() == [1900, 1901, 1903]
+
+
+def test_lookup_of_missing_values_is_empty():
+    index = make_index({'work': {12: [(1, 1900)]}})
+    assert len(index.lookup('work', [13])[0]) == 0
+    assert len(index.lookup('work', [99999])[0]) == 0
+
+
+def test_lookup_in_a_column_without_postings():
+    index = make_index({})
+    events, years = index.lookup('nationality', ['Germany'])
+    assert len(events) == 0 and len(years) == 0
@@ -0,0 +1,71 @@
+"""Checks that the event index, year cubes and co-occurrence matrices tell when the store they were built from has changed"""
+
+import pytest
+
+from cooccurrence import CoOccurrence, load_or_build_cooccurrence
+from event_index import EventIndex, load_or_build_index
+from event_store import EventStore
+from frequency import FrequencyEngine
+from mapped_store import MappedStore, columns_folder
+from year_cubes import YearCubes, load_or_build_cubes
+
+
+@pytest.fixture
+def store(sample_paths):
+    return EventStore.load(sample_paths[0])
+
+
+@pytest.fixture
+def edited_store(store):
+    """The sample store with the work of one performance changed, so that no table changes size"""
+    edited = EventStore(store.events, store.event_works.copy(), store.composer_nationalities)
+    works = edited.event_works['work']
+    edited.event_works.loc[0, 'work'] = works[works != works[0]].iloc[0]
+    return edited
+
+
+def test_mapped_columns_have_the_fingerprint_of_their_tables(sample_paths, store):
+    assert MappedStore(columns_folder(sample_paths[0])).fingerprint() == store.fingerprint()
+
+
+def test_edits_change_the_fingerprint(store, edited_store):
+    assert [edited_store.rows(table) for table in ('events', 'event_works')] == \
+        [store.rows(table) for table in ('events', 'event_works')]
+    assert edited_store.fingerprint() != store.fingerprint()
+
+
+def test_cubes_are_rebuilt_for_an_edited_store(sample_paths, sample_engine, store, edited_store, tmp_path):
+    cubes = YearCubes.load(sample_paths[2])
+    assert cubes.matches(sample_engine.store)
+    assert cubes.matches(store)
+    assert not cubes.matches(edited_store)
+
+    cubes_path = str(tmp_path / 'year_cubes.npz')
+    YearCubes.from_engine(FrequencyEngine(store)).save(cubes_path)
+    rebuilt = load_or_build_cubes(FrequencyEngine(edited_store), cubes_path)
+    assert rebuilt.matches(edited_store)
+    assert YearCubes.load(cubes_path).matches(edited_store)
+
+
+def test_cooccurrence_is_rebuilt_for_an_edited_store(store, edited_store, tmp_path):
+    cooccurrence_path = str(tmp_path / 'cooccurrence.npz')
+    CoOccurrence.from_store(store).save(cooccurrence_path)
+    assert CoOccurrence.load(cooccurrence_path).matches(store)
+    assert not CoOccurrence.load(cooccurrence_path).matches(edited_store)
+
+    rebuilt = load_or_build_cooccurrence(edited_store, cooccurrence_path)
+    assert rebuilt.matches(edited_store)
+    assert CoOccurrence.load(cooccurrence_path).matches(edited_store)
+
+
+def test_the_index_is_rebuilt_for_an_edited_store(sample_paths, store, edited_store, tmp_path):
+    assert EventIndex.load(sample_paths[1]).matches(store)
+
+    index_path = str(tmp_path / 'event_index.npz')
+    EventIndex.from_store(store).save(index_path)
+    assert not EventIndex.load(index_path).matches(edited_store)
+    rebuilt = load_or_build_index(edited_store, index_path)
+    assert rebuilt.matches(edited_store)
+    edited_row = edited_store.event_works.loc[0]
+    assert edited_row['event'] in rebuilt.lookup('work', [edited_row['work']])[0]
+    assert EventIndex.load(index_path).matches(edited_store)
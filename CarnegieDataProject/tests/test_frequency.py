@@ -0,0 +1,46 @@
+"""Checks that FrequencyEngine gives the same results as the previous nested-DataFrame search (benchmark_frequency.py)"""
+
+import numpy as np
+import pytest
+
+from benchmark_frequency import legacy_event_data, legacy_event_frequency_list, sample_queries
+from event_store import EventStore
+from frequency import FrequencyEngine
+from nationalities import NATIONALITIES_PKL, read_nationality_pairs
+
+# the old search goes through every event for every year, so it is run on the first events of the sample only
+LEGACY_EVENTS = 400
+
+
+@pytest.fixture(scope='module')
+def legacy_rows(sample_events):
+    """The rows of the first LEGACY_EVENTS events of the sample"""
+    events = sample_events['event'].drop_duplicates().iloc[:LEGACY_EVENTS]
+    return sample_events[sample_events['event'].isin(events)].reset_index(drop=True)
+
+
+@pytest.fixture(scope='module')
+def legacy_df(legacy_rows):
+    return legacy_event_data(legacy_rows, NATIONALITIES_PKL)
+
+
+@pytest.fixture(scope='module')
+def engine(legacy_rows):
+    return FrequencyEngine(EventStore.from_events(legacy_rows, read_nationality_pairs(NATIONALITIES_PKL)))
+
+
+@pytest.mark.parametrize('normalize', [False, True])
+def test_engine_matches_legacy_search(legacy_rows, legacy_df, engine, normalize):
+    years = sorted(set(legacy_df['year']))
+    for attribute, value in sample_queries(legacy_rows, per_attribute=2):
+        expected = legacy_event_frequency_list(legacy_df, years, attribute, value, normalize)
+        actual = engine.frequencies(attribute, value, normalize).reindex(years, fill_value=0).to_numpy()
+        assert np.allclose(expected, actual), (attribute, value)
+
+
+def test_matching_values_are_counted(legacy_rows, engine):
+    # a sampled genre must occur at least once, so the comparison above isn't only zeros
+    attribute, genre = sample_queries(legacy_rows, per_attribute=1)[0]
+    assert attribute == 'Genre'
+    assert engine.frequencies(attribute, genre).sum() > 0
+
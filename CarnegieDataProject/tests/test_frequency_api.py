@@ -0,0 +1,123 @@
+"""Checks the requests of the headless query API (frequency_api.py), from query_frequencies() and over HTTP"""
+
+import json
+import subprocess
+import sys
+import threading
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import pytest
+
+from benchmark_queries import sample_values
+from frequency_api import YEAR_MARGIN, QueryError, make_server, parse_value, query_frequencies
+
+
+@pytest.fixture(scope='module')
+def values(sample_engine):
+    return sample_values(sample_engine, 3)
+
+
+@pytest.fixture(scope='module')
+def url(sample_engine):
+    server = make_server(sample_engine, port=0, log_requests=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def get(url, path, **parameters):
+    """Returns the status and JSON body of a GET request"""
+    try:
+        with urlopen(f'{url}{path}?{urlencode(parameters, doseq=True)}') as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+@pytest.mark.parametrize('attribute, text, expected', [
+    ('Genre', ' Jazz ', 'Jazz'),
+    ('Work', '54976', '(#54976)'),
+    ('Composer', 'Wolfgang Amadeus Mozart (#54976)', 'Wolfgang Amadeus Mozart (#54976)'),
+    ('Nationality', 'Germany | Kingdom of Prussia|', ['Germany', 'Kingdom of Prussia']),
+])
+def test_parse_value(attribute, text, expected):
+    assert parse_value(attribute, text) == expected
+
+
+@pytest.mark.parametrize('attribute, text', [('Work', 'Mozart'), ('Composer', '(#12'), ('Work', '(#12a)'),
+                                             ('Composer', 'Mozart (#)'), ('Nationality', ' | ')])
+def test_parse_value_rejects_bad_values(attribute, text):
+    with pytest.raises(QueryError):
+        parse_value(attribute, text)
+
+
+def test_each_value_is_a_series(sample_engine, values):
+    response = query_frequencies(sample_engine, 'Work', values['Work'])
+    assert response['years'] == sample_engine.years.tolist()
+    assert len(response['series']) == len(values['Work'])
+    assert all(len(series['frequencies']) == len(response['years']) for series in response['series'])
+    assert sum(map(sum, (series['frequencies'] for series in response['series']))) > 0
+
+
+def test_years_outside_the_data_have_no_events(sample_engine, values):
+    first = int(sample_engine.years[0])
+    response = query_frequencies(sample_engine, 'Genre', values['Genre'][:1], year_range=(first - 5, first))
+    assert response['years'] == list(range(first - 5, first + 1))
+    assert response['series'][0]['frequencies'][:5] == [0] * 5
+
+
+@pytest.mark.parametrize('attribute, texts, year_range', [
+    ('Instrument', ['Piano'], None),
+    ('Genre', [], None),
+    ('Work', ['Mozart'], None),
+    ('Genre', ['Jazz'], (1950, 1900)),
+    ('Genre', ['Jazz'], (-10 ** 9, 1900)),
+    ('Genre', ['Jazz'], (1900, 10 ** 9)),
+])
+def test_bad_requests_raise_query_error(sample_engine, attribute, texts, year_range):
+    with pytest.raises(QueryError):
+        query_frequencies(sample_engine, attribute, texts, year_range=year_range)
+
+
+def test_year_ranges_reach_the_margin(sample_engine, values):
+    year_range = (int(sample_engine.years[0]) - YEAR_MARGIN, int(sample_engine.years[-1]) + YEAR_MARGIN)
+    response = query_frequencies(sample_engine, 'Genre', values['Genre'][:1], year_range=year_range)
+    assert len(response['years']) == len(sample_engine.years) + 2 * YEAR_MARGIN
+
+
+def test_http_query(url, sample_engine, values):
+    status, body = get(url, '/frequencies', attribute='Composer', value=values['Composer'][:2], normalize='true')
+    assert status == 200
+    assert body == query_frequencies(sample_engine, 'Composer', values['Composer'][:2], normalize=True)
+
+
+@pytest.mark.parametrize('parameters', [
+    {'attribute': 'Instrument', 'value': 'Piano'},
+    {'attribute': 'Genre'},
+    {'attribute': 'Genre', 'value': 'Jazz', 'start': 'nineteen hundred'},
+    {'attribute': 'Genre', 'value': 'Jazz', 'start': 1950, 'end': 1900},
+    {'attribute': 'Genre', 'value': 'Jazz', 'end': 10 ** 9},
+    {'attribute': 'Work', 'value': '(#12a)'},
+])
+def test_http_bad_requests(url, parameters):
+    status, body = get(url, '/frequencies', **parameters)
+    assert status == 400
+    assert body['error']
+
+
+def test_http_unknown_path(url):
+    status, body = get(url, '/charts', attribute='Genre', value='Jazz')
+    assert status == 404
+    assert '/frequencies' in body['error']
+
+
+def test_cli_rejects_malformed_ids(sample_paths):
+    store_folder, index_path, cubes_path = sample_paths
+    result = subprocess.run([sys.executable, 'frequency_api.py', '--store', store_folder, '--index', index_path,
+                             '--cubes', cubes_path, 'query', 'Work', '(#12a)'], capture_output=True, text=True)
+    # a usage error, rather than a traceback
+    assert result.returncode == 2
+    assert 'Carnegie IDs' in result.stderr and 'Traceback' not in result.stderr
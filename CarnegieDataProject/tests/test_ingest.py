@@ -0,0 +1,64 @@
+"""Tests of the parallel shard parsing of ingest.py, and of rebuilds that only build again what changed"""
+
+import os
+import shutil
+
+import ingest
+from event_store import EVENTS_FOLDER
+from ingest import COMPOSERS_FOLDER, WORKS_FOLDER, parse_shards
+
+
+def square(value):
+    """A parser for the tests, defined at module level so that worker processes can run it"""
+    return value * value
+
+
+def test_parse_shards_keeps_the_order_of_the_paths():
+    assert list(parse_shards(square, range(20), workers=3)) == [value * value for value in range(20)]
+    assert list(parse_shards(square, range(20), workers=1)) == [value * value for value in range(20)]
+
+
+def test_parse_shards_bounds_the_shards_in_flight(monkeypatch):
+    monkeypatch.setattr(ingest, 'SHARDS_AHEAD', 2)
+    pulled = []
+
+    def paths():
+        for path in range(50):
+            pulled.append(path)
+            yield path
+
+    results = parse_shards(square, paths(), workers=2)
+    next(results)
+    # the first result was waited for with 2 workers x 2 shards submitted, then one more shard was started
+    assert len(pulled) == 2 * 2 + 1
+    assert list(results) == [value * value for value in range(1, 50)]
+
+
+def test_a_rebuild_only_builds_what_changed(tmp_path):
+    folders = {}
+    for name, source, shard in [('events', EVENTS_FOLDER, 'Events-0.csv'), ('works', WORKS_FOLDER, 'Works-0.csv'),
+                                ('composers', COMPOSERS_FOLDER, 'Composers-0.csv')]:
+        folders[name] = tmp_path / name
+        folders[name].mkdir()
+        shutil.copy(os.path.join(source, shard), folders[name])
+    paths = {'store_folder': str(tmp_path / 'store'), 'index_path': str(tmp_path / 'event_index.npz'),
+             'options_path': str(tmp_path / 'options.npz'), 'cubes_path': str(tmp_path / 'year_cubes.npz'),
+             'cooccurrence_path': str(tmp_path / 'cooccurrence.npz')}
+
+    def build():
+        timings = ingest.ingest(str(folders['events']), str(folders['works']), str(folders['composers']), **paths)
+        files = [os.path.join(paths['store_folder'], 'events.parquet'), os.path.join(paths['store_folder'],
+                 'columns', 'manifest.json')] + [paths[name] for name in paths if name != 'store_folder']
+        return len(timings), {os.path.basename(path): os.stat(path).st_mtime_ns for path in files}
+
+    assert build()[0] == 3
+    parsed, built = build()
+    assert parsed == 0
+    # nothing was merged or built again
+    assert built == build()[1]
+
+    # a new works shard changes the picker options, but not the events or anything built from them
+    shutil.copy(os.path.join(WORKS_FOLDER, 'Works-1.csv'), folders['works'])
+    parsed, rebuilt = build()
+    assert parsed == 1
+    assert [name for name in built if built[name] != rebuilt[name]] == ['options.npz']
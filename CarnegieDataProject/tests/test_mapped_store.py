@@ -0,0 +1,68 @@
+"""Checks that the memory-mapped store can be saved by several workers at once while others open it"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from event_store import EventStore
+from mapped_store import (MappedStore, columns_folder, load_arrays, load_or_build_mapped_store, save_array,
+                          save_arrays, save_mapped_store, source_versions)
+
+WRITES = 50
+
+
+def write_arrays(folder, worker):
+    """Saves the same .npy and .npz paths WRITES times, as an app worker rebuilding them would"""
+    for _ in range(WRITES):
+        save_array(os.path.join(folder, 'column.npy'), np.full(1000, worker))
+        save_arrays(os.path.join(folder, 'arrays.npz'), values=np.full(1000, worker))
+
+
+def test_concurrent_workers_save_whole_files(tmp_path):
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        for result in [pool.submit(write_arrays, str(tmp_path), worker) for worker in range(4)]:
+            result.result()
+    assert sorted(os.listdir(tmp_path)) == ['arrays.npz', 'column.npy']
+    # each file was written whole by one of the workers
+    for values in (np.load(tmp_path / 'column.npy'), load_arrays(str(tmp_path / 'arrays.npz'))['values']):
+        assert len(values) == 1000 and len(set(values.tolist())) == 1
+
+
+def test_the_manifest_is_never_read_half_written(sample_paths):
+    store_folder = sample_paths[0]
+    folder = columns_folder(store_folder)
+    store, versions = EventStore.load(store_folder), source_versions(store_folder)
+    saving = True
+    errors = []
+
+    def open_store():
+        while saving:
+            try:
+                MappedStore(folder)
+            except Exception as error:
+                errors.append(error)
+
+    reader = threading.Thread(target=open_store)
+    reader.start()
+    try:
+        for _ in range(10):
+            save_mapped_store(store, folder, versions)
+    finally:
+        saving = False
+        reader.join()
+    assert errors == []
+    assert not [name for name in os.listdir(folder) if name.endswith('.tmp')]
+
+
+def test_a_truncated_manifest_is_saved_again(sample_paths):
+    store_folder = sample_paths[0]
+    manifest_path = os.path.join(columns_folder(store_folder), 'manifest.json')
+    with open(manifest_path) as manifest_file:
+        manifest = manifest_file.read()
+    with open(manifest_path, 'w') as manifest_file:
+        manifest_file.write(manifest[:len(manifest) // 2])
+
+    store = load_or_build_mapped_store(store_folder)
+    assert store.rows('events') == EventStore.load(store_folder).rows('events')
@@ -0,0 +1,32 @@
+"""Tests of the parsing of composer nationalities"""
+
+import pandas as pd
+
+from event_store import STATELESS
+from nationalities import join_nationalities, parse_series_text
+
+
+def test_parse_series_text_gives_one_label_per_row():
+    texts = pd.Series(['0    Poland', '0    Archduchy of Austria\n1       Holy Roman Empire'], index=[10, 11])
+    labels = parse_series_text(texts)
+    assert labels.tolist() == ['Poland', 'Archduchy of Austria', 'Holy Roman Empire']
+    assert labels.index.tolist() == [10, 11, 11]
+
+
+def test_parse_series_text_resolves_shortened_labels():
+    texts = pd.Series(['0    United Kingdom of Great Britain and...'])
+    known = ['United Kingdom of Great Britain and Ireland', 'United States of America']
+    assert parse_series_text(texts, known).tolist() == ['United Kingdom of Great Britain and Ireland']
+
+
+def test_parse_series_text_keeps_ambiguous_shortened_labels():
+    texts = pd.Series(['0    United...'])
+    known = ['United Kingdom', 'United States of America']
+    assert parse_series_text(texts, known).tolist() == ['United...']
+
+
+def test_join_nationalities_marks_unknown_composers_stateless():
+    pairs = pd.DataFrame({'composer': [1, 1], 'nationality': ['France', 'Belgium']})
+    joined = join_nationalities(pd.DataFrame({'composer': [1, 2]}), pairs)
+    assert sorted(joined.loc[joined['composer'] == 1, 'nationality'].tolist()) == ['Belgium', 'France']
+    assert joined.loc[joined['composer'] == 2, 'nationality'].tolist() == [STATELESS]
@@ -0,0 +1,47 @@
+"""Tests of the picker options of option_search.py, ranked by the event counts of an EventIndex"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from event_index import INDEXED_COLUMNS, EventIndex
+from option_search import OptionSearch
+
+
+@pytest.fixture
+def store_folder(tmp_path):
+    """A store folder with only the catalog tables: two works by Beethoven and one by an unknown composer"""
+    pd.DataFrame({'work': np.array([1, 2, 3], dtype=np.int32), 'title': ['Symphony No. 9', 'Für Elise', 'Untitled'],
+                  'composer': np.array([10, 10, 11], dtype=np.int32),
+                  'composer_label': ['Ludwig van Beethoven', 'Ludwig van Beethoven', None]}
+                 ).to_parquet(tmp_path / 'works.parquet', index=False)
+    pd.DataFrame({'composer': np.array([10, 11], dtype=np.int32), 'label': ['Ludwig van Beethoven', None]}
+                 ).to_parquet(tmp_path / 'composers.parquet', index=False)
+    return str(tmp_path)
+
+
+def make_index(counts):
+    """An index with counts[column][key] events for each key, in the form EventIndex.from_store builds"""
+    postings = {}
+    for column in INDEXED_COLUMNS:
+        keys = sorted(counts.get(column, {}))
+        sizes = [counts[column][key] for key in keys]
+        postings[column] = {'keys': np.array(keys, dtype=str if column == 'nationality' else np.int32),
+                            'offsets': np.cumsum([0] + sizes).astype(np.int64),
+                            'events': np.arange(sum(sizes), dtype=np.int32),
+                            'years': np.full(sum(sizes), 1900, dtype=np.int16)}
+    return EventIndex(postings)
+
+
+def test_options_are_ranked_by_events(store_folder):
+    options = OptionSearch.from_store(make_index({'work': {2: 5, 3: 1}, 'composer': {10: 6}}), store_folder)
+    assert options.options['work']['events'].tolist() == [5, 1, 0]
+    assert options.search('work', 'beet') == ['Für Elise by Ludwig van Beethoven (#2)',
+                                              'Symphony No. 9 by Ludwig van Beethoven (#1)']
+    assert options.search('composer', '') == ['Ludwig van Beethoven (#10)', 'Unknown (#11)']
+
+
+def test_an_index_without_postings_gives_no_events(store_folder):
+    options = OptionSearch.from_store(make_index({}), store_folder)
+    assert options.options['work']['events'].tolist() == [0, 0, 0]
+    assert options.search('work', 'symphony') == ['Symphony No. 9 by Ludwig van Beethoven (#1)']
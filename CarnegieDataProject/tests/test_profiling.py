@@ -0,0 +1,66 @@
+"""Checks the memory peaks of traced spans when several sessions trace memory, and the rotation of the query log"""
+
+import threading
+import tracemalloc
+
+from profiling import Trace, read_query_log, rotated_log_path, write_trace
+
+ALLOCATION = 8 * 1024 * 1024
+
+
+def test_a_single_trace_measures_peaks():
+    with Trace({'attribute': 'Genre'}, trace_memory=True) as trace:
+        with trace.span('query') as span:
+            data = bytearray(ALLOCATION)
+            del data
+    assert span.peak_memory >= ALLOCATION
+    assert not tracemalloc.is_tracing()
+
+
+def test_peaks_are_dropped_while_another_session_traces_memory():
+    started, finish = threading.Event(), threading.Event()
+
+    def other_session():
+        with Trace({'attribute': 'Work'}, trace_memory=True):
+            started.set()
+            finish.wait()
+
+    with Trace({'attribute': 'Genre'}, trace_memory=True) as trace:
+        with trace.span('load') as alone:
+            pass
+        with trace.span('query') as shared:
+            other = threading.Thread(target=other_session)
+            other.start()
+            started.wait()
+        with trace.span('aggregate') as overlapping:
+            pass
+        finish.set()
+        other.join()
+        # tracemalloc keeps running for this trace after the other session stops
+        assert tracemalloc.is_tracing()
+        with trace.span('render') as alone_again:
+            pass
+    assert not tracemalloc.is_tracing()
+    assert alone.peak_memory is not None and alone_again.peak_memory is not None
+    assert shared.peak_memory is None and overlapping.peak_memory is None
+
+
+def test_the_query_log_is_rotated(tmp_path):
+    log_path = str(tmp_path / 'query_log.jsonl')
+    for number in range(100):
+        write_trace(Trace({'attribute': 'Genre', 'values': [str(number)]}), log_path, max_bytes=2000)
+
+    assert (tmp_path / 'query_log.jsonl').stat().st_size <= 2000
+    assert (tmp_path / 'query_log.jsonl.1').stat().st_size <= 2000
+    # the oldest traces were dropped when the log was rotated a second time, the rest are read in order
+    logged = [trace['query']['values'][0] for trace in read_query_log(log_path)]
+    assert 0 < len(logged) < 100
+    assert logged == [str(number) for number in range(100 - len(logged), 100)]
+
+
+def test_the_rotated_log_is_optional(tmp_path):
+    log_path = str(tmp_path / 'query_log.jsonl')
+    write_trace(Trace({'attribute': 'Genre'}), log_path)
+    assert len(read_query_log(log_path)) == 1
+    assert not (tmp_path / 'query_log.jsonl.1').exists()
+    assert rotated_log_path(log_path) == log_path + '.1'
@@ -0,0 +1,25 @@
+"""Tests of the least-recently-used QueryCache"""
+
+import numpy as np
+
+from query_cache import QueryCache
+
+
+def test_results_are_computed_once():
+    cache = QueryCache()
+    calls = []
+    for _ in range(3):
+        cache.get_or_compute('key', lambda: calls.append(1) or np.zeros(4))
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_least_recently_used_results_are_evicted():
+    # room for two results of 80 bytes
+    cache = QueryCache(max_bytes=160)
+    for key in ('a', 'b'):
+        cache.get_or_compute(key, lambda: np.zeros(10))
+    cache.get_or_compute('a', lambda: np.zeros(10))
+    cache.get_or_compute('c', lambda: np.zeros(10))
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.bytes == 160
@@ -0,0 +1,121 @@
+"""
+Precomputed year rollup cubes for the frequency charts.
+
+For each of genre, work, composer and nationality, the cubes hold the number of events per (year, value), along with
+the total number of events per year (and of events with a genre) for proportions. A chart of one value is then a slice
+of a stored array instead of a query over the events.
+
+The counts of each attribute are stored as a sparse year x value matrix in compressed sparse column layout: the years
+and counts of each value's non-zero entries are stored back to back, with an offsets array marking where each value's
+entries start, like the postings of the EventIndex. The cubes are saved as a single .npz file by ingest.py.
+
+A group of several nationalities can't be answered from the cubes, since an event with composers of two of the nations
+would be counted twice, so FrequencyEngine answers those from the index as before.
+"""
+
+import numpy as np
+
+from frequency import option_id
+from mapped_store import load_arrays, save_arrays
+from profiling import record_rows
+
+# default location, relative to the CarnegieDataProject folder
+CUBES_PATH = 'Data/year_cubes.npz'
+
+# attribute of each cube, as named in FrequencyEngine
+CUBE_ATTRIBUTES = {'genre': 'Genre', 'work': 'Work', 'composer': 'Composer', 'nationality': 'Nationality'}
+
+CUBE_ARRAYS = ('keys', 'offsets', 'years', 'counts')
+
+
+class YearCubes:
+    """Holds the number of events per year of every genre, work, composer and nationality"""
+
+    def __init__(self, years, event_totals, genre_totals, store_fingerprint, cubes):
+        self.years = years
+        self.first_year = int(years[0])
+        self.event_totals = event_totals
+        self.genre_totals = genre_totals
+        # the content hash of the store the cubes were built from, to tell if they are stale
+        self.store_fingerprint = store_fingerprint
+        # cubes maps each column to a dict of 'keys', 'offsets', 'years' and 'counts' arrays
+        self.cubes = cubes
+
+    @classmethod
+    def from_engine(cls, engine):
+        """Builds the cubes from the frequency matrices of a FrequencyEngine"""
+        cubes = {}
+        for column, attribute in CUBE_ATTRIBUTES.items():
+            values, matrix = engine.frequency_matrix(attribute)
+            matrix = matrix.tocsc()
+            matrix.sort_indices()
+            key_type = np.int32 if column in ('work', 'composer') else str
+            cubes[column] = {'keys': np.asarray(values).astype(key_type),
+                             'offsets': matrix.indptr.astype(np.int64),
+                             # indices are positions on the year axis
+                             'years': matrix.indices.astype(np.int16),
+                             'counts': matrix.data.astype(np.int32)}
+        return cls(engine.years, engine.event_totals, engine.genre_totals, engine.store.fingerprint(), cubes)
+
+    def save(self, cubes_path=CUBES_PATH):
+        """Stores the cubes as a single .npz file"""
+        arrays = {f'{column}_{name}': array for column, cube in self.cubes.items() for name, array in cube.items()}
+        save_arrays(cubes_path, years=self.years, event_totals=self.event_totals, genre_totals=self.genre_totals,
+                    store_fingerprint=np.array([self.store_fingerprint]), **arrays)
+
+    @classmethod
+    def load(cls, cubes_path=CUBES_PATH):
+        """Loads cubes previously saved with save()"""
+        # the cubes are memory-mapped, so only the pages of the values charted are read
+        arrays = load_arrays(cubes_path)
+        # cubes saved before they recorded the content hash of their store are always stale
+        store_fingerprint = str(arrays['store_fingerprint'][0]) if 'store_fingerprint' in arrays else None
+        return cls(arrays['years'], arrays['event_totals'], arrays['genre_totals'], store_fingerprint,
+                   {column: {name: arrays[f'{column}_{name}'] for name in CUBE_ARRAYS} for column in CUBE_ATTRIBUTES})
+
+    def matches(self, store):
+        """Returns True if the cubes were built from a store with the same contents as store"""
+        return store.fingerprint() == self.store_fingerprint
+
+    def covers(self, column, specific_value):
+        """Returns True if the frequencies of specific_value for column can be read from the cubes"""
+        return column != 'nationality' or len(specific_value) == 1
+
+    def key(self, column, specific_value):
+        """Returns the key of specific_value in the cube of column"""
+        if column == 'genre':
+            return specific_value.lower()
+        elif column == 'nationality':
+            return specific_value[0]
+        else:
+            return option_id(specific_value)
+
+    def counts(self, column, specific_value):
+        """Returns the number of events matching specific_value for column in each year of the year axis"""
+        cube = self.cubes[column]
+        keys = cube['keys']
+        key = self.key(column, specific_value)
+        counts = np.zeros(len(self.years), dtype=np.int64)
+        position = np.searchsorted(keys, key)
+        # values that never occur have no entries
+        if position < len(keys) and keys[position] == key:
+            entries = slice(cube['offsets'][position], cube['offsets'][position + 1])
+            counts[cube['years'][entries]] = cube['counts'][entries]
+            record_rows(entries.stop - entries.start)
+        return counts
+
+
+def load_or_build_cubes(engine, cubes_path=CUBES_PATH):
+    """
+    Loads the cubes at cubes_path, building and saving them from engine if they don't exist yet or were built from
+    another version of the store
+    """
+    try:
+        cubes = YearCubes.load(cubes_path)
+        if cubes.matches(engine.store) and np.array_equal(cubes.years, engine.years):
+            return cubes
+    except FileNotFoundError:
+        pass
+    cubes = YearCubes.from_engine(engine)
+    cubes.save(cubes_path)
+    return cubes
@@ -1,7 +1,13 @@
+import os
+import sys
+
 import pandas as pd
 import plotly.express as px
 import streamlit as st
-# import os
+
+# the nationality parser is shared with the CarnegieDataProject app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CarnegieDataProject'))
+from nationalities import parse_series_text  # noqa: E402
 
 # Also required:
 # • A csv with all the event data returned by the SPARQL query
@@ -133,20 +139,21 @@ def make_bar_chart(df, column, specific_value, lookup_range=(0, 0)):
 
 def add_nationalities(input_df):
     """Combines nationality data csv and carnegie hall data csv together"""
-    input_df.insert(6, "nationalities", pd.Series(dtype=str))
-
     names_with_nationalities = pd.read_csv('Labs/CarnegieData/nationalities_new.csv')
 
-    # Iterate through the dataframe, adding nationalities when possible
-    for index in input_df.index:
-        nationalities = names_with_nationalities.loc[
-            names_with_nationalities['composer'] == input_df.loc[index, 'composer']]
-        nationalities = nationalities['nationalities']
-        nationalities = nationalities.get(nationalities.keys()[0])
-        try:
-            input_df.at[index, 'nationalities'] = nationalities
-        except KeyError:
-            print(input_df.loc[index])
+    # Parse the nationalities once, into one row per (composer, nationality) pair, the same way as the
+    # CarnegieDataProject app, resolving the labels pandas shortened with "..."
+    # Each entry is the text of a Series, e.g. "0    Archduchy of Austria\n1       Holy Roman Empire"
+    labels = parse_series_text(names_with_nationalities['nationalities'].dropna(),
+                               pd.read_csv('CarnegieDataProject/Data/nationalities_list.csv')['Nation'])
+    pairs = pd.DataFrame({'composer': names_with_nationalities['composer'].loc[labels.index].to_numpy(),
+                          'nationalities': labels.to_numpy()})
+
+    # Join each composer's list of nationalities onto the dataframe in a single merge
+    composer_nationalities = pairs.groupby('composer', sort=False)['nationalities'].agg(list)
+    nationalities = input_df[['composer']].merge(composer_nationalities, how='left', left_on='composer',
+                                                 right_index=True)['nationalities']
+    input_df.insert(6, "nationalities", nationalities.to_numpy())
 
     return input_df
 
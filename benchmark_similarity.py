@@ -0,0 +1,70 @@
+# Benchmarks the query latency of TrackIndex on synthetic libraries of increasing size, comparing the brute force
+# search with the approximate index, and measures how many of the true 10 nearest tracks the approximate index finds
+
+# To run the benchmark:
+# python benchmark_similarity.py
+# or with other library sizes:
+# python benchmark_similarity.py --sizes 10000 200000
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from track_similarity import SIMILARITY_FEATURES, TrackIndex
+
+
+def synthetic_tracks(size, seed=0):
+    """Returns a playlist df of size tracks whose features are drawn around a few dozen 'styles', like real libraries"""
+    rng = np.random.default_rng(seed)
+    styles = rng.random((40, len(SIMILARITY_FEATURES)))
+    features = styles[rng.integers(len(styles), size=size)] + rng.normal(0, 0.08, (size, len(SIMILARITY_FEATURES)))
+    playlist_df = pd.DataFrame(features, columns=SIMILARITY_FEATURES)
+    # tempo and loudness on their own scales, like the audio features
+    playlist_df["tempo"] = 60 + 120 * playlist_df["tempo"]
+    playlist_df["loudness"] = -30 + 28 * playlist_df["loudness"]
+    playlist_df["track_id"] = [f"track{number}" for number in range(size)]
+    playlist_df["track_name"] = playlist_df["track_id"]
+    return playlist_df
+
+
+def latencies(index, queries, k):
+    """Returns the latency in milliseconds of each single-track query"""
+    times = []
+    for vector in queries:
+        start = time.perf_counter()
+        index.query(vector, k)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.array(times)
+
+
+def recall(index, exact, queries, k):
+    """Returns the fraction of the true k nearest tracks that index finds"""
+    found = index.query(queries, k)[0]
+    expected = exact.query(queries, k)[0]
+    return np.mean([len(np.intersect1d(row, expected_row)) / k for row, expected_row in zip(found, expected)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the query latency of TrackIndex.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 300_000], help='library sizes')
+    parser.add_argument('--queries', type=int, default=200, help='number of queries timed per library')
+    parser.add_argument('-k', type=int, default=10, help='number of similar tracks per query')
+    args = parser.parse_args()
+
+    print(f'{"tracks":>8}{"index":>13}{"build":>9}{"p50":>10}{"p95":>10}{"recall":>8}')
+    for size in args.sizes:
+        tracks = synthetic_tracks(size)
+        for approximate in (False, True):
+            start = time.perf_counter()
+            index = TrackIndex(tracks, approximate=approximate)
+            build_time = time.perf_counter() - start
+            queries = index.matrix[np.random.default_rng(1).choice(size, args.queries, replace=False)]
+            times = latencies(index, queries, args.k)
+            if approximate:
+                found = f'{recall(index, TrackIndex(tracks, approximate=False), queries, args.k):8.3f}'
+            else:
+                found = f'{1:8.3f}'
+            print(f'{size:>8}{"approximate" if approximate else "brute force":>13}{build_time:8.2f}s'
+                  f'{np.percentile(times, 50):8.2f}ms{np.percentile(times, 95):8.2f}ms{found}')
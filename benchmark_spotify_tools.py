@@ -0,0 +1,112 @@
+# Benchmarks the entry points of spotify_tools against an offline client, measuring for each the number of calls made
+# to the client, the wall time and the peak memory (of Python allocations, traced by tracemalloc, which also slows
+# Python code down, so wall times are for comparing entry points and runs with each other)
+
+# By default the library is synthetic (see SyntheticClient in replay_client):
+# python benchmark_spotify_tools.py
+# or larger, with 50 ms per call like the API:
+# python benchmark_spotify_tools.py --playlists 200 --tracks 300 --latency 0.05
+# A library recorded by a RecordingClient can be replayed instead (entry points that weren't recorded are skipped):
+# python benchmark_spotify_tools.py --fixtures fixtures/my_library --user my_username
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from replay_client import ReplayClient, SyntheticClient
+from spotify_cache import SpotifyCache
+from spotify_fetcher import SpotifyFetcher
+from spotify_tools import (analyze_playlist, analyze_playlist_dict, get_all_user_tracks, get_audio_features_df,
+                           get_playlist_items_df, iterate_user_playlists)
+
+
+def measure(client, function):
+    """Runs function, returning its result, the calls it made to client by method, its wall time and peak memory"""
+    client.reset_calls()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function()
+    finally:
+        wall_time = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, dict(client.calls), wall_time, peak_memory
+
+
+def entry_points(client, user, playlists, cache_path):
+    """Returns the name and a function running each entry point on the library of user"""
+    first_playlist = playlists[0]["id"]
+
+    def cached_library():
+        cache = SpotifyCache(cache_path)
+        try:
+            return get_all_user_tracks(user, client, cache=cache)
+        finally:
+            cache.close()
+
+    def fetched_playlist():
+        fetcher = SpotifyFetcher(client)
+        try:
+            return analyze_playlist(user, first_playlist, client, fetcher=fetcher)
+        finally:
+            fetcher.close()
+
+    def crawled_library():
+        fetcher = SpotifyFetcher(client)
+        try:
+            return get_all_user_tracks(user, client, fetcher=fetcher)
+        finally:
+            fetcher.close()
+
+    return [
+        ("get_audio_features_df", lambda: get_audio_features_df(client.user_playlist_tracks(user, first_playlist),
+                                                                client)),
+        ("analyze_playlist", lambda: analyze_playlist(user, first_playlist, client)),
+        ("analyze_playlist (fetcher)", fetched_playlist),
+        ("get_playlist_items_df", lambda: get_playlist_items_df(first_playlist, client)),
+        ("analyze_playlist_dict", lambda: analyze_playlist_dict(
+            {playlist["name"]: (user, playlist["id"]) for playlist in playlists}, client)),
+        ("get_all_user_tracks", lambda: get_all_user_tracks(user, client)),
+        ("get_all_user_tracks (fetcher)", crawled_library),
+        # the first run fills the cache, the second should make no calls at all
+        ("get_all_user_tracks (cold cache)", cached_library),
+        ("get_all_user_tracks (warm cache)", cached_library),
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the entry points of spotify_tools against an offline client.')
+    parser.add_argument('--playlists', type=int, default=20, help='number of playlists in the synthetic library')
+    parser.add_argument('--tracks', type=int, default=200, help='number of tracks per synthetic playlist')
+    parser.add_argument('--unique-tracks', type=int, default=None,
+                        help='number of different tracks in the synthetic library (fewer means more shared tracks)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic library')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per call')
+    parser.add_argument('--fixtures', help='folder of recorded fixtures to replay instead of a synthetic library')
+    parser.add_argument('--user', default='synthetic_user', help='user whose library is benchmarked')
+    args = parser.parse_args()
+
+    if args.fixtures:
+        client = ReplayClient(args.fixtures, args.latency)
+    else:
+        client = SyntheticClient(args.playlists, args.tracks, args.unique_tracks, seed=args.seed, latency=args.latency)
+    try:
+        playlists = list(iterate_user_playlists(args.user, client))
+    except KeyError:
+        parser.error(f'the playlists of {args.user} were not recorded in {args.fixtures}')
+
+    print(f'{"entry point":<34}{"rows":>8}{"calls":>8}{"wall time":>11}{"peak memory":>13}  calls by method')
+    with tempfile.TemporaryDirectory() as folder:
+        for name, function in entry_points(client, args.user, playlists, os.path.join(folder, 'cache.sqlite')):
+            try:
+                result, calls, wall_time, peak_memory = measure(client, function)
+            except KeyError:
+                print(f'{name:<34}skipped: some of its calls were not recorded')
+                continue
+            calls_by_method = ', '.join(f'{method} {count}' for method, count in sorted(calls.items()))
+            print(f'{name:<34}{len(result):>8}{sum(calls.values()):>8}{wall_time:10.2f}s'
+                  f'{peak_memory / 1024 ** 2:11.1f}MB  {calls_by_method}')
@@ -0,0 +1,52 @@
+# Compact columnar files for the playlist dfs made by spotify_tools (analyze_playlist_dict, get_all_user_tracks, ...)
+
+# Before saving, the artist, album and playlist columns become categoricals, which store each distinct name once, and
+# the audio features get the narrowest types that hold them (float32, and small nullable integers for key, mode, time
+# signature and duration). Two formats are supported, chosen by the file extension:
+# • .parquet: compressed, for keeping and sharing datasets
+# • .arrow (or .feather): uncompressed Arrow IPC, which is memory-mapped when read, so reading a few columns only
+#   touches the pages of the file holding those columns
+# Both can be read a few columns at a time, e.g. a dashboard that only needs valence and energy:
+# load_playlist_dataset('library.arrow', columns=['valence', 'energy'])
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# columns holding names repeated across many tracks
+CATEGORICAL_COLUMNS = ["artist", "album", "playlist", "playlist_name"]
+
+# the narrowest types that hold each audio feature (integer features can be missing, so they are nullable)
+NARROW_DTYPES = {"danceability": "float32", "energy": "float32", "loudness": "float32", "speechiness": "float32",
+                 "instrumentalness": "float32", "liveness": "float32", "valence": "float32", "tempo": "float32",
+                 "acousticness": "float32", "key": "Int8", "mode": "Int8", "time_signature": "Int8",
+                 "duration_ms": "Int32"}
+
+ARROW_EXTENSIONS = (".arrow", ".feather")
+
+
+def compact_playlist_df(playlist_df):
+    # Return a copy of a playlist df with categorical name columns and narrow numeric types
+    dtypes = {column: "category" for column in CATEGORICAL_COLUMNS if column in playlist_df.columns}
+    dtypes.update({column: dtype for column, dtype in NARROW_DTYPES.items() if column in playlist_df.columns})
+    # the index is only a row number, so it isn't kept
+    return playlist_df.astype(dtypes).reset_index(drop=True)
+
+
+def save_playlist_dataset(playlist_df, path):
+    # Save a playlist df to a Parquet file, or to an uncompressed Arrow IPC file if path ends with .arrow/.feather
+    table = pa.Table.from_pandas(compact_playlist_df(playlist_df), preserve_index=False)
+    if path.endswith(ARROW_EXTENSIONS):
+        feather.write_feather(table, path, compression="uncompressed")
+    else:
+        pq.write_table(table, path, compression="zstd")
+
+
+def load_playlist_dataset(path, columns=None):
+    # Load a playlist df saved by save_playlist_dataset, reading only columns if given
+    # The file is memory-mapped, so columns that aren't read are never loaded
+    if path.endswith(ARROW_EXTENSIONS):
+        table = feather.read_table(path, columns=columns, memory_map=True)
+    else:
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
@@ -0,0 +1,220 @@
+# Offline stand-ins for a spotipy client, to benchmark and check spotify_tools without calling the Spotify API
+
+# They have the methods spotify_tools calls (user_playlists, user_playlist_tracks, playlist_items, playlist,
+# audio_features and next), and answer with responses shaped like Spotify's, "next" links included:
+# • RecordingClient passes calls on to a real spotipy client, saving every response to a folder of JSON fixture files
+# • ReplayClient answers the calls recorded in a fixture folder, the same way every time
+# • SyntheticClient makes up a library of any size, the same for the same seed
+# ReplayClient and SyntheticClient count their calls by method, and can sleep for a number of seconds per call to
+# simulate the latency of the API.
+
+# To record a library, then replay it:
+# get_all_user_tracks('my_username', RecordingClient(sp, 'fixtures/my_library'))
+# get_all_user_tracks('my_username', ReplayClient('fixtures/my_library', latency=0.05))
+# Only the calls made while recording can be replayed, so record every entry point that will be replayed.
+
+# To benchmark the entry points of spotify_tools against these clients, run:
+# python benchmark_spotify_tools.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import numpy as np
+
+
+def fixture_name(method, args, kwargs):
+    """Returns the name of the fixture file of a call, from a hash of its method and arguments"""
+    call = json.dumps([method, list(args), sorted(kwargs.items())], default=str)
+    return f'{method}-{hashlib.sha1(call.encode()).hexdigest()[:16]}.json'
+
+
+class RecordingClient:
+    """Passes calls on to a spotipy client, saving each response to a JSON fixture file in fixture_folder"""
+
+    def __init__(self, spotipy_client, fixture_folder):
+        self.spotipy_client = spotipy_client
+        self.fixture_folder = fixture_folder
+        os.makedirs(fixture_folder, exist_ok=True)
+
+    def _save(self, name, response):
+        with open(os.path.join(self.fixture_folder, name), 'w') as fixture:
+            json.dump(response, fixture)
+        return response
+
+    def _record(self, method, *args, **kwargs):
+        return self._save(fixture_name(method, args, kwargs), getattr(self.spotipy_client, method)(*args, **kwargs))
+
+    def user_playlists(self, *args, **kwargs):
+        return self._record('user_playlists', *args, **kwargs)
+
+    def user_playlist_tracks(self, *args, **kwargs):
+        return self._record('user_playlist_tracks', *args, **kwargs)
+
+    def playlist_items(self, *args, **kwargs):
+        return self._record('playlist_items', *args, **kwargs)
+
+    def playlist(self, *args, **kwargs):
+        return self._record('playlist', *args, **kwargs)
+
+    def audio_features(self, *args, **kwargs):
+        return self._record('audio_features', *args, **kwargs)
+
+    def next(self, result):
+        # the following page is recorded under the URL of its "next" link, which is all a replay has to find it by
+        if not result.get('next'):
+            return None
+        return self._save(fixture_name('next', (result['next'],), {}), self.spotipy_client.next(result))
+
+
+class OfflineClient:
+    """Counts the calls made to a client by method, sleeping latency seconds per call like a request to the API"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def _call(self, method):
+        with self.lock:
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def total_calls(self):
+        """Returns the number of calls made so far, of every method"""
+        with self.lock:
+            return sum(self.calls.values())
+
+    def reset_calls(self):
+        """Starts counting calls from 0 again"""
+        with self.lock:
+            self.calls.clear()
+
+
+class ReplayClient(OfflineClient):
+    """Answers calls with the responses saved by a RecordingClient, raising KeyError for calls that weren't recorded"""
+
+    def __init__(self, fixture_folder, latency=0.0):
+        super().__init__(latency)
+        self.fixture_folder = fixture_folder
+
+    def _replay(self, method, *args, **kwargs):
+        self._call(method)
+        path = os.path.join(self.fixture_folder, fixture_name(method, args, kwargs))
+        if not os.path.exists(path):
+            raise KeyError(f'{method} was not recorded with the arguments {args} {kwargs}')
+        with open(path) as fixture:
+            return json.load(fixture)
+
+    def user_playlists(self, *args, **kwargs):
+        return self._replay('user_playlists', *args, **kwargs)
+
+    def user_playlist_tracks(self, *args, **kwargs):
+        return self._replay('user_playlist_tracks', *args, **kwargs)
+
+    def playlist_items(self, *args, **kwargs):
+        return self._replay('playlist_items', *args, **kwargs)
+
+    def playlist(self, *args, **kwargs):
+        return self._replay('playlist', *args, **kwargs)
+
+    def audio_features(self, *args, **kwargs):
+        return self._replay('audio_features', *args, **kwargs)
+
+    def next(self, result):
+        return self._replay('next', result['next']) if result.get('next') else None
+
+
+class SyntheticClient(OfflineClient):
+    """
+    Makes up the library of a user with playlists playlists of tracks_per_playlist tracks each. The tracks are drawn
+    from unique_tracks different tracks (by default as many as the library holds), so the smaller unique_tracks, the
+    more tracks are shared between playlists. A missing_features fraction of the tracks have no audio features.
+    """
+
+    def __init__(self, playlists=10, tracks_per_playlist=100, unique_tracks=None, missing_features=0.01, seed=0,
+                 latency=0.0):
+        super().__init__(latency)
+        rng = np.random.default_rng(seed)
+        unique_tracks = unique_tracks or playlists * tracks_per_playlist
+        self.playlist_ids = {f'playlist{number}': number for number in range(playlists)}
+        # the number (in 0..unique_tracks) of each track of each playlist, one row per playlist
+        self.playlist_tracks = rng.integers(unique_tracks, size=(playlists, tracks_per_playlist), dtype=np.int64)
+        self.artists = rng.integers(max(unique_tracks // 10, 1), size=unique_tracks)
+        self.has_features = rng.random(unique_tracks) >= missing_features
+        self.features = {"danceability": rng.random(unique_tracks), "energy": rng.random(unique_tracks),
+                         "key": rng.integers(-1, 12, unique_tracks), "loudness": rng.uniform(-40, 0, unique_tracks),
+                         "mode": rng.integers(0, 2, unique_tracks), "speechiness": rng.random(unique_tracks),
+                         "instrumentalness": rng.random(unique_tracks), "liveness": rng.random(unique_tracks),
+                         "valence": rng.random(unique_tracks), "tempo": rng.uniform(60, 200, unique_tracks),
+                         "duration_ms": rng.integers(60_000, 600_000, unique_tracks),
+                         "time_signature": rng.integers(3, 6, unique_tracks)}
+
+    def _page(self, method, items, total, limit, offset, **query):
+        """Returns a page of items starting at offset, with a "next" link to the following page if there is one"""
+        next_page = None
+        if offset + limit < total:
+            next_page = f'synthetic://{method}?' + urlencode({**query, 'limit': limit, 'offset': offset + limit})
+        return {"items": items, "limit": limit, "offset": offset, "total": total, "next": next_page}
+
+    def _track(self, number):
+        return {"track": {"id": f'track{number}', "name": f'Track {number}', "type": "track",
+                          "album": {"name": f'Album {number // 10}',
+                                    "artists": [{"name": f'Artist {self.artists[number]}'}]}}}
+
+    def _playlists_page(self, user, limit, offset):
+        playlists = [{"id": playlist_id, "name": f'Playlist {number}', "snapshot_id": f'{playlist_id}-snapshot'}
+                     for playlist_id, number in list(self.playlist_ids.items())[offset:offset + limit]]
+        return self._page('user_playlists', playlists, len(self.playlist_ids), limit, offset, user=user)
+
+    def _tracks_page(self, method, playlist_id, limit, offset):
+        tracks = self.playlist_tracks[self.playlist_ids[playlist_id]]
+        return self._page(method, [self._track(int(number)) for number in tracks[offset:offset + limit]],
+                          len(tracks), limit, offset, playlist_id=playlist_id)
+
+    def user_playlists(self, user, limit=50, offset=0):
+        self._call('user_playlists')
+        return self._playlists_page(user, limit, offset)
+
+    def user_playlist_tracks(self, user=None, playlist_id=None, fields=None, limit=100, offset=0, market=None):
+        self._call('user_playlist_tracks')
+        return self._tracks_page('user_playlist_tracks', playlist_id, limit, offset)
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0, market=None,
+                       additional_types=("track", "episode")):
+        self._call('playlist_items')
+        return self._tracks_page('playlist_items', playlist_id, limit, offset)
+
+    def playlist(self, playlist_id, fields=None, market=None, additional_types=("track",)):
+        self._call('playlist')
+        return {"id": playlist_id, "name": f'Playlist {self.playlist_ids[playlist_id]}',
+                "snapshot_id": f'{playlist_id}-snapshot'}
+
+    def audio_features(self, tracks=()):
+        self._call('audio_features')
+        records = []
+        for track_id in [tracks] if isinstance(tracks, str) else tracks:
+            number = int(track_id.removeprefix('track'))
+            if not self.has_features[number]:
+                records.append(None)
+                continue
+            # .item() turns the NumPy scalars into the Python numbers Spotify's JSON would hold
+            record = {feature: values[number].item() for feature, values in self.features.items()}
+            records.append({**record, "id": track_id, "type": "audio_features"})
+        return records
+
+    def next(self, result):
+        if not result.get('next'):
+            return None
+        self._call('next')
+        url = urlparse(result['next'])
+        query = dict(parse_qsl(url.query))
+        limit, offset = int(query.pop('limit')), int(query.pop('offset'))
+        if url.netloc == 'user_playlists':
+            return self._playlists_page(query['user'], limit, offset)
+        return self._tracks_page(url.netloc, query['playlist_id'], limit, offset)
@@ -0,0 +1,154 @@
+# A persistent on-disk cache for the Spotify data used by spotify_tools, stored in a single SQLite file
+
+# The cache holds four kinds of entries, each in its own namespace:
+# • "features": the audio features of a track, keyed by track ID (None for tracks Spotify has no features for)
+# • "playlist_tracks": the tracks of a playlist, keyed by the playlist's ID and snapshot ID (see playlist_tracks_key),
+#   which changes whenever the playlist changes, so a cached track list never goes out of date
+# • "user_playlists": the playlists of a user (with their snapshot IDs), keyed by username
+# • "snapshots": the snapshot ID of a playlist, keyed by playlist ID
+# The last two are what tell which cached track lists are current, so they are only kept for an hour: a playlist
+# edited in that time is still read at its cached snapshot, unless spotify_tools is asked to refresh them.
+# Entries expire after the TTL of their namespace, and the least recently used entries are evicted once the cache
+# takes up more than max_bytes.
+
+import json
+import sqlite3
+import threading
+import time
+
+# default location of the cache file
+CACHE_PATH = 'spotify_cache.sqlite'
+
+# default number of seconds entries of each namespace are kept for
+DEFAULT_TTLS = {"features": 30 * 24 * 60 * 60, "playlist_tracks": 30 * 24 * 60 * 60, "user_playlists": 60 * 60,
+                "snapshots": 60 * 60}
+
+# default maximum size of the cached values
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# SQLite limits the number of parameters in one statement, so keys are looked up this many at a time
+LOOKUP_BATCH_SIZE = 500
+
+
+def playlist_tracks_key(playlist_id, snapshot_id):
+    """Returns the key of the tracks of a playlist at a snapshot"""
+    # snapshot IDs are opaque version strings, which aren't guaranteed to be unique across playlists
+    return f"{playlist_id}:{snapshot_id}"
+
+
+class SpotifyCache:
+    """Caches JSON-serializable values by (namespace, key) in SQLite, with TTL and size-based eviction"""
+
+    def __init__(self, path=CACHE_PATH, ttls=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # the connection is shared by threads, so every use of it holds the lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    stored_at REAL NOT NULL,
+                    used_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (namespace, stored_at)")
+            # the total size of the cached values, kept up to date by put_many, _evict and clear so that checking it
+            # doesn't scan the whole table
+            self.bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get_many(self, namespace, keys):
+        """Returns a dict of the keys that are cached in namespace and haven't expired, mapped to their values"""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        oldest = now - self.ttls[namespace]
+        found = {}
+        with self.lock, self.connection:
+            for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + LOOKUP_BATCH_SIZE]
+                rows = self.connection.execute(
+                    f"SELECT key, value FROM entries WHERE namespace = ? AND stored_at >= ? "
+                    f"AND key IN ({', '.join('?' * len(batch))})", [namespace, oldest, *batch])
+                found.update((key, json.loads(value)) for key, value in rows)
+            # mark the entries as used, for least recently used eviction
+            self.connection.executemany("UPDATE entries SET used_at = ? WHERE namespace = ? AND key = ?",
+                                        [(now, namespace, key) for key in found])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, namespace, key, default=None):
+        """Returns the value cached for key in namespace, or default if it isn't cached or has expired"""
+        return self.get_many(namespace, [key]).get(key, default)
+
+    def put_many(self, namespace, values):
+        """Caches every (key, value) of the dict values in namespace, then evicts entries if needed"""
+        now = time.time()
+        rows = []
+        for key, value in values.items():
+            value = json.dumps(value)
+            rows.append((namespace, key, value, len(value), now, now))
+        with self.lock, self.connection:
+            # the values being replaced no longer count towards the total size
+            self.bytes -= self._size(namespace, list(values))
+            self.connection.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.bytes += sum(row[3] for row in rows)
+            self._evict(now)
+
+    def put(self, namespace, key, value):
+        """Caches value for key in namespace"""
+        self.put_many(namespace, {key: value})
+
+    def _size(self, namespace, keys):
+        """Returns the total size of the values cached for keys in namespace"""
+        size = 0
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[start:start + LOOKUP_BATCH_SIZE]
+            size += self.connection.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM entries WHERE namespace = ? "
+                f"AND key IN ({', '.join('?' * len(batch))})", [namespace, *batch]).fetchone()[0]
+        return size
+
+    def _evict(self, now):
+        """Removes expired entries, then the least recently used entries until the cache fits in max_bytes"""
+        for namespace, ttl in self.ttls.items():
+            # both statements only read the expired range of the (namespace, stored_at) index
+            expired = "FROM entries WHERE namespace = ? AND stored_at < ?"
+            self.bytes -= self.connection.execute(f"SELECT COALESCE(SUM(size), 0) {expired}",
+                                                  (namespace, now - ttl)).fetchone()[0]
+            self.connection.execute(f"DELETE {expired}", (namespace, now - ttl))
+        excess = self.bytes - self.max_bytes
+        if excess > 0:
+            evicted = []
+            for namespace, key, size in self.connection.execute(
+                    "SELECT namespace, key, size FROM entries ORDER BY used_at"):
+                evicted.append((namespace, key))
+                excess -= size
+                self.bytes -= size
+                if excess <= 0:
+                    break
+            self.connection.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", evicted)
+
+    def stats(self):
+        """Returns the number of hits and misses so far, and the number of entries and bytes cached"""
+        with self.lock:
+            entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def clear(self):
+        """Removes every cached entry"""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM entries")
+            self.bytes = 0
+
+    def close(self):
+        """Closes the cache file"""
+        self.connection.close()
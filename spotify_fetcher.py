@@ -0,0 +1,167 @@
+# A concurrent fetch engine for the Spotify API, used by spotify_tools to crawl a whole library at once
+
+# Requests are made by a pool of threads, so that several playlists, track pages and feature batches are fetched at the
+# same time. When Spotify answers 429 (Too Many Requests), every thread waits for the number of seconds in its
+# Retry-After header before sending another request. Other failed requests (5xx, connection errors) are retried with
+# exponential backoff and full jitter. The number of requests, retries and their latencies are recorded in FetchStats.
+
+# Spotipy's own session retries 429s itself, sleeping inside the request and dropping the Retry-After header, so for the
+# fetcher to schedule around rate limits, give the client a plain requests session:
+# sp = spotipy.Spotify(client_credentials_manager=..., requests_session=requests.Session())
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# default number of requests in flight at once
+DEFAULT_MAX_WORKERS = 8
+
+# default number of times a failed request is retried, and the backoff before the first and longest retries (seconds)
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 30.0
+
+# HTTP statuses worth retrying: rate limited, or a temporary server error
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def retry_after(exception):
+    """Returns the number of seconds in the Retry-After header of a failed request, or None if it has none"""
+    headers = getattr(exception, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exception):
+    """Returns True for failed requests that may succeed if sent again"""
+    status = getattr(exception, 'http_status', None)
+    if status is not None:
+        return status in RETRY_STATUSES
+    # connection errors and timeouts, including those raised by requests, are all OSErrors
+    return isinstance(exception, OSError)
+
+
+class FetchStats:
+    """Counts the requests made by a SpotifyFetcher, with their latencies, and the retries and rate limits hit"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.perf_counter()
+        self.latencies = []
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+
+    def record(self, latency=None, retried=False, rate_limited=False, failed=False):
+        with self.lock:
+            if latency is not None:
+                self.latencies.append(latency)
+            self.retries += retried
+            self.rate_limited += rate_limited
+            self.failures += failed
+
+    def summary(self):
+        """Returns the number of requests, retries and rate limits, the requests per second, and latency percentiles"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            elapsed = time.perf_counter() - self.started_at
+
+        def percentile(fraction):
+            return latencies[min(int(fraction * len(latencies)), len(latencies) - 1)] if latencies else None
+
+        return {'requests': len(latencies), 'retries': self.retries, 'rate_limited': self.rate_limited,
+                'failures': self.failures, 'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+                'latency_p50': percentile(0.5), 'latency_p95': percentile(0.95), 'latency_max': percentile(1.0)}
+
+
+class SpotifyFetcher:
+    """Calls the methods of a spotipy client from a pool of threads, retrying rate-limited and failed requests"""
+
+    def __init__(self, spotipy_client, max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.spotipy_client = spotipy_client
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = FetchStats()
+        self.executor = ThreadPoolExecutor(max_workers)
+        # no thread sends a request before this time, which is pushed back whenever Spotify rate limits a request
+        self.lock = threading.Lock()
+        self.resume_at = 0.0
+
+    def backoff(self, attempt):
+        """Returns a random delay of up to base_delay * 2 ** attempt seconds (exponential backoff with full jitter)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def wait_for_rate_limit(self):
+        """Sleeps until requests may be sent again"""
+        while True:
+            with self.lock:
+                delay = self.resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def call(self, method, *args, **kwargs):
+        """Calls spotipy_client.method(*args, **kwargs), retrying it if it is rate limited or fails temporarily"""
+        for attempt in range(self.max_retries + 1):
+            self.wait_for_rate_limit()
+            start = time.perf_counter()
+            try:
+                result = getattr(self.spotipy_client, method)(*args, **kwargs)
+            except Exception as exception:
+                self.stats.record(time.perf_counter() - start)
+                if attempt == self.max_retries or not is_retryable(exception):
+                    self.stats.record(failed=True)
+                    raise
+                delay = retry_after(exception)
+                if getattr(exception, 'http_status', None) == 429:
+                    # rate limited: every thread waits, for as long as Spotify asked or else the backoff
+                    delay = delay if delay is not None else self.backoff(attempt)
+                    with self.lock:
+                        self.resume_at = max(self.resume_at, time.monotonic() + delay)
+                    self.stats.record(retried=True, rate_limited=True)
+                else:
+                    # another temporary failure: only this request waits
+                    self.stats.record(retried=True)
+                    time.sleep(delay if delay is not None else self.backoff(attempt))
+                continue
+            self.stats.record(time.perf_counter() - start)
+            return result
+
+    def submit(self, method, *args, **kwargs):
+        """Starts call(method, *args, **kwargs) on the pool of threads, returning its Future"""
+        return self.executor.submit(self.call, method, *args, **kwargs)
+
+    def map(self, method, argument_tuples):
+        """Calls spotipy_client.method with each tuple of arguments concurrently, returning the results in order"""
+        return list(self.executor.map(lambda arguments: self.call(method, *arguments), argument_tuples))
+
+    def all_items(self, method, argument_tuples, page_size):
+        """
+        Returns the items of every page of a paged method (like user_playlist_tracks), for each tuple of arguments.
+        The first pages are fetched concurrently, then every remaining page of every result at once, by offset.
+        """
+        first_pages = self.executor.map(lambda arguments: self.call(method, *arguments, limit=page_size, offset=0),
+                                        argument_tuples)
+        items = []
+        remaining = []
+        for position, (arguments, page) in enumerate(zip(argument_tuples, first_pages)):
+            items.append(list(page['items']))
+            for offset in range(page_size, page['total'], page_size):
+                remaining.append((position, arguments, offset))
+
+        pages = self.executor.map(
+            lambda request: self.call(method, *request[1], limit=page_size, offset=request[2]), remaining)
+        # pages come back in order of offset, so appending them keeps every result in order
+        for (position, arguments, offset), page in zip(remaining, pages):
+            items[position].extend(page['items'])
+        return items
+
+    def close(self):
+        """Shuts down the thread pool"""
+        self.executor.shutdown()
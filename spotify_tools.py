@@ -2,8 +2,15 @@
 
 # import the following libraries
 
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
+import plotly.io as pio
+
+from spotify_cache import playlist_tracks_key
 
 
 # Replace with your own Spotify API credentials
@@ -13,106 +20,388 @@ import plotly.graph_objects as go
 # Initialize Spotipy client
 # sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials(client_id, client_secret))
 
-def get_audio_features_df(playlist, spotipy_client):
-    # Create an empty dataframe
-    playlist_features_list = ["artist", "album", "track_name", "track_id", "danceability", "energy", "key", "loudness",
-                              "mode", "speechiness", "instrumentalness", "liveness", "valence", "tempo", "duration_ms",
-                              "time_signature"]
-    playlist_df = pd.DataFrame(columns=playlist_features_list)
-
-    # Loop through every track in the playlist, extract features and append the features to the playlist df
-    for track in playlist["items"]:
-        # Create empty dict
-        playlist_features = {}
+# The columns of a playlist df: the track metadata, then its audio features
+AUDIO_FEATURES_LIST = ["danceability", "energy", "key", "loudness", "mode", "speechiness", "instrumentalness",
+                       "liveness", "valence", "tempo", "duration_ms", "time_signature"]
+PLAYLIST_FEATURES_LIST = ["artist", "album", "track_name", "track_id"] + AUDIO_FEATURES_LIST
+
+# Audio features that are whole numbers are stored as nullable integers, the rest as floats
+AUDIO_FEATURE_DTYPES = {feature: "float64" for feature in AUDIO_FEATURES_LIST}
+AUDIO_FEATURE_DTYPES.update({"key": "Int64", "mode": "Int64", "duration_ms": "Int64", "time_signature": "Int64"})
+
+# The audio features endpoint accepts up to 100 track IDs per call
+AUDIO_FEATURES_BATCH_SIZE = 100
+
+# Size of radar chart images, and the percentiles of the band shown by aggregate radar charts
+RADAR_WIDTH = 1200
+RADAR_HEIGHT = 800
+RADAR_PERCENTILES = (10, 90)
+
+# The largest pages of playlists and playlist tracks the API returns
+USER_PLAYLISTS_PAGE_SIZE = 50
+PLAYLIST_TRACKS_PAGE_SIZE = 100
+
+
+def get_audio_features(track_ids, spotipy_client, batch_size=AUDIO_FEATURES_BATCH_SIZE, cache=None, fetcher=None):
+    # Fetch the audio features of every track in batches, returning a dict of track ID -> features
+    # Tracks without an ID (local files) are skipped, and tracks Spotify has no features for map to None
+    unique_ids = list(dict.fromkeys(track_id for track_id in track_ids if track_id))
+
+    # With a SpotifyCache, only the tracks that aren't cached are fetched
+    audio_features = cache.get_many("features", unique_ids) if cache is not None else {}
+    missing_ids = [track_id for track_id in unique_ids if track_id not in audio_features]
+
+    # With a SpotifyFetcher, the batches are fetched concurrently
+    batches = [missing_ids[start:start + batch_size] for start in range(0, len(missing_ids), batch_size)]
+    if fetcher is not None:
+        batch_records = fetcher.map("audio_features", [(batch,) for batch in batches])
+    else:
+        batch_records = (spotipy_client.audio_features(batch) for batch in batches)
+
+    fetched_features = {}
+    for batch, records in zip(batches, batch_records):
+        # Spotify returns one record per ID, in the same order, with None for unknown tracks
+        for track_id, record in zip(batch, records or []):
+            fetched_features[track_id] = record
+
+    if cache is not None and fetched_features:
+        cache.put_many("features", fetched_features)
+    audio_features.update(fetched_features)
+    return audio_features
+
+
+def track_metadata(track):
+    # Keep only the parts of a playlist track that tracks_to_df uses, so that cached track lists stay small
+    return {"track": {"id": track["track"]["id"],
+                      "name": track["track"]["name"],
+                      "album": {"name": track["track"]["album"]["name"],
+                                "artists": [{"name": track["track"]["album"]["artists"][0]["name"]}]}}}
+
+
+def tracks_to_df(tracks, audio_features):
+    # Gather the metadata and audio features of the tracks into one list per column, then create the DataFrame once
+    # (appending one-row DataFrames copies the whole result for every track)
+    columns = {column: [] for column in PLAYLIST_FEATURES_LIST}
+    for track in tracks:
         # Get metadata
-        playlist_features["artist"] = track["track"]["album"]["artists"][0]["name"]
-        playlist_features["album"] = track["track"]["album"]["name"]
-        playlist_features["track_name"] = track["track"]["name"]
-        playlist_features["track_id"] = track["track"]["id"]
+        columns["artist"].append(track["track"]["album"]["artists"][0]["name"])
+        columns["album"].append(track["track"]["album"]["name"])
+        columns["track_name"].append(track["track"]["name"])
+        columns["track_id"].append(track["track"]["id"])
 
-        # Get audio features
-        audio_features = spotipy_client.audio_features(playlist_features["track_id"])[0]
-        for feature in playlist_features_list[4:]:
-            playlist_features[feature] = audio_features[feature]
+        # Get audio features, left empty if Spotify has none for the track
+        track_features = audio_features.get(track["track"]["id"]) or {}
+        for feature in AUDIO_FEATURES_LIST:
+            columns[feature].append(track_features.get(feature))
 
-        # Concat the DataFrames
-        track_df = pd.DataFrame(playlist_features, index=[0])
-        playlist_df = pd.concat([playlist_df, track_df], ignore_index=True)
+    # The audio feature columns get fixed numeric dtypes, with missing features as NaN/<NA>
+    return pd.DataFrame({column: pd.Series(values, dtype=AUDIO_FEATURE_DTYPES.get(column, object))
+                         for column, values in columns.items()})
 
-    return playlist_df
 
+def get_audio_features_df(playlist, spotipy_client, audio_features=None, cache=None):
+    # Get the audio features of every track in the playlist at once, unless they were already fetched
+    if audio_features is None:
+        audio_features = get_audio_features([track["track"]["id"] for track in playlist["items"]], spotipy_client,
+                                            cache=cache)
 
-def analyze_playlist(creator, playlist_id, spotipy_client):
-    playlist_features_list = ["artist", "album", "track_name", "track_id",
-                              "danceability", "energy", "key", "loudness", "mode", "speechiness",
-                              "instrumentalness", "liveness", "valence", "tempo", "duration_ms", "time_signature"]
-    playlist_df = pd.DataFrame(columns=playlist_features_list)
+    # Extract the metadata and features of every track in the playlist into the playlist df
+    return tracks_to_df(playlist["items"], audio_features)
 
-    playlist_features = {}
 
-    playlist = spotipy_client.user_playlist_tracks(creator, playlist_id)["items"]
-    for track in playlist:
-        playlist_features["artist"] = track["track"]["album"]["artists"][0]["name"]
-        playlist_features["album"] = track["track"]["album"]["name"]
-        playlist_features["track_name"] = track["track"]["name"]
-        playlist_features["track_id"] = track["track"]["id"]
+def iterate_pages(page, spotipy_client):
+    # Yield a page of a paged Spotify result and every page after it, following the "next" links
+    while page:
+        yield page
+        page = spotipy_client.next(page) if page.get("next") else None
 
-        audio_features = spotipy_client.audio_features(playlist_features["track_id"])[0]
-        for feature in playlist_features_list[4:]:
-            playlist_features[feature] = audio_features[feature]
 
-        track_df = pd.DataFrame(playlist_features, index=[0])
-        playlist_df = pd.concat([playlist_df, track_df], ignore_index=True)
+def iterate_playlist_tracks(creator, playlist_id, spotipy_client):
+    # Yield the tracks of a playlist one page (up to 100 tracks) at a time, as each page arrives
+    for page in iterate_pages(spotipy_client.user_playlist_tracks(creator, playlist_id), spotipy_client):
+        yield page["items"]
 
-    return playlist_df
 
+def get_snapshot_id(playlist_id, spotipy_client, cache, refresh=False):
+    # Look up the snapshot ID of a playlist, which changes whenever the playlist changes
+    # It is cached for an hour, so that a warm run makes no calls at all; refresh=True looks it up again
+    snapshot_id = None if refresh else cache.get("snapshots", playlist_id)
+    if snapshot_id is None:
+        snapshot_id = spotipy_client.playlist(playlist_id, fields="snapshot_id")["snapshot_id"]
+        cache.put("snapshots", playlist_id, snapshot_id)
+    return snapshot_id
 
-def analyze_playlist_dict(playlist_dict, spotipy_client):
-    for i, (key, val) in enumerate(playlist_dict.items()):
-        playlist_df = analyze_playlist(*val, spotipy_client=spotipy_client)
-        playlist_df["playlist"] = key
 
-        if i == 0:
-            playlist_dict_df = playlist_df
-        else:
-            playlist_dict_df = pd.concat([playlist_dict_df, playlist_df], ignore_index=True)
+def page_and_fetch_features(pages, audio_features, fetcher, cache=None, batch_size=AUDIO_FEATURES_BATCH_SIZE):
+    # Collect the tracks of every page as it arrives, while the threads of a SpotifyFetcher fetch the features of the
+    # tracks already paged, adding them to audio_features
+    # A batch is only sent once it is full (so only the last one can be short), and the next pages are read while it is
+    # fetched
+    tracks, pending, batches = [], [], []
+    seen = set(audio_features)
+    for page in pages:
+        tracks.extend(page)
+        new_ids = list(dict.fromkeys(track["track"]["id"] for track in page
+                                     if track["track"]["id"] and track["track"]["id"] not in seen))
+        seen.update(new_ids)
+        # With a SpotifyCache, only the tracks that aren't cached are fetched
+        if cache is not None:
+            cached_features = cache.get_many("features", new_ids)
+            audio_features.update(cached_features)
+            new_ids = [track_id for track_id in new_ids if track_id not in cached_features]
+        pending.extend(new_ids)
+        while len(pending) >= batch_size:
+            batches.append((pending[:batch_size], fetcher.submit("audio_features", pending[:batch_size])))
+            del pending[:batch_size]
+    if pending:
+        batches.append((pending, fetcher.submit("audio_features", pending)))
+
+    fetched_features = {}
+    for batch, records in batches:
+        # Spotify returns one record per ID, in the same order, with None for unknown tracks
+        for track_id, record in zip(batch, records.result() or []):
+            fetched_features[track_id] = record
+    if cache is not None and fetched_features:
+        cache.put_many("features", fetched_features)
+    audio_features.update(fetched_features)
+    return tracks
+
+
+def analyze_playlist(creator, playlist_id, spotipy_client, audio_features=None, cache=None, snapshot_id=None,
+                     refresh=False, fetcher=None):
+    # audio_features can be a dict shared between calls, so that tracks in several playlists are only fetched once
+    if audio_features is None:
+        audio_features = {}
 
-    return playlist_dict_df
+    # With a SpotifyCache, the tracks of the playlist are cached under its ID and snapshot ID, which changes whenever
+    # the playlist changes (see get_snapshot_id if the caller doesn't already know it)
+    cached_tracks = None
+    if cache is not None:
+        if snapshot_id is None:
+            snapshot_id = get_snapshot_id(playlist_id, spotipy_client, cache, refresh)
+        cached_tracks = cache.get("playlist_tracks", playlist_tracks_key(playlist_id, snapshot_id))
 
+    if cached_tracks is not None:
+        pages = [cached_tracks]
+    else:
+        pages = iterate_playlist_tracks(creator, playlist_id, spotipy_client)
 
-def get_all_user_tracks(username, spotipy_client):
-    all_my_playlists = pd.DataFrame(spotipy_client.user_playlists(username))
+    if fetcher is not None:
+        # With a SpotifyFetcher, features are fetched in the background while the next pages are read
+        playlist = page_and_fetch_features(pages, audio_features, fetcher, cache)
+    else:
+        # Otherwise every call is made in turn, so the features of the tracks of every page are fetched at once, after
+        # the last page, so that the batches are full (fetching them page by page makes a short batch for every page)
+        playlist = [track for tracks in pages for track in tracks]
+        audio_features.update(get_audio_features([track["track"]["id"] for track in playlist
+                                                  if track["track"]["id"] not in audio_features], spotipy_client,
+                                                 cache=cache))
+
+    if cache is not None and cached_tracks is None:
+        cache.put("playlist_tracks", playlist_tracks_key(playlist_id, snapshot_id),
+                  [track_metadata(track) for track in playlist])
+    return tracks_to_df(playlist, audio_features)
+
+
+def analyze_playlist_dict(playlist_dict, spotipy_client, cache=None):
     list_of_dataframes = []
+    for key, val in playlist_dict.items():
+        playlist_df = analyze_playlist(*val, spotipy_client=spotipy_client, cache=cache)
+        playlist_df["playlist"] = key
+        list_of_dataframes.append(playlist_df)
+
+    # Concat the DataFrames once, at the end
+    return pd.concat(list_of_dataframes, ignore_index=True)
+
 
-    for playlist in all_my_playlists.index:
-        current_playlist = pd.DataFrame(
-            spotipy_client.user_playlist_tracks(username, all_my_playlists["items"][playlist]["id"]))
-        current_playlist_audio = get_audio_features_df(current_playlist, spotipy_client)
-        if all_my_playlists["items"][playlist]["name"]:
-            current_playlist_audio["playlist_name"] = all_my_playlists["items"][playlist]["name"]
+def playlist_summary(playlist):
+    # Keep the ID, name and snapshot ID of one of the user's playlists
+    return {"id": playlist["id"], "name": playlist["name"], "snapshot_id": playlist.get("snapshot_id")}
+
+
+def cached_user_playlists(username, cache, refresh=False):
+    # Return the cached playlists of the user, or None if they aren't cached (or refresh is True)
+    # The list tells which cached track lists are current, so it is only cached for an hour
+    return None if cache is None or refresh else cache.get("user_playlists", username)
+
+
+def cache_user_playlists(username, playlists, cache):
+    # Cache the playlists of the user, and the snapshot ID of each of them for get_snapshot_id
+    if cache is not None:
+        cache.put("user_playlists", username, playlists)
+        cache.put_many("snapshots", {playlist["id"]: playlist["snapshot_id"] for playlist in playlists
+                                     if playlist["snapshot_id"]})
+
+
+def iterate_user_playlists(username, spotipy_client, cache=None, refresh=False):
+    # Yield the ID, name and snapshot ID of each of the user's playlists
+    # With a SpotifyCache, the list is read from the cache if it was listed in the last hour, unless refresh is True
+    playlists = cached_user_playlists(username, cache, refresh)
+    if playlists is None:
+        playlists = [playlist_summary(playlist)
+                     for page in iterate_pages(spotipy_client.user_playlists(username), spotipy_client)
+                     for playlist in page["items"]]
+        cache_user_playlists(username, playlists, cache)
+    yield from playlists
+
+
+def iterate_user_tracks(username, spotipy_client, audio_features=None, cache=None, refresh=False):
+    # Yield a playlist df for each of the user's playlists, one playlist at a time, so that the whole library is never
+    # held in memory
+    for playlist in iterate_user_playlists(username, spotipy_client, cache, refresh):
+        current_playlist_audio = analyze_playlist(username, playlist["id"], spotipy_client, audio_features, cache,
+                                                  playlist["snapshot_id"], refresh)
+        if playlist["name"]:
+            current_playlist_audio["playlist_name"] = playlist["name"]
         else:
             current_playlist_audio["playlist_name"] = None
-        list_of_dataframes.append(current_playlist_audio)
+        yield current_playlist_audio
+
+
+def crawl_user_tracks(username, fetcher, cache=None, refresh=False):
+    # Like get_all_user_tracks, but the playlists, track pages and feature batches of the whole library are fetched
+    # concurrently by a SpotifyFetcher
+    playlists = cached_user_playlists(username, cache, refresh)
+    if playlists is None:
+        playlists = [playlist_summary(playlist)
+                     for playlist in fetcher.all_items("user_playlists", [(username,)], USER_PLAYLISTS_PAGE_SIZE)[0]]
+        cache_user_playlists(username, playlists, cache)
+    # Playlists without a snapshot ID are never cached
+    keys = [playlist_tracks_key(playlist["id"], playlist["snapshot_id"]) if playlist["snapshot_id"] else None
+            for playlist in playlists]
 
+    # Fetch the tracks of every playlist that isn't cached at once
+    cached_tracks = {}
+    if cache is not None:
+        cached_tracks = cache.get_many("playlist_tracks", [key for key in keys if key])
+    missing = [position for position, key in enumerate(keys) if key not in cached_tracks]
+    fetched_tracks = fetcher.all_items("user_playlist_tracks", [(username, playlists[position]["id"])
+                                                                for position in missing], PLAYLIST_TRACKS_PAGE_SIZE)
+    playlist_tracks = [cached_tracks.get(key) for key in keys]
+    for position, tracks in zip(missing, fetched_tracks):
+        playlist_tracks[position] = tracks
+    if cache is not None:
+        cache.put_many("playlist_tracks", {
+            keys[position]: [track_metadata(track) for track in playlist_tracks[position]]
+            for position in missing if keys[position]})
+
+    # Then the features of the whole library at once
+    audio_features = get_audio_features([track["track"]["id"] for tracks in playlist_tracks for track in tracks],
+                                        fetcher.spotipy_client, cache=cache, fetcher=fetcher)
+
+    list_of_dataframes = []
+    for playlist, tracks in zip(playlists, playlist_tracks):
+        current_playlist_audio = tracks_to_df(tracks, audio_features)
+        current_playlist_audio["playlist_name"] = playlist["name"] if playlist["name"] else None
+        list_of_dataframes.append(current_playlist_audio)
     return pd.concat(list_of_dataframes)
 
 
-def createRadarElement(row, feature_cols):
-    return go.Scatterpolar(
-        r=row[feature_cols].values.tolist(),
-        theta=feature_cols,
-        mode='lines',
-        name=row['track_name'])
+def get_all_user_tracks(username, spotipy_client, cache=None, fetcher=None, refresh=False):
+    # With a SpotifyFetcher, the library is crawled concurrently
+    if fetcher is not None:
+        return crawl_user_tracks(username, fetcher, cache, refresh)
+
+    # Share the fetched features between playlists, so that tracks in several playlists are only fetched once
+    # With a SpotifyCache, running this again within an hour makes no calls at all; with refresh=True, it lists the
+    # user's playlists again, and only fetches the tracks of the playlists that changed
+    return pd.concat(iterate_user_tracks(username, spotipy_client, audio_features={}, cache=cache, refresh=refresh))
+
+
+def radar_figure(feature_matrix, track_names, features_list, title=None, aggregate=False,
+                 percentiles=RADAR_PERCENTILES):
+    # Build a radar chart straight from a tracks x features matrix, as a plain figure dict (skipping the validation of
+    # every trace that go.Scatterpolar does, which is most of the time taken for large playlists)
+    # With aggregate=True, the chart shows the mean of each feature and a band between two percentiles instead of one
+    # line per track, which stays readable for playlists with 1,000s of tracks
+    feature_matrix = np.asarray(feature_matrix, dtype=float).reshape(-1, len(features_list))
+    if aggregate:
+        # Features no track has (every feature, for an empty playlist) are left empty, without the warnings NumPy gives
+        # for taking the percentiles or mean of nothing
+        low, high, mean = np.full((3, len(features_list)), np.nan)
+        known = ~np.isnan(feature_matrix).all(axis=0)
+        if known.any():
+            low[known], high[known] = np.nanpercentile(feature_matrix[:, known], percentiles, axis=0)
+            mean[known] = np.nanmean(feature_matrix[:, known], axis=0)
+        data = [
+            # the band goes around the high percentile, then back around the low one
+            {"type": "scatterpolar", "r": high.tolist() + low[::-1].tolist(),
+             "theta": features_list + features_list[::-1], "fill": "toself", "mode": "lines", "opacity": 0.3,
+             "name": f"{percentiles[0]}th-{percentiles[1]}th percentile"},
+            {"type": "scatterpolar", "r": mean.tolist(), "theta": features_list, "mode": "lines", "name": "mean"}]
+    else:
+        data = [{"type": "scatterpolar", "r": r, "theta": features_list, "mode": "lines", "name": name}
+                for r, name in zip(feature_matrix.tolist(), track_names)]
+    return {"data": data, "layout": {"title": {"text": title}} if title else {}}
+
+
+def write_radar_images(figures, paths, width=RADAR_WIDTH, height=RADAR_HEIGHT):
+    # Write several figures with one call, so that the image export engine (kaleido) is started once for all of them
+    if hasattr(pio, "write_images"):
+        pio.write_images(figures, paths, width=width, height=height, validate=False)
+    else:
+        for figure, path in zip(figures, paths):
+            pio.write_image(figure, path, width=width, height=height, validate=False)
+
+
+def render_radar_images(playlists, features_list, aggregate=False, width=RADAR_WIDTH, height=RADAR_HEIGHT):
+    # Build and write the radar chart of each (path, feature matrix, track names) of playlists
+    # Runs in the worker processes of render_radar_plots
+    figures = [radar_figure(feature_matrix, track_names, features_list, aggregate=aggregate)
+               for path, feature_matrix, track_names in playlists]
+    write_radar_images(figures, [path for path, feature_matrix, track_names in playlists], width, height)
+    return [path for path, feature_matrix, track_names in playlists]
+
+
+def render_radar_plots(playlist_dfs, features_list, aggregate=False, workers=None, width=RADAR_WIDTH,
+                       height=RADAR_HEIGHT):
+    # Render the radar chart of every playlist df in the dict playlist_dfs (image path -> df) in a pool of processes
+    # Each process builds and writes its share of the playlists in one go, reusing one image export engine
+    # Only the feature matrices and track names are sent to the processes, not the whole dfs
+    playlists = [(path, playlist_df[features_list].to_numpy(dtype=float), playlist_df["track_name"].tolist())
+                 for path, playlist_df in playlist_dfs.items()]
+    workers = min(workers or os.cpu_count(), len(playlists))
+    if workers <= 1:
+        return render_radar_images(playlists, features_list, aggregate, width, height)
+
+    shares = [playlists[worker::workers] for worker in range(workers)]
+    with ProcessPoolExecutor(workers) as executor:
+        written = executor.map(partial(render_radar_images, features_list=features_list, aggregate=aggregate,
+                                       width=width, height=height), shares)
+        return [path for paths in written for path in paths]
+
+
+def get_playlist_items_df(playlist_id, spotipy_client, cache=None, refresh=False):
+    # Get the metadata and features of every track of a playlist (every page of playlist_items), skipping items that
+    # aren't tracks, like removed tracks and podcast episodes
+    # With a SpotifyCache, the tracks are cached under the playlist's ID and snapshot ID, like in analyze_playlist
+    tracks = None
+    if cache is not None:
+        key = playlist_tracks_key(playlist_id, get_snapshot_id(playlist_id, spotipy_client, cache, refresh))
+        tracks = cache.get("playlist_tracks", key)
+    if tracks is None:
+        tracks = [item for page in iterate_pages(spotipy_client.playlist_items(playlist_id), spotipy_client)
+                  for item in page["items"] if item.get("track") and item["track"].get("type", "track") == "track"]
+        if cache is not None:
+            cache.put("playlist_tracks", key, [track_metadata(track) for track in tracks])
+    audio_features = get_audio_features([track["track"]["id"] for track in tracks], spotipy_client, cache=cache)
+    return tracks_to_df(tracks, audio_features)
 
 
-def get_radar_plot(playlist_id, features_list, spotipy_client):
-    current_playlist_audio_df = get_audio_features_df(pd.DataFrame(spotipy_client.playlist_items(playlist_id)))
-    current_data = list(current_playlist_audio_df.apply(createRadarElement, axis=1, args=(features_list,)))
-    fig = go.Figure(current_data, )
-    fig.show(renderer='iframe')
-    fig.write_image(playlist_id + '.png', width=1200, height=800)
+def get_radar_plot(playlist_id, features_list, spotipy_client, aggregate=False, cache=None, refresh=False):
+    current_playlist_audio_df = get_playlist_items_df(playlist_id, spotipy_client, cache, refresh)
+    feature_matrix = current_playlist_audio_df[features_list].to_numpy(dtype=float)
+    # The figure dict is shown and written as it is, without building (and validating) a go.Figure from it
+    figure = radar_figure(feature_matrix, current_playlist_audio_df["track_name"].tolist(), features_list,
+                          aggregate=aggregate)
+    pio.show(figure, renderer='iframe', validate=False)
+    write_radar_images([figure], [playlist_id + '.png'])
+    return figure
 
 
-def get_radar_plots(playlist_id_list, features_list):
-    for item in playlist_id_list:
-        get_radar_plot(item, features_list)
\ No newline at end of file
+def get_radar_plots(playlist_id_list, features_list, spotipy_client, aggregate=False, workers=None, cache=None,
+                    refresh=False):
+    # Fetch every playlist, then render all of their images at once in a pool of processes
+    playlist_dfs = {playlist_id + '.png': get_playlist_items_df(playlist_id, spotipy_client, cache, refresh)
+                    for playlist_id in playlist_id_list}
+    return render_radar_plots(playlist_dfs, features_list, aggregate, workers)
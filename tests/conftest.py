@@ -0,0 +1,11 @@
+"""
+Shared setup of the tests of the Spotify tools at the root of the repository.
+
+To run the tests (from the root of the repository):
+`python -m pytest tests`
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,119 @@
+"""
+A local HTTP server answering the Spotify Web API endpoints spotify_tools uses, for testing SpotifyFetcher against real
+requests and responses.
+
+The library served is a SyntheticClient's, with the "next" link of each page pointing at the server. Failures are
+scripted per endpoint with fail(): the next requests to it are answered with the given statuses (and Retry-After
+headers) before it answers normally again, and a random delay can be added to every response so that concurrent
+requests complete out of order. Every request is logged with its status.
+
+To point a spotipy client at it:
+`client = spotipy.Spotify(auth="token", requests_session=requests.Session()); client.prefix = server.prefix`
+"""
+
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+
+class MockSpotifyServer:
+    """Serves the library of a SyntheticClient on a free local port, in a background thread"""
+
+    def __init__(self, library, max_delay=0.0):
+        self.library = library
+        # each response is delayed by a random time of up to max_delay seconds
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        # the scripted failures of each endpoint, as (status, Retry-After) pairs, answered first
+        self.failures = defaultdict(deque)
+        # (time.monotonic(), endpoint, status) of every request, in the order they were answered
+        self.log = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.prefix = f"http://127.0.0.1:{self.server.server_address[1]}/v1/"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail(self, endpoint, status, retry_after=None, times=1):
+        """Answers the next times requests to endpoint with status, and a Retry-After header if retry_after is set"""
+        with self.lock:
+            self.failures[endpoint].extend([(status, retry_after)] * times)
+
+    def requests(self, endpoint=None):
+        """Returns the (time, endpoint, status) of the requests answered so far, to endpoint if it is given"""
+        with self.lock:
+            return [request for request in self.log if endpoint is None or request[1] == endpoint]
+
+    def answer(self, path, query):
+        """Returns the endpoint of a request, and the status, headers and JSON body to answer it with"""
+        parts = path.removeprefix("/v1/").strip("/").split("/")
+        limit, offset = int(query.get("limit", 50)), int(query.get("offset", 0))
+        if parts[0] == "users" and parts[2:] == ["playlists"]:
+            endpoint, answer = "playlists", lambda: self.library.user_playlists(parts[1], limit, offset)
+        elif parts[0] == "playlists" and len(parts) == 2:
+            endpoint, answer = "playlist", lambda: self.library.playlist(parts[1], query.get("fields"))
+        elif parts[0] == "playlists" and parts[2:] in (["items"], ["tracks"]):
+            endpoint, answer = "tracks", lambda: self.library.playlist_items(parts[1], limit=limit, offset=offset)
+        elif parts == ["audio-features"]:
+            endpoint, answer = "audio-features", lambda: {
+                "audio_features": self.library.audio_features(query["ids"].split(","))}
+        else:
+            return None, 404, {}, {"error": {"status": 404, "message": "Service not found"}}
+
+        with self.lock:
+            failure = self.failures[endpoint].popleft() if self.failures[endpoint] else None
+        if failure is not None:
+            status, retry_after = failure
+            headers = {} if retry_after is None else {"Retry-After": str(retry_after)}
+            return endpoint, status, headers, {"error": {"status": status, "message": "Scripted failure"}}
+        try:
+            return endpoint, 200, {}, self.link_pages(answer())
+        except KeyError:
+            return endpoint, 404, {}, {"error": {"status": 404, "message": "Non existing id"}}
+
+    def link_pages(self, body):
+        """Points the "next" link of a page of the library at the URL of the same page on the server"""
+        if body.get("next"):
+            url = urlparse(body["next"])
+            query = dict(parse_qsl(url.query))
+            if url.netloc == "user_playlists":
+                path = f"users/{query.pop('user')}/playlists"
+            else:
+                path = f"playlists/{query.pop('playlist_id')}/items"
+            body = {**body, "next": f"{self.prefix}{path}?{urlencode(query)}"}
+        return body
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                endpoint, status, headers, body = server.answer(url.path, dict(parse_qsl(url.query)))
+                time.sleep(random.uniform(0, server.max_delay))
+                with server.lock:
+                    server.log.append((time.monotonic(), endpoint, status))
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,53 @@
+"""Tests of saving playlist dfs to Parquet and Arrow files and reading them back"""
+
+import pandas as pd
+import pytest
+
+from playlist_dataset import NARROW_DTYPES, compact_playlist_df, load_playlist_dataset, save_playlist_dataset
+from replay_client import SyntheticClient
+from spotify_tools import analyze_playlist_dict
+
+FORMATS = ["library.parquet", "library.arrow", "library.feather"]
+
+# columns of text unique to each track, read back as object or, from pandas 3, str columns
+TEXT_COLUMNS = ["track_name", "track_id"]
+
+
+@pytest.fixture(scope="module")
+def playlist_df():
+    # some tracks without features, so that the nullable integer columns have missing values
+    client = SyntheticClient(playlists=3, tracks_per_playlist=200, unique_tracks=300, missing_features=0.1)
+    return analyze_playlist_dict({f"Playlist {number}": ("user", f"playlist{number}") for number in range(3)}, client)
+
+
+@pytest.mark.parametrize("name", FORMATS)
+def test_a_saved_dataset_reads_back_the_same(tmp_path, playlist_df, name):
+    path = str(tmp_path / name)
+    save_playlist_dataset(playlist_df, path)
+    loaded = load_playlist_dataset(path).astype({column: object for column in TEXT_COLUMNS})
+    pd.testing.assert_frame_equal(loaded, compact_playlist_df(playlist_df))
+    # only the narrowing of the features changes the values, by less than float32 rounding
+    pd.testing.assert_frame_equal(loaded.astype(playlist_df.dtypes), playlist_df, check_categorical=False, rtol=1e-6)
+
+
+@pytest.mark.parametrize("name", FORMATS)
+def test_dtypes_survive_the_round_trip(tmp_path, playlist_df, name):
+    path = str(tmp_path / name)
+    save_playlist_dataset(playlist_df, path)
+    dtypes = load_playlist_dataset(path).dtypes
+    for column in ["artist", "album", "playlist"]:
+        assert isinstance(dtypes[column], pd.CategoricalDtype)
+    for column, dtype in NARROW_DTYPES.items():
+        if column in playlist_df.columns:
+            assert dtypes[column] == dtype
+    assert all(pd.api.types.is_string_dtype(dtypes[column]) for column in TEXT_COLUMNS)
+    assert load_playlist_dataset(path)["key"].isna().any()
+
+
+@pytest.mark.parametrize("name", FORMATS)
+def test_columns_are_projected(tmp_path, playlist_df, name):
+    path = str(tmp_path / name)
+    save_playlist_dataset(playlist_df, path)
+    loaded = load_playlist_dataset(path, columns=["valence", "energy", "playlist"])
+    assert loaded.columns.tolist() == ["valence", "energy", "playlist"]
+    pd.testing.assert_frame_equal(loaded, compact_playlist_df(playlist_df)[["valence", "energy", "playlist"]])
@@ -0,0 +1,66 @@
+"""Checks that the offline clients of replay_client answer spotify_tools the same way, run by run"""
+
+import pandas as pd
+import pytest
+
+from benchmark_spotify_tools import entry_points
+from replay_client import RecordingClient, ReplayClient, SyntheticClient
+from spotify_tools import iterate_user_playlists
+
+USER = "synthetic_user"
+
+
+def run_entry_points(client, calls_of, cache_path):
+    """Returns the result and the calls counted by calls_of of each entry point of benchmark_spotify_tools"""
+    playlists = list(iterate_user_playlists(USER, client))
+    results = {}
+    for name, function in entry_points(client, USER, playlists, cache_path):
+        calls_of.reset_calls()
+        results[name] = (function(), dict(calls_of.calls))
+    return results
+
+
+@pytest.fixture(scope="module")
+def recorded(tmp_path_factory):
+    """The fixture folder of a recorded synthetic library, and the results and calls of every entry point"""
+    folder = tmp_path_factory.mktemp("fixtures")
+    synthetic = SyntheticClient(playlists=5, tracks_per_playlist=150, unique_tracks=400)
+    results = run_entry_points(RecordingClient(synthetic, str(folder)), synthetic, str(folder / "recorded.sqlite"))
+    return folder, results
+
+
+def test_replay_matches_the_recording(recorded, tmp_path):
+    folder, recorded_results = recorded
+    replay = ReplayClient(str(folder))
+    replayed_results = run_entry_points(replay, replay, str(tmp_path / "replayed.sqlite"))
+
+    assert list(replayed_results) == list(recorded_results)
+    for name, (result, calls) in replayed_results.items():
+        recorded_result, recorded_calls = recorded_results[name]
+        pd.testing.assert_frame_equal(result, recorded_result, obj=name)
+        assert calls == recorded_calls, name
+
+
+def test_recording_matches_the_synthetic_library(recorded, tmp_path):
+    _, recorded_results = recorded
+    synthetic = SyntheticClient(playlists=5, tracks_per_playlist=150, unique_tracks=400)
+    for name, (result, calls) in run_entry_points(synthetic, synthetic, str(tmp_path / "cache.sqlite")).items():
+        pd.testing.assert_frame_equal(result, recorded_results[name][0], obj=name)
+        assert calls == recorded_results[name][1], name
+
+
+def test_synthetic_libraries_depend_on_the_seed():
+    def library(seed):
+        client = SyntheticClient(playlists=2, tracks_per_playlist=50, seed=seed)
+        return run_entry_points(client, client, ":memory:")["get_all_user_tracks"][0]
+
+    pd.testing.assert_frame_equal(library(1), library(1))
+    assert not library(1).equals(library(2))
+
+
+def test_calls_that_were_not_recorded_raise_key_error(recorded):
+    folder, _ = recorded
+    replay = ReplayClient(str(folder))
+    with pytest.raises(KeyError):
+        replay.audio_features(["track_never_recorded"])
+    assert replay.total_calls() == 1
@@ -0,0 +1,142 @@
+"""Tests of SpotifyCache and of how spotify_tools keys and refreshes the entries it caches"""
+
+import pandas as pd
+import pytest
+
+import spotify_cache
+from replay_client import SyntheticClient
+from spotify_cache import SpotifyCache
+from spotify_tools import analyze_playlist, get_all_user_tracks, get_playlist_items_df
+
+
+class EditedClient(SyntheticClient):
+    """A SyntheticClient whose playlists get a new snapshot ID every time edit() changes their tracks"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.versions = [0] * len(self.playlist_ids)
+
+    def edit(self, playlist_number, track_number):
+        # track_number must be one of the unique tracks of the library
+        self.playlist_tracks[playlist_number, 0] = track_number
+        self.versions[playlist_number] += 1
+
+    def _playlists_page(self, user, limit, offset):
+        page = super()._playlists_page(user, limit, offset)
+        for playlist in page["items"]:
+            playlist["snapshot_id"] += f"-{self.versions[self.playlist_ids[playlist['id']]]}"
+        return page
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SpotifyCache(str(tmp_path / "cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the clock of the cache with one that only moves when advanced"""
+    now = [1000.0]
+    monkeypatch.setattr(spotify_cache.time, "time", lambda: now[0])
+    return now
+
+
+def stored_bytes(cache):
+    return cache.stats()["bytes"]
+
+
+def test_playlists_with_the_same_snapshot_id_are_cached_apart(cache):
+    client = SyntheticClient(playlists=2, tracks_per_playlist=20, missing_features=0)
+    first = analyze_playlist("user", "playlist0", client, cache=cache, snapshot_id="snapshot")
+    second = analyze_playlist("user", "playlist1", client, cache=cache, snapshot_id="snapshot")
+    assert client.calls["user_playlist_tracks"] == 2
+    assert first["track_id"].tolist() != second["track_id"].tolist()
+
+
+def test_an_edited_playlist_is_fetched_again(cache):
+    client = EditedClient(playlists=3, tracks_per_playlist=20, unique_tracks=1000, missing_features=0)
+    get_all_user_tracks("user", client, cache=cache)
+
+    client.calls.clear()
+    client.edit(1, 999)
+    tracks = get_all_user_tracks("user", client, cache=cache, refresh=True)
+    # the playlists are listed again, so the new snapshot ID is seen at once and only that playlist is fetched again
+    assert client.calls["user_playlists"] == 1
+    assert client.calls["user_playlist_tracks"] == 1
+    assert "track999" in tracks["track_id"].tolist()
+
+
+def test_the_playlist_list_is_cached_for_an_hour(cache, clock):
+    client = EditedClient(playlists=3, tracks_per_playlist=20, unique_tracks=1000, missing_features=0)
+    get_all_user_tracks("user", client, cache=cache)
+
+    client.calls.clear()
+    client.edit(1, 999)
+    # within the hour, the edit isn't seen and nothing is fetched
+    assert "track999" not in get_all_user_tracks("user", client, cache=cache)["track_id"].tolist()
+    assert client.total_calls() == 0
+
+    clock[0] += 60 * 60 + 1
+    assert "track999" in get_all_user_tracks("user", client, cache=cache)["track_id"].tolist()
+    assert client.calls["user_playlists"] == 1
+    assert client.calls["user_playlist_tracks"] == 1
+
+
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+def test_a_warm_playlist_makes_no_requests(cache):
+    spotipy = pytest.importorskip("spotipy")
+    requests = pytest.importorskip("requests")
+    from mock_spotify_server import MockSpotifyServer
+
+    library = SyntheticClient(playlists=2, tracks_per_playlist=250, missing_features=0)
+    with MockSpotifyServer(library) as server:
+        client = spotipy.Spotify(auth="token", requests_session=requests.Session())
+        client.prefix = server.prefix
+        cold = [analyze_playlist("user", "playlist0", client, cache=cache),
+                get_playlist_items_df("playlist1", client, cache=cache)]
+        assert {endpoint for _, endpoint, _ in server.requests()} == {"playlist", "tracks", "audio-features"}
+
+        sent = len(server.requests())
+        warm = [analyze_playlist("user", "playlist0", client, cache=cache),
+                get_playlist_items_df("playlist1", client, cache=cache)]
+        assert len(server.requests()) == sent
+    for cold_df, warm_df in zip(cold, warm):
+        pd.testing.assert_frame_equal(cold_df, warm_df)
+
+
+def test_the_running_size_matches_the_table(cache, clock):
+    cache.put_many("features", {f"track{number}": {"energy": number} for number in range(10)})
+    assert cache.bytes == stored_bytes(cache) > 0
+
+    # replacing entries with longer values
+    cache.put_many("features", {f"track{number}": {"energy": number, "key": 1} for number in range(5)})
+    assert cache.bytes == stored_bytes(cache)
+
+    # expiry
+    cache.ttls["playlist_tracks"] = 10
+    cache.put("playlist_tracks", "playlist:snapshot", ["track"] * 10)
+    clock[0] += 11
+    cache.put("features", "track10", None)
+    assert cache.get("playlist_tracks", "playlist:snapshot") is None
+    assert cache.bytes == stored_bytes(cache)
+
+    cache.clear()
+    assert cache.bytes == stored_bytes(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = SpotifyCache(str(tmp_path / "cache.sqlite"), max_bytes=100)
+    for number in range(10):
+        clock[0] += 1
+        cache.put("features", f"track{number}", {"energy": number})
+    assert cache.bytes == stored_bytes(cache) <= 100
+    assert cache.get("features", "track0") is None
+    assert cache.get("features", "track9") == {"energy": 9}
+    cache.close()
+
+    # a reopened cache starts from the size already stored
+    reopened = SpotifyCache(str(tmp_path / "cache.sqlite"), max_bytes=100)
+    assert reopened.bytes == stored_bytes(reopened) > 0
+    reopened.close()
@@ -0,0 +1,129 @@
+"""Tests of SpotifyFetcher against a spotipy client talking to a local server that rate limits and fails requests"""
+
+import pytest
+
+spotipy = pytest.importorskip("spotipy")
+requests = pytest.importorskip("requests")
+
+from mock_spotify_server import MockSpotifyServer  # noqa: E402
+from replay_client import SyntheticClient  # noqa: E402
+from spotify_fetcher import SpotifyFetcher  # noqa: E402
+
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+
+
+@pytest.fixture
+def library():
+    return SyntheticClient(playlists=6, tracks_per_playlist=250, missing_features=0)
+
+
+def make_fetcher(server, **kwargs):
+    # a plain requests session, so that spotipy raises failed requests instead of retrying them itself
+    client = spotipy.Spotify(auth="token", requests_session=requests.Session())
+    client.prefix = server.prefix
+    return SpotifyFetcher(client, **{"base_delay": 0.01, "max_delay": 0.05, **kwargs})
+
+
+def test_retry_after_is_honored(library):
+    with MockSpotifyServer(library) as server:
+        server.fail("audio-features", 429, retry_after=1)
+        fetcher = make_fetcher(server)
+        features = fetcher.call("audio_features", ["track1", "track2"])
+        fetcher.close()
+
+    assert [record["id"] for record in features] == ["track1", "track2"]
+    (limited_at, _, limited), (retried_at, _, status) = server.requests("audio-features")
+    assert (limited, status) == (429, 200)
+    assert retried_at - limited_at >= 0.95
+    assert fetcher.stats.summary()["rate_limited"] == 1
+
+
+def test_a_rate_limit_holds_back_every_thread(library):
+    with MockSpotifyServer(library) as server:
+        server.fail("audio-features", 429, retry_after=1)
+        fetcher = make_fetcher(server, max_workers=4)
+        fetcher.map("audio_features", [([f"track{number}"],) for number in range(12)])
+        fetcher.close()
+
+    limited_at = next(answered_at for answered_at, _, status in server.requests() if status == 429)
+    # only the requests the other 3 threads sent before they saw the rate limit may be answered before it is over
+    # (a few, against the 11 they would send without waiting)
+    early = [answered_at for answered_at, _, _ in server.requests() if limited_at < answered_at < limited_at + 0.95]
+    assert len(early) <= 6
+    assert len(server.requests()) == 13
+
+
+def test_server_errors_are_retried_with_backoff(library):
+    with MockSpotifyServer(library) as server:
+        server.fail("tracks", 503)
+        server.fail("tracks", 502)
+        fetcher = make_fetcher(server)
+        page = fetcher.call("user_playlist_tracks", "user", "playlist0", limit=100, offset=0)
+        fetcher.close()
+
+    assert len(page["items"]) == 100
+    assert [status for _, _, status in server.requests("tracks")] == [503, 502, 200]
+    summary = fetcher.stats.summary()
+    assert (summary["retries"], summary["rate_limited"], summary["failures"]) == (2, 0, 0)
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404])
+def test_client_errors_are_raised_at_once(library, status):
+    with MockSpotifyServer(library) as server:
+        server.fail("audio-features", status)
+        fetcher = make_fetcher(server)
+        with pytest.raises(spotipy.SpotifyException) as raised:
+            fetcher.call("audio_features", ["track1"])
+        fetcher.close()
+
+    assert raised.value.http_status == status
+    assert len(server.requests()) == 1
+    summary = fetcher.stats.summary()
+    assert (summary["requests"], summary["retries"], summary["failures"]) == (1, 0, 1)
+
+
+def test_retries_give_up_after_max_retries(library):
+    with MockSpotifyServer(library) as server:
+        server.fail("audio-features", 500, times=3)
+        fetcher = make_fetcher(server, max_retries=2)
+        with pytest.raises(spotipy.SpotifyException):
+            fetcher.call("audio_features", ["track1"])
+        fetcher.close()
+
+    assert len(server.requests()) == 3
+    summary = fetcher.stats.summary()
+    assert (summary["requests"], summary["retries"], summary["failures"]) == (3, 2, 1)
+
+
+def test_stats_count_every_request(library):
+    with MockSpotifyServer(library, max_delay=0.005) as server:
+        server.fail("tracks", 503, times=2)
+        server.fail("tracks", 429, retry_after=0)
+        fetcher = make_fetcher(server)
+        fetcher.all_items("user_playlist_tracks", [("user", playlist_id) for playlist_id in library.playlist_ids],
+                          100)
+        fetcher.close()
+
+    summary = fetcher.stats.summary()
+    # 6 playlists of 3 pages, and 3 failed attempts
+    assert summary["requests"] == len(server.requests()) == 6 * 3 + 3
+    assert (summary["retries"], summary["rate_limited"], summary["failures"]) == (3, 1, 0)
+    assert summary["latency_p50"] <= summary["latency_p95"] <= summary["latency_max"]
+
+
+def test_results_keep_their_order_under_concurrency(library):
+    with MockSpotifyServer(library, max_delay=0.02) as server:
+        server.fail("tracks", 503, times=3)
+        server.fail("audio-features", 502, times=3)
+        fetcher = make_fetcher(server, max_workers=8)
+        playlists = fetcher.all_items("user_playlists", [("user",)], 2)[0]
+        tracks = fetcher.all_items("user_playlist_tracks", [("user", playlist["id"]) for playlist in playlists], 50)
+        batches = [[f"track{number}" for number in range(start, start + 10)] for start in range(0, 200, 10)]
+        features = fetcher.map("audio_features", [(batch,) for batch in batches])
+        fetcher.close()
+
+    assert [playlist["id"] for playlist in playlists] == list(library.playlist_ids)
+    for playlist_id, items in zip(library.playlist_ids, tracks):
+        expected = [f"track{number}" for number in library.playlist_tracks[library.playlist_ids[playlist_id]]]
+        assert [item["track"]["id"] for item in items] == expected
+    assert [[record["id"] for record in batch] for batch in features] == batches
@@ -0,0 +1,194 @@
+"""Tests of spotify_tools against a local fake Spotify client that counts its round trips, and of its radar charts"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+import pytest
+
+import spotify_tools
+from replay_client import SyntheticClient
+from spotify_fetcher import SpotifyFetcher
+from spotify_tools import (AUDIO_FEATURES_BATCH_SIZE, analyze_playlist, get_audio_features, get_radar_plot,
+                           radar_figure, render_radar_plots, tracks_to_df)
+
+RADAR_FEATURES = ["danceability", "energy", "valence", "speechiness"]
+
+
+class FakeSpotify:
+    """Answers audio_features calls like the API, counting them, with None for the tracks in without_features"""
+
+    def __init__(self, without_features=()):
+        self.without_features = set(without_features)
+        self.batches = []
+
+    def audio_features(self, tracks=()):
+        self.batches.append(list(tracks))
+        return [None if track_id in self.without_features else {"id": track_id, "energy": 0.5, "key": 1}
+                for track_id in tracks]
+
+
+def track(track_id):
+    """A playlist track as the API returns it, with only the fields tracks_to_df reads"""
+    return {"track": {"id": track_id, "name": f"name {track_id}",
+                      "album": {"name": "album", "artists": [{"name": "artist"}]}}}
+
+
+@pytest.mark.parametrize("tracks, calls", [(1, 1), (100, 1), (101, 2), (250, 3)])
+def test_features_are_fetched_in_batches(tracks, calls):
+    client = FakeSpotify()
+    track_ids = [f"track{number}" for number in range(tracks)]
+    audio_features = get_audio_features(track_ids, client)
+    assert len(client.batches) == calls
+    assert all(len(batch) <= AUDIO_FEATURES_BATCH_SIZE for batch in client.batches)
+    assert sum(client.batches, []) == track_ids
+    assert set(audio_features) == set(track_ids)
+
+
+def test_duplicate_and_missing_ids_are_not_fetched():
+    client = FakeSpotify()
+    get_audio_features(["a", "b", "a", None, "", "b"], client)
+    assert client.batches == [["a", "b"]]
+
+
+def test_tracks_without_features_map_to_none():
+    client = FakeSpotify(without_features={"b"})
+    audio_features = get_audio_features(["a", "b", "c"], client)
+    assert audio_features["b"] is None
+    assert audio_features["a"]["energy"] == 0.5
+
+    df = tracks_to_df([track("a"), track("b"), track("c")], audio_features)
+    assert df["energy"].isna().tolist() == [False, True, False]
+    assert df["key"].dtype == "Int64"
+    assert df["key"].isna().tolist() == [False, True, False]
+
+
+def test_a_null_batch_response_leaves_the_tracks_out():
+    class NullClient(FakeSpotify):
+        def audio_features(self, tracks=()):
+            super().audio_features(tracks)
+            return None
+
+    audio_features = get_audio_features(["a", "b"], NullClient())
+    assert audio_features == {}
+    assert tracks_to_df([track("a")], audio_features)["energy"].isna().all()
+    assert isinstance(tracks_to_df([], audio_features), pd.DataFrame)
+
+
+def test_playlist_features_are_batched_across_pages():
+    # 3 pages of 100 tracks, with every other track's features already fetched for another playlist
+    client = SyntheticClient(playlists=1, tracks_per_playlist=300, unique_tracks=10 ** 6, missing_features=0)
+    track_ids = [f"track{number}" for number in client.playlist_tracks[0].tolist()]
+    assert len(set(track_ids)) == 300
+    known = {track_id: {"id": track_id} for track_id in track_ids[::2]}
+    new_ids = set(track_ids) - set(known)
+
+    df = analyze_playlist("user", "playlist0", client, audio_features=known)
+    assert len(df) == 300
+    # the new tracks of the 3 pages fill 2 batches, instead of 1 short batch per page
+    assert len(new_ids) == 150
+    assert client.calls["audio_features"] == 2
+
+
+def test_features_are_fetched_while_paging_with_a_fetcher():
+    events = []
+
+    class LoggedClient(SyntheticClient):
+        def next(self, result):
+            events.append("page")
+            return super().next(result)
+
+    class LoggedFetcher(SpotifyFetcher):
+        def submit(self, method, *args, **kwargs):
+            events.append(f"{method} {len(args[0])}")
+            return super().submit(method, *args, **kwargs)
+
+    client = LoggedClient(playlists=1, tracks_per_playlist=350, unique_tracks=10 ** 6, missing_features=0)
+    expected = analyze_playlist("user", "playlist0", client)
+    events.clear()
+    fetcher = LoggedFetcher(client)
+    try:
+        pd.testing.assert_frame_equal(analyze_playlist("user", "playlist0", client, fetcher=fetcher), expected)
+    finally:
+        fetcher.close()
+    # each full batch is sent as soon as its page is read, and only the last batch is short
+    assert events == ["audio_features 100", "page", "audio_features 100", "page", "audio_features 100", "page",
+                      "audio_features 50"]
+
+
+def radar_df(tracks, seed=0):
+    """A playlist df with random values of RADAR_FEATURES"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.random((tracks, len(RADAR_FEATURES))), columns=RADAR_FEATURES)
+    df["track_name"] = [f"Track {number}" for number in range(tracks)]
+    return df
+
+
+def test_radar_figure_matches_one_scatterpolar_per_track():
+    df = radar_df(20)
+    # how the chart was built before radar_figure: one validated go.Scatterpolar per row of the df
+    expected = go.Figure([go.Scatterpolar(r=row[RADAR_FEATURES].values.tolist(), theta=RADAR_FEATURES, mode="lines",
+                                          name=row["track_name"]) for _, row in df.iterrows()])
+    figure = radar_figure(df[RADAR_FEATURES].to_numpy(), df["track_name"].tolist(), RADAR_FEATURES)
+    assert go.Figure(figure).to_dict() == expected.to_dict()
+
+
+def test_aggregate_radar_figure():
+    df = radar_df(50)
+    df.loc[:9, "energy"] = np.nan
+    df["valence"] = np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        band, mean = radar_figure(df[RADAR_FEATURES].to_numpy(), [], RADAR_FEATURES, aggregate=True)["data"]
+    known = df[["danceability", "energy", "speechiness"]]
+    assert np.allclose(np.array(mean["r"])[[0, 1, 3]], known.mean())
+    assert np.isnan(mean["r"][2]) and np.isnan(band["r"][2])
+    assert np.allclose(band["r"][:2], known.quantile(0.9).iloc[:2])
+    assert len(band["r"]) == len(band["theta"]) == 2 * len(RADAR_FEATURES)
+
+
+def test_aggregate_radar_figure_of_an_empty_playlist():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        figure = radar_figure(np.empty((0, len(RADAR_FEATURES))), [], RADAR_FEATURES, aggregate=True)
+    assert all(np.isnan(trace["r"]).all() for trace in figure["data"])
+
+
+def test_get_radar_plot_shows_and_writes_the_figure_dict(monkeypatch):
+    shown, written = [], []
+    monkeypatch.setattr(pio, "show", lambda figure, **kwargs: shown.append(figure))
+    monkeypatch.setattr(spotify_tools, "write_radar_images", lambda figures, paths: written.extend(zip(figures, paths)))
+    client = SyntheticClient(playlists=1, tracks_per_playlist=30, missing_features=0)
+
+    figure = get_radar_plot("playlist0", RADAR_FEATURES, client)
+    assert isinstance(figure, dict) and len(figure["data"]) == 30
+    assert shown == [figure]
+    assert written == [(figure, "playlist0.png")]
+
+
+def test_radar_images_are_written_in_one_call(monkeypatch):
+    calls = []
+    monkeypatch.setattr(spotify_tools, "write_radar_images", lambda figures, paths, width, height:
+                        calls.append((figures, paths)))
+    playlist_dfs = {f"playlist{number}.png": radar_df(10 * number, seed=number) for number in range(3)}
+
+    assert render_radar_plots(playlist_dfs, RADAR_FEATURES, workers=1) == list(playlist_dfs)
+    (figures, paths), = calls
+    assert paths == list(playlist_dfs)
+    assert figures == [radar_figure(df[RADAR_FEATURES].to_numpy(), df["track_name"].tolist(), RADAR_FEATURES)
+                       for df in playlist_dfs.values()]
+
+
+@pytest.mark.parametrize("aggregate", [False, True])
+def test_radar_images_are_written_by_a_pool_of_processes(tmp_path, aggregate):
+    pytest.importorskip("kaleido")
+    playlist_dfs = {str(tmp_path / f"playlist{number}.png"): radar_df(10 * number, seed=number)
+                    for number in range(4)}
+    written = render_radar_plots(playlist_dfs, RADAR_FEATURES, aggregate=aggregate, workers=2, width=300,
+                                 height=200)
+    assert sorted(written) == sorted(playlist_dfs)
+    for path in playlist_dfs:
+        with open(path, "rb") as image:
+            assert image.read(8) == b"\x89PNG\r\n\x1a\n"
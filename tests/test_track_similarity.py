@@ -0,0 +1,123 @@
+"""Tests of the nearest track searches and playlist comparisons of track_similarity"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import track_similarity
+from track_similarity import SIMILARITY_FEATURES, FeatureScaler, TrackIndex, nearest
+
+
+def playlist_df(playlist_names, seed=0):
+    """A playlist df with 10 tracks in each playlist, in the playlist_name column like get_all_user_tracks"""
+    rng = np.random.default_rng(seed)
+    rows = len(playlist_names) * 10
+    df = pd.DataFrame(rng.random((rows, len(SIMILARITY_FEATURES))), columns=SIMILARITY_FEATURES)
+    df["track_id"] = [f"track{number}" for number in range(rows)]
+    df["playlist_name"] = [name for name in playlist_names for _ in range(10)]
+    return df
+
+
+def test_playlist_distances():
+    df = playlist_df(["a", "b", "c"])
+    distances = TrackIndex(df).playlist_distances(df)
+    assert distances.index.tolist() == distances.columns.tolist() == ["a", "b", "c"]
+    assert np.allclose(np.diag(distances), 0, atol=1e-3)
+    assert np.allclose(distances, distances.T)
+
+
+def test_unnamed_playlists_are_left_out():
+    df = playlist_df(["a", None, "b", None])
+    index = TrackIndex(df)
+    distances = index.playlist_distances(df)
+    assert distances.index.tolist() == ["a", "b"]
+    assert np.allclose(distances, index.playlist_distances(df[df["playlist_name"].notna()]))
+    assert index.nearest_playlists(df, "a").index.tolist() == ["b"]
+
+
+def features_df(rows, track_ids=None):
+    """A playlist df with the given rows of SIMILARITY_FEATURES"""
+    df = pd.DataFrame(np.asarray(rows, dtype=float), columns=SIMILARITY_FEATURES)
+    df["track_id"] = track_ids or [f"track{number}" for number in range(len(df))]
+    return df
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 4096])
+def test_nearest_is_exact(monkeypatch, chunk_size):
+    monkeypatch.setattr(track_similarity, "CHUNK_SIZE", chunk_size)
+    matrix = np.array([[0, 0], [1, 0], [3, 0], [7, 0], [0, 2]], dtype=np.float32)
+    queries = np.array([[0, 0], [2.5, 0], [7, 1]], dtype=np.float32)
+
+    positions, distances = nearest(queries, matrix, 3)
+    assert positions.tolist() == [[0, 1, 4], [2, 1, 0], [3, 2, 1]]
+    assert np.allclose(distances, [[0, 1, 2], [0.5, 1.5, 2.5], [1, np.sqrt(17), np.sqrt(37)]])
+    assert nearest(queries, matrix, 1)[0].tolist() == [[0], [2], [3]]
+    # k is capped at the number of rows
+    assert nearest(queries, matrix, 10)[0].tolist() == np.argsort(
+        track_similarity.squared_distances(queries, matrix), axis=1).tolist()
+
+
+def test_features_are_standardized_to_float32():
+    rng = np.random.default_rng(0)
+    rows = rng.random((100, len(SIMILARITY_FEATURES))) * 10
+    rows[:, SIMILARITY_FEATURES.index("tempo")] = 120
+    df = features_df(rows)
+    df.loc[0, "energy"] = np.nan
+
+    matrix = FeatureScaler.fit(df).transform(df)
+    assert matrix.dtype == np.float32
+    varying = [feature != "tempo" for feature in SIMILARITY_FEATURES]
+    assert np.allclose(matrix.mean(axis=0), 0, atol=0.01)
+    assert np.allclose(np.delete(matrix, 0, axis=0)[:, varying].std(axis=0), 1, atol=0.02)
+    # a feature that never changes stays at 0, and a missing feature is at the mean
+    assert (matrix[:, SIMILARITY_FEATURES.index("tempo")] == 0).all()
+    assert matrix[0, SIMILARITY_FEATURES.index("energy")] == 0
+
+
+def test_similar_tracks_are_the_nearest_others():
+    # the tracks are spread along the danceability axis, at 0, 1, 2, 5 and 8
+    rows = np.zeros((5, len(SIMILARITY_FEATURES)))
+    rows[:, 0] = [0, 1, 2, 5, 8]
+    # a track in a second playlist is indexed once
+    df = features_df(np.vstack([rows, rows[:1]]), [f"track{number}" for number in range(5)] + ["track0"])
+    index = TrackIndex(df)
+    assert len(index.tracks) == 5 and not index.approximate
+
+    similar = index.similar_tracks("track2", k=3)
+    assert similar["track_id"].tolist() == ["track1", "track0", "track3"]
+    assert np.allclose(similar["distance"] / similar["distance"][0], [1, 2, 3])
+    assert index.similar_tracks("track4", k=10)["track_id"].tolist() == ["track3", "track2", "track1", "track0"]
+
+
+def test_large_indexes_are_approximate(monkeypatch):
+    monkeypatch.setattr(track_similarity, "APPROXIMATE_THRESHOLD", 100)
+    df = features_df(np.random.default_rng(0).random((101, len(SIMILARITY_FEATURES))))
+    assert TrackIndex(df).approximate
+    assert not TrackIndex(df.iloc[:100]).approximate
+
+
+def test_approximate_queries_agree_with_brute_force():
+    # 20 groups of similar tracks, like the artists and genres of a real library
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, len(SIMILARITY_FEATURES))) * 3
+    rows = centers[rng.integers(20, size=5000)] + rng.normal(size=(5000, len(SIMILARITY_FEATURES)))
+    df = features_df(rows)
+    exact = TrackIndex(df, approximate=False)
+    approximate = TrackIndex(df, approximate=True, clusters=40, probes=8)
+
+    queries = exact.matrix[rng.choice(len(df), 100, replace=False)]
+    exact_positions, exact_distances = exact.query(queries, 10)
+    positions, distances = approximate.query(queries, 10)
+    recall = np.mean([len(set(found) & set(expected)) / 10 for found, expected in zip(positions, exact_positions)])
+    assert recall >= 0.9
+    # the distances of the tracks found are their exact distances (compared squared, as sqrt magnifies the float32
+    # rounding of distances near 0)
+    assert (positions >= 0).all()
+    true_distances = np.linalg.norm(exact.matrix[positions] - queries[:, np.newaxis], axis=2)
+    assert np.allclose(distances ** 2, true_distances ** 2, atol=1e-4)
+    # and the i-th track found is never nearer than the i-th nearest track
+    assert (distances ** 2 >= exact_distances ** 2 - 1e-4).all()
+
+    similar = approximate.similar_tracks("track0", k=10)
+    assert "track0" not in similar["track_id"].tolist()
+    assert len(set(similar["track_id"]) & set(exact.similar_tracks("track0", k=10)["track_id"])) >= 8
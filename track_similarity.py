@@ -0,0 +1,182 @@
+# Track similarity search over the audio features collected by spotify_tools
+
+# The audio features of a playlist df are turned into a standardized float32 matrix: each feature is shifted and scaled
+# to a mean of 0 and a standard deviation of 1, so that tempo (around 120) and loudness (around -8 dB) don't outweigh
+# features between 0 and 1. Tracks are then compared by the Euclidean distance between their rows.
+
+# TrackIndex answers "tracks similar to X" by comparing X with every track at once (brute force). Above
+# APPROXIMATE_THRESHOLD tracks it switches to an approximate inverted file index: the tracks are grouped into clusters
+# by k-means, and a query only compares X with the tracks of the few clusters whose centers are closest to it.
+# Playlists are compared by the distance between the means of their tracks.
+
+# To benchmark query latency, run:
+# python benchmark_similarity.py
+
+import numpy as np
+import pandas as pd
+
+# the audio features compared by default (key, mode and time signature are categories rather than amounts, and
+# duration says little about how a track sounds)
+SIMILARITY_FEATURES = ["danceability", "energy", "loudness", "speechiness", "instrumentalness", "liveness", "valence",
+                       "tempo"]
+
+# number of tracks above which TrackIndex uses the approximate index
+APPROXIMATE_THRESHOLD = 100_000
+
+# default number of clusters searched by each approximate query
+DEFAULT_PROBES = 8
+
+# number of k-means iterations, and the number of tracks the cluster centers are trained on
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 50_000
+
+# number of rows compared at a time, to bound the memory used by the distance matrix
+CHUNK_SIZE = 4096
+
+
+class FeatureScaler:
+    """Standardizes audio features to a mean of 0 and a standard deviation of 1"""
+
+    def __init__(self, features, means, scales):
+        self.features = list(features)
+        self.means = np.asarray(means, dtype=np.float32)
+        self.scales = np.asarray(scales, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, playlist_df, features=SIMILARITY_FEATURES):
+        """Learns the mean and standard deviation of each feature from a playlist df"""
+        values = playlist_df[features].to_numpy(dtype=np.float64, na_value=np.nan)
+        means = np.nan_to_num(np.nanmean(values, axis=0)) if len(values) else np.zeros(len(features))
+        scales = np.nan_to_num(np.nanstd(values, axis=0)) if len(values) else np.ones(len(features))
+        # features that never change are left unscaled
+        scales[scales == 0] = 1
+        return cls(features, means, scales)
+
+    def transform(self, playlist_df):
+        """Returns the standardized float32 feature matrix of a playlist df, with missing features at the mean (0)"""
+        values = playlist_df[self.features].to_numpy(dtype=np.float32, na_value=np.nan)
+        return np.nan_to_num((values - self.means) / self.scales)
+
+
+def squared_distances(queries, matrix):
+    """Returns the squared Euclidean distance between every row of queries and every row of matrix"""
+    distances = (np.einsum('ij,ij->i', queries, queries)[:, np.newaxis] - 2 * queries @ matrix.T
+                 + np.einsum('ij,ij->i', matrix, matrix)[np.newaxis, :])
+    # rounding can make distances of 0 slightly negative
+    return np.maximum(distances, 0)
+
+
+def nearest(queries, matrix, k):
+    """Returns the positions of the k nearest rows of matrix to each query, and their distances, nearest first"""
+    k = min(k, len(matrix))
+    positions = np.empty((len(queries), k), dtype=np.int64)
+    distances = np.empty((len(queries), k), dtype=np.float32)
+    for start in range(0, len(queries), CHUNK_SIZE):
+        chunk = squared_distances(queries[start:start + CHUNK_SIZE], matrix)
+        # the k smallest in any order, then sorted
+        if k == 1:
+            candidates = np.argmin(chunk, axis=1)[:, np.newaxis]
+        elif k < len(matrix):
+            candidates = np.argpartition(chunk, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(len(matrix)), chunk.shape)
+        candidate_distances = np.take_along_axis(chunk, candidates, axis=1)
+        order = np.argsort(candidate_distances, axis=1)
+        positions[start:start + CHUNK_SIZE] = np.take_along_axis(candidates, order, axis=1)
+        distances[start:start + CHUNK_SIZE] = np.sqrt(np.take_along_axis(candidate_distances, order, axis=1))
+    return positions, distances
+
+
+def kmeans(matrix, clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """Returns the centers of clusters clusters of the rows of matrix, found by k-means"""
+    rng = np.random.default_rng(seed)
+    centers = matrix[rng.choice(len(matrix), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest(matrix, centers, 1)[0][:, 0]
+        counts = np.bincount(assignments, minlength=clusters)
+        sums = np.stack([np.bincount(assignments, weights=matrix[:, column], minlength=clusters)
+                         for column in range(matrix.shape[1])], axis=1)
+        # clusters that lost all their tracks keep their previous center
+        filled = counts > 0
+        centers[filled] = (sums[filled] / counts[filled, np.newaxis]).astype(np.float32)
+    return centers
+
+
+class TrackIndex:
+    """Finds the tracks of a playlist df most similar to a track, by the distance between standardized features"""
+
+    def __init__(self, playlist_df, features=SIMILARITY_FEATURES, approximate=None, clusters=None,
+                 probes=DEFAULT_PROBES):
+        # tracks that are in several playlists are indexed once
+        self.tracks = playlist_df.drop_duplicates("track_id").reset_index(drop=True)
+        self.scaler = FeatureScaler.fit(self.tracks, features)
+        self.matrix = self.scaler.transform(self.tracks)
+        self.positions = pd.Index(self.tracks["track_id"])
+        self.probes = probes
+
+        self.approximate = len(self.tracks) > APPROXIMATE_THRESHOLD if approximate is None else approximate
+        if self.approximate:
+            self._build_clusters(clusters or int(np.sqrt(len(self.tracks))))
+
+    def _build_clusters(self, clusters):
+        """Groups the tracks into clusters, storing the matrix sorted by cluster with an offsets array (CSR layout)"""
+        clusters = min(clusters, len(self.matrix))
+        sample_size = min(KMEANS_SAMPLE_SIZE, len(self.matrix))
+        sample = self.matrix[np.random.default_rng(0).choice(len(self.matrix), sample_size, replace=False)]
+        self.centers = kmeans(sample, clusters)
+        assignments = nearest(self.matrix, self.centers, 1)[0][:, 0]
+        self.cluster_order = np.argsort(assignments, kind='stable')
+        self.cluster_matrix = self.matrix[self.cluster_order]
+        self.cluster_offsets = np.zeros(clusters + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=clusters), out=self.cluster_offsets[1:])
+
+    def query(self, vectors, k=10):
+        """
+        Returns the positions (in self.tracks) of the k tracks nearest to each standardized vector, and their
+        distances, nearest first. Approximate queries may return fewer than k tracks, padded with -1 and inf.
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if not self.approximate:
+            return nearest(vectors, self.matrix, k)
+
+        positions = np.full((len(vectors), k), -1, dtype=np.int64)
+        distances = np.full((len(vectors), k), np.inf, dtype=np.float32)
+        probed_clusters = nearest(vectors, self.centers, self.probes)[0]
+        for row, (vector, clusters) in enumerate(zip(vectors, probed_clusters)):
+            # the tracks of the probed clusters, compared by brute force
+            candidates = np.concatenate([np.arange(self.cluster_offsets[cluster], self.cluster_offsets[cluster + 1])
+                                         for cluster in clusters])
+            found, found_distances = nearest(vector[np.newaxis], self.cluster_matrix[candidates], k)
+            positions[row, :found.shape[1]] = self.cluster_order[candidates[found[0]]]
+            distances[row, :found.shape[1]] = found_distances[0]
+        return positions, distances
+
+    def similar_tracks(self, track_id, k=10):
+        """Returns the k tracks most similar to the track with track_id (not counting itself), with their distances"""
+        position = self.positions.get_loc(track_id)
+        found, distances = self.query(self.matrix[position], k + 1)
+        keep = (found[0] != position) & (found[0] != -1)
+        similar = self.tracks.iloc[found[0][keep][:k]].copy()
+        similar["distance"] = distances[0][keep][:k]
+        return similar.reset_index(drop=True)
+
+    def playlist_distances(self, playlist_df, playlist_column="playlist_name"):
+        """
+        Returns a playlist x playlist DataFrame of the distances between the mean standardized features of the tracks
+        of each playlist in playlist_df (such as the result of get_all_user_tracks, or of analyze_playlist_dict with
+        playlist_column="playlist"). Playlists without a name are left out.
+        """
+        # unnamed playlists can't be told apart, and factorize would give their tracks the code -1
+        playlist_df = playlist_df[playlist_df[playlist_column].notna()]
+        codes, playlists = pd.factorize(playlist_df[playlist_column], sort=True)
+        matrix = self.scaler.transform(playlist_df)
+        # the mean row of each playlist, from one sum per feature
+        sums = np.stack([np.bincount(codes, weights=matrix[:, column], minlength=len(playlists))
+                         for column in range(matrix.shape[1])], axis=1)
+        means = (sums / np.bincount(codes, minlength=len(playlists))[:, np.newaxis]).astype(np.float32)
+        return pd.DataFrame(np.sqrt(squared_distances(means, means)), index=playlists, columns=playlists)
+
+    def nearest_playlists(self, playlist_df, playlist, k=5, playlist_column="playlist_name"):
+        """Returns the distances from playlist to the k playlists in playlist_df most similar to it"""
+        distances = self.playlist_distances(playlist_df, playlist_column)[playlist].drop(playlist)
+        return distances.nsmallest(k)